@@ -31,7 +31,9 @@ from werkzeug.exceptions import HTTPException as WerkzeugHTTPException
 from werkzeug.local import LocalProxy
 
 from app.clients import NotificationProviderClients
+from app.clients.aws_clients import AwsClientFactory
 from app.clients.cbc_proxy import CBCProxyClient
+from app.status.metrics import MetricsBuffer
 
 db = SQLAlchemy()
 migrate = Migrate()
@@ -40,6 +42,8 @@ dramatiq = EasSqsFlaskDramatiq()
 encryption = Encryption()
 zendesk_client = ZendeskClient()
 slack_client = SlackClient()
+aws_clients = AwsClientFactory()
+metrics = MetricsBuffer()
 cbc_proxy_client = CBCProxyClient()
 
 notification_provider_clients = NotificationProviderClients()
@@ -76,12 +80,19 @@ def create_app(application):
     zendesk_client.init_app(application)
     logging.init_app(application)
     encryption.init_app(application)
+    aws_clients.init_app(application)
+    metrics.init_app(application)
     cbc_proxy_client.init_app(application)
     dramatiq.init_app(application, application.config["QUEUE_PREFIX"])
 
     register_blueprint(application)
     register_v2_blueprints(application)
 
+    # compile the XML schemas now rather than on the first request that needs them
+    from app.xml_schemas import schema_registry
+
+    schema_registry.init_app(application)
+
     # avoid circular imports by importing this file later
     from app.commands import setup_commands
 
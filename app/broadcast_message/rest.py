@@ -1,11 +1,11 @@
 import re
 from collections import Counter, defaultdict
 
-import boto3
 import iso8601
 from emergency_alerts_utils.template import BroadcastMessageTemplate
 from flask import Blueprint, current_app, jsonify, request
 
+from app import aws_clients
 from app.broadcast_message import utils as broadcast_utils
 from app.broadcast_message.broadcast_message_schema import (
     create_broadcast_message_schema,
@@ -433,7 +433,7 @@ def purge_broadcast_messages(service_id, older_than):
 
     try:
         bucket = current_app.config["GOVUK_ALERTS_S3_BUCKET_NAME"]
-        s3 = boto3.client("s3")
+        s3 = aws_clients.client("s3")
         counter = Counter()
         messages = _generate_s3_keys(dao_get_public_messages_older_than(older_than))
 
@@ -1,27 +1,39 @@
-from bs4 import BeautifulSoup
+import re
 
+import numpy as np
+from lxml import etree
 
-def cap_xml_to_dict(cap_xml):
-    # This function assumes that it's being passed validated CAP XML
-    # We explicitly tell BS4 that we're expecting utf-8 here, otherwise it uses encoding detection heuristics that
-    # can sometimes make the wrong call.
-    cap = BeautifulSoup(cap_xml, "xml", from_encoding="utf-8")
-    alert = cap.alert
+CAP_NAMESPACES = {"cap": "urn:oasis:names:tc:emergency:cap:1.2"}
+_CAP = "{urn:oasis:names:tc:emergency:cap:1.2}"
+CAP_POLYGON_TAG = f"{_CAP}polygon"
+
+# Compiled once rather than for every alert
+_find_info = etree.XPath("cap:info[1]", namespaces=CAP_NAMESPACES)
+_find_areas = etree.XPath("cap:area", namespaces=CAP_NAMESPACES)
+_find_polygons = etree.XPath("cap:polygon", namespaces=CAP_NAMESPACES)
+
+# Whitespace-separated "lat,lon" pairs, each side free of whitespace and commas. Whether they're numbers is left
+# to numpy
+_COORDINATE_PAIRS = re.compile(r"\s*(?:[^\s,]+,[^\s,]+(?:\s+[^\s,]+,[^\s,]+)*)?\s*")
+
+
+def cap_tree_to_dict(alert, parsed_polygons=None):
+    # This function assumes that it's being passed the root <alert> of a document that's been validated against
+    # the CAP schema (see app.xml_schemas.parse_xml_stream), so it doesn't parse the XML again.
     # <info> is optional in the CAP 1.2 schema (minOccurs=0). A Cancel only needs
     # <references>, so we guard every <info> access here rather than dereferencing
     # blindly — missing fields then surface as schema validation errors (400) rather
     # than an AttributeError (500).
-    info = alert.info
+    # Each polygon is an (n, 2) numpy array of lat,lon points (see cap_xml_polygon_to_array), or a list of lists
+    # if it couldn't be parsed as one. parsed_polygons can map <polygon> elements to arrays that have already been
+    # parsed from them, e.g. while the document was streamed, so that they aren't parsed twice.
+    info = next(iter(_find_info(alert)), None)
 
     broadcast = {
-        "msgType": alert.msgType.text,
-        "reference": alert.identifier.text,
-        "references": (
-            # references to previous events belonging to the same alert
-            alert.references.text
-            if alert.references
-            else None
-        ),
+        "msgType": alert.findtext(f"{_CAP}msgType"),
+        "reference": alert.findtext(f"{_CAP}identifier"),
+        # references to previous events belonging to the same alert
+        "references": alert.findtext(f"{_CAP}references"),
         "cap_event": None,
         "category": None,
         "expires": None,
@@ -30,20 +42,44 @@ def cap_xml_to_dict(cap_xml):
     }
 
     if info is not None:
-        broadcast["cap_event"] = info.event.text if info.event else None
-        broadcast["category"] = info.category.text if info.category else None
-        broadcast["expires"] = info.expires.text if info.expires else None
-        broadcast["content"] = info.description.text if info.description else None
+        broadcast["cap_event"] = info.findtext(f"{_CAP}event")
+        broadcast["category"] = info.findtext(f"{_CAP}category")
+        broadcast["expires"] = info.findtext(f"{_CAP}expires")
+        broadcast["content"] = info.findtext(f"{_CAP}description")
         broadcast["areas"] = [
             {
-                "name": area.areaDesc.text,
-                "polygons": [cap_xml_polygon_to_list(polygon.text) for polygon in area.find_all("polygon")],
+                "name": area.findtext(f"{_CAP}areaDesc"),
+                "polygons": [_cap_xml_polygon(polygon, parsed_polygons or {}) for polygon in _find_polygons(area)],
             }
-            for area in info.find_all("area")
+            for area in _find_areas(info)
         ]
 
     return broadcast
 
 
+def cap_xml_polygon_to_array(polygon_string):
+    """
+    Parses a CAP polygon ("lat,lon lat,lon ...") into an (n, 2) array of floats, one row per point, in a
+    handful of vectorised operations rather than a float() call per coordinate. Raises ValueError if it isn't
+    made up of pairs of numbers.
+    """
+    if not _COORDINATE_PAIRS.fullmatch(polygon_string):
+        raise ValueError(f"Polygon is not made up of coordinate pairs: {polygon_string}")
+    return np.array(polygon_string.replace(",", " ").split(), dtype=float).reshape(-1, 2)
+
+
+def _cap_xml_polygon(polygon, parsed_polygons):
+    if polygon in parsed_polygons:
+        return parsed_polygons[polygon]
+
+    polygon_string = polygon.text or ""
+    try:
+        return cap_xml_polygon_to_array(polygon_string)
+    except ValueError:
+        # Parse anything that isn't pairs of numbers the old way, so that post_broadcast_schema describes what's
+        # wrong with it as it always has
+        return cap_xml_polygon_to_list(polygon_string)
+
+
 def cap_xml_polygon_to_list(polygon_string):
     return [[float(coordinate) for coordinate in pair.split(",")] for pair in polygon_string.strip().split(" ")]
@@ -1,10 +1,11 @@
+import hashlib
 import inspect
 import json
 import os
+import time
 from datetime import datetime, timezone
 from io import BytesIO
 
-import boto3
 from emergency_alerts_utils.clients.zendesk.zendesk_client import (
     EASSupportTicket,
 )
@@ -18,7 +19,12 @@ from shapely import wkt
 from shapely.geometry import Polygon
 from shapely.ops import transform
 
-from app import zendesk_client
+from app import aws_clients, zendesk_client
+from app.clients.cbc_payload import (
+    StagedBroadcastPayload,
+    encode_areas,
+    quantise_polygons,
+)
 from app.clients.email_client import EmailClient
 from app.dao.dao_utils import dao_save_object
 from app.errors import InvalidRequest
@@ -27,7 +33,10 @@ from app.models import (
     BroadcastEventMessageType,
     BroadcastStatusType,
 )
-from app.tasks.broadcast_message_tasks import send_broadcast_event
+from app.tasks.broadcast_message_tasks import (
+    create_p1_zendesk_alert,
+    send_broadcast_event,
+)
 
 
 def update_broadcast_message_status(
@@ -61,11 +70,16 @@ def update_broadcast_message_status(
     broadcast_message.status = new_status
 
     dao_save_object(broadcast_message)
-    _create_p1_zendesk_alert(broadcast_message)
+
+    if new_status == BroadcastStatusType.PENDING_APPROVAL:
+        stage_broadcast_message(broadcast_message)
 
     if new_status in {BroadcastStatusType.BROADCASTING, BroadcastStatusType.CANCELLED}:
         _create_broadcast_event(broadcast_message)
 
+    # Side effects that the broadcast itself doesn't depend on are queued after it's been sent
+    _create_p1_zendesk_alert(broadcast_message)
+
 
 def _validate_broadcast_update(broadcast_message, new_status, updating_user):
     if new_status not in BroadcastStatusType.ALLOWED_STATUS_TRANSITIONS[broadcast_message.status]:
@@ -88,6 +102,46 @@ def _validate_broadcast_update(broadcast_message, new_status, updating_user):
             )
 
 
+def stage_broadcast_message(broadcast_message):
+    """
+    While a broadcast message waits for approval, do the work for sending it that doesn't depend on when it's
+    approved: sanitise the content and encode the areas for the CBC payload. _create_broadcast_event uses this
+    rather than doing the work after the approver has clicked.
+
+    Staging is only an optimisation, so it never stops a message being submitted. If it fails, or the message has
+    changed since it was staged, the broadcast event is built from scratch.
+    """
+    start = time.monotonic()
+    try:
+        broadcast_message.staged_event = {
+            "fingerprint": _staging_fingerprint(broadcast_message),
+            "content": str(BroadcastMessageTemplate.from_content(broadcast_message.content)),
+            "areas_json": encode_areas(broadcast_message.areas.get("simple_polygons", [])),
+        }
+        dao_save_object(broadcast_message)
+        current_app.logger.info(
+            f"Staged broadcast_message {broadcast_message.id}",
+            extra={"staging_duration_ms": round((time.monotonic() - start) * 1000, 3), "python_module": __name__},
+        )
+    except Exception:
+        current_app.logger.exception(
+            f"Failed to stage broadcast_message {broadcast_message.id}", extra={"python_module": __name__}
+        )
+
+
+def _get_staged_event(broadcast_message):
+    staged_event = broadcast_message.staged_event
+    if staged_event and staged_event["fingerprint"] == _staging_fingerprint(broadcast_message):
+        return staged_event
+    return None
+
+
+def _staging_fingerprint(broadcast_message):
+    # Anything staging depends on, so that a message that's been edited since it was staged isn't sent stale
+    staged_from = json.dumps([broadcast_message.content, broadcast_message.areas], sort_keys=True)
+    return hashlib.sha256(staged_from.encode("utf-8")).hexdigest()
+
+
 def _create_p1_zendesk_alert(broadcast_message):
     if not current_app.is_prod:
         return
@@ -98,6 +152,10 @@ def _create_p1_zendesk_alert(broadcast_message):
     if broadcast_message.stubbed:
         return
 
+    create_p1_zendesk_alert.send(broadcast_message_id=str(broadcast_message.id), queued_at=time.time())
+
+
+def send_p1_zendesk_alert(broadcast_message):
     message = inspect.cleandoc(f"""
         Broadcast Sent
 
@@ -126,10 +184,15 @@ def _create_broadcast_event(broadcast_message):
     If the service is live and the broadcast message is not stubbed, creates a broadcast event, stores it in the
     database, and triggers the task to send the CAP XML off.
     """
+    start = time.monotonic()
     service = broadcast_message.service
-    # `content` is stored in the DB as raw text, so it needs to be sanitised before being used in a BroadcastEvent
-    # Previously done during alert creation; that logic has now been moved here
-    content = str(BroadcastMessageTemplate.from_content(broadcast_message.content))
+    staged_event = _get_staged_event(broadcast_message)
+    if staged_event:
+        content = staged_event["content"]
+    else:
+        # `content` is stored in the DB as raw text, so it needs to be sanitised before being used in a BroadcastEvent
+        # Previously done during alert creation; that logic has now been moved here
+        content = str(BroadcastMessageTemplate.from_content(broadcast_message.content))
 
     if not broadcast_message.stubbed and not service.restricted:
         msg_types = {
@@ -139,17 +202,32 @@ def _create_broadcast_event(broadcast_message):
         event = BroadcastEvent(
             service=service,
             broadcast_message=broadcast_message,
+            # set here rather than left to the column default, so that the payload can be staged before saving
+            sent_at=datetime.utcnow(),
             message_type=msg_types[broadcast_message.status],
             transmitted_content={"body": content},
-            transmitted_areas=broadcast_message.areas,
+            transmitted_areas=_quantise_areas(broadcast_message.areas),
             transmitted_sender=SENDER,
             # TODO: Should this be set to now? Or the original starts_at?
             transmitted_starts_at=broadcast_message.starts_at,
             transmitted_finishes_at=broadcast_message.finishes_at,
         )
+        if staged_event and event.message_type == BroadcastEventMessageType.ALERT and event.transmitted_finishes_at:
+            event.staged_payload = StagedBroadcastPayload.for_broadcast_event(
+                event, areas_json=staged_event["areas_json"]
+            ).serialize()
         dao_save_object(event)
         broadcast_task = send_broadcast_event.send(broadcast_event_id=str(event.id))
-        current_app.logger.info("Enqueued broadcast task: %s", broadcast_task.asdict())
+        current_app.logger.info(
+            "Enqueued broadcast task: %s",
+            broadcast_task.asdict(),
+            extra={
+                # How long approval took to create the event and queue it, to compare staged and unstaged messages
+                "from_staged_event": staged_event is not None,
+                "create_event_duration_ms": round((time.monotonic() - start) * 1000, 3),
+                "python_module": __name__,
+            },
+        )
     elif broadcast_message.stubbed != service.restricted:
         # It's possible for a service to create a broadcast in trial mode, and then approve it after the
         # service is live (or vice versa). We don't think it's safe to send such broadcasts, as the service
@@ -160,6 +238,18 @@ def _create_broadcast_event(broadcast_message):
         )
 
 
+def _quantise_areas(areas):
+    # Store the polygons as they're sent to the CBCs, at the precision they honour
+    if "simple_polygons" not in areas:
+        return areas
+    return {
+        **areas,
+        "simple_polygons": quantise_polygons(
+            areas["simple_polygons"], current_app.config["CBC_COORDINATE_DECIMAL_PLACES"]
+        ),
+    }
+
+
 def send_alert_summary_email(broadcast_message, data):
     service = broadcast_message.service
     alert_notification_addresses = service.alert_notification_addresses
@@ -354,7 +444,7 @@ def _load_miniscale_from_s3():
         current_app.logger.error("MINISCALE_MAP_S3_BUCKET_NAME not set in config")
         return None
 
-    s3 = boto3.client("s3")
+    s3 = aws_clients.client("s3")
 
     try:
         current_app.logger.info(f"Downloading {S3_MAP_FILE} from S3 bucket {bucket} to {LOCAL_TIFF_FILE}...")
@@ -0,0 +1,93 @@
+import logging
+import threading
+from collections import Counter
+
+import boto3
+from botocore.config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class AwsClientFactory:
+    """
+    Hands out boto3 clients with tuned connection settings, creating each at most once per thread and reusing it
+    after that, so that callers don't pay for credential resolution and new TLS connections every time they talk to
+    AWS. boto3 sessions aren't thread safe, so each thread gets its own session and clients. The clients themselves
+    are thread safe, so one can be shared by threads that don't live long enough to be worth a client of their own,
+    as the CBC proxy does with its lambda client.
+
+    Every client gets the pool size, keep-alive, timeouts and retries from the AWS_CLIENT_* config. Lambda clients
+    are for the CBC proxies, and have their own read timeout and no retries of their own, as a proxy that doesn't
+    answer in time is failed over to the next route instead (see app/clients/cbc_proxy.py).
+
+    The number of clients created for each service is kept in clients_created, and posted to CloudWatch by the
+    health check.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._clients_created = Counter()
+        self._region = "eu-west-2"
+        self._config = Config()
+        self._service_configs = {}
+
+    def init_app(self, app):
+        self._region = app.config.get("AWS_REGION", self._region)
+        self._config = Config(
+            max_pool_connections=app.config["AWS_CLIENT_MAX_POOL_CONNECTIONS"],
+            connect_timeout=app.config["AWS_CLIENT_CONNECT_TIMEOUT_SECONDS"],
+            read_timeout=app.config["AWS_CLIENT_READ_TIMEOUT_SECONDS"],
+            tcp_keepalive=True,
+            retries={"mode": "standard", "total_max_attempts": app.config["AWS_CLIENT_MAX_ATTEMPTS"]},
+        )
+        self._service_configs = {
+            "lambda": Config(
+                read_timeout=app.config["CBC_PROXY_LAMBDA_READ_TIMEOUT_SECONDS"],
+                retries={"mode": "standard", "total_max_attempts": 1},
+            ),
+        }
+
+    def client(self, service_name, **kwargs):
+        """
+        Returns this thread's client for the service, creating it if needed. Keyword arguments (e.g. endpoint_url)
+        are passed on to boto3, and clients created with different arguments are cached separately.
+        """
+        clients = getattr(self._local, "clients", None)
+        if clients is None:
+            clients = self._local.clients = {}
+
+        key = (service_name, tuple(sorted(kwargs.items())))
+        if key not in clients:
+            clients[key] = self._create_client(service_name, **kwargs)
+        return clients[key]
+
+    @property
+    def clients_created(self):
+        with self._lock:
+            return dict(self._clients_created)
+
+    def _create_client(self, service_name, **kwargs):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = boto3.session.Session()
+
+        config = self._config
+        if service_name in self._service_configs:
+            config = config.merge(self._service_configs[service_name])
+
+        client = session.client(service_name, **{"region_name": self._region, "config": config, **kwargs})
+        with self._lock:
+            self._clients_created[service_name] += 1
+            created = self._clients_created[service_name]
+
+        logger.info(
+            f"Created boto3 {service_name} client",
+            extra={
+                "aws_service": service_name,
+                "aws_clients_created": created,
+                "thread_name": threading.current_thread().name,
+                "python_module": __name__,
+            },
+        )
+        return client
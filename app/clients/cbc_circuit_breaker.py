@@ -0,0 +1,115 @@
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+from flask import current_app
+
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half-open"
+
+
+@dataclass
+class RouteCircuit:
+    consecutive_failures: int = 0
+    opened_at: float | None = None
+
+
+class CBCCircuitBreaker:
+    """
+    A circuit breaker per (proxy lambda, CBC target) route, so that a route which keeps failing isn't tried first
+    on every send and retry.
+
+    A route's circuit opens after a number of consecutive failed invocations, and broadcast sends skip it while it
+    is open. Once the reset period has passed the circuit is half-open: sends try it after every route with a
+    closed circuit, and the next send or link test to reach it acts as the probe - success closes the circuit and
+    failure opens it again for another period. Sends have to be able to probe, as the workers that send broadcasts
+    don't run link tests, so nothing else would close a circuit in their process.
+
+    State is held per process. Changes of state are also written to the route_circuit_state table so that they can
+    be reported on the status endpoints.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._circuits = {}
+        self.failure_threshold = 3
+        self.reset_seconds = 60
+
+    def init_app(self, app):
+        self.failure_threshold = app.config.get("CBC_ROUTE_BREAKER_FAILURE_THRESHOLD", self.failure_threshold)
+        self.reset_seconds = app.config.get("CBC_ROUTE_BREAKER_RESET_SECONDS", self.reset_seconds)
+
+    def get_state(self, lambda_name, cbc_target):
+        with self._lock:
+            return self._get_state(self._circuits.get((lambda_name, cbc_target)), time.monotonic())
+
+    def routes_for_sending(self, routes):
+        """
+        Returns the (lambda_name, cbc_target) routes a send should try, in order: those with closed circuits, then
+        those with half-open circuits. Routes with open circuits are left out, unless every route's circuit is open
+        - better to try routes we believe are failing than to not try at all.
+        """
+        now = time.monotonic()
+        with self._lock:
+            states = [self._get_state(self._circuits.get(route), now) for route in routes]
+
+        closed_routes = [route for route, state in zip(routes, states) if state == CIRCUIT_CLOSED]
+        half_open_routes = [route for route, state in zip(routes, states) if state == CIRCUIT_HALF_OPEN]
+        return (closed_routes + half_open_routes) or list(routes)
+
+    def record(self, lambda_name, cbc_target, succeeded):
+        now = time.monotonic()
+        with self._lock:
+            circuit = self._circuits.setdefault((lambda_name, cbc_target), RouteCircuit())
+            previous_state = self._get_state(circuit, now)
+            if succeeded:
+                circuit.consecutive_failures = 0
+                circuit.opened_at = None
+            else:
+                circuit.consecutive_failures += 1
+                if previous_state != CIRCUIT_CLOSED or circuit.consecutive_failures >= self.failure_threshold:
+                    circuit.opened_at = now
+            new_state = self._get_state(circuit, now)
+            consecutive_failures = circuit.consecutive_failures
+
+        if new_state != previous_state:
+            self._record_state_change(lambda_name, cbc_target, previous_state, new_state, consecutive_failures)
+
+    def _get_state(self, circuit, now):
+        if circuit is None or circuit.opened_at is None:
+            return CIRCUIT_CLOSED
+        if now - circuit.opened_at < self.reset_seconds:
+            return CIRCUIT_OPEN
+        return CIRCUIT_HALF_OPEN
+
+    def _record_state_change(self, lambda_name, cbc_target, previous_state, new_state, consecutive_failures):
+        # Import here so that app/__init__.py has finished executing create_app,
+        # so app.db exists and has been imported by app.dao.__init__
+        from app.dao.route_advisor_dao import dao_set_route_circuit_state
+
+        current_app.logger.warning(
+            f"Circuit for lambda {lambda_name} moved from {previous_state} to {new_state}",
+            extra={
+                "proxy_lambda": lambda_name,
+                "cbc_target": cbc_target,
+                "consecutive_failures": consecutive_failures,
+                "python_module": __name__,
+            },
+        )
+        try:
+            dao_set_route_circuit_state(
+                lambda_name,
+                cbc_target,
+                new_state,
+                consecutive_failures,
+                datetime.now(timezone.utc) if new_state == CIRCUIT_OPEN else None,
+            )
+        except Exception:
+            # Reporting the state must never get in the way of sending. It's written on its own connection, so
+            # there's nothing in the sender's session to roll back
+            current_app.logger.exception(
+                f"Failed to record circuit state for lambda {lambda_name}",
+                extra={"cbc_target": cbc_target, "python_module": __name__},
+            )
@@ -0,0 +1,175 @@
+import json
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from io import BytesIO
+
+from botocore.exceptions import ClientError, ReadTimeoutError
+
+from app.clients.cbc_payload import decode_areas
+
+FUNCTION_NAME_PATTERN = re.compile(r"^(?P<mno>ee|three|o2|vodafone)-[12]-proxy$")
+MESSAGE_TYPES = {"alert", "update", "cancel", "test"}
+CBC_TARGETS = {"cbc_a", "cbc_b"}
+
+
+@dataclass
+class SimulatedRoute:
+    """
+    How a simulated (proxy lambda, CBC target) route behaves.
+
+    latency is one of:
+    * {"distribution": "fixed", "ms": 200}
+    * {"distribution": "uniform", "min_ms": 100, "max_ms": 300}
+    * {"distribution": "lognormal", "median_ms": 200, "sigma": 0.5}
+
+    The rates are the chance of each invocation failing in that way: error_rate raises a boto3 ClientError as if
+    the invocation itself failed, function_error_rate returns a FunctionError as if the lambda couldn't reach the
+    CBC, and hang_rate sleeps for hang_seconds and then raises a read timeout.
+    """
+
+    latency: dict = field(default_factory=lambda: {"distribution": "fixed", "ms": 0})
+    error_rate: float = 0.0
+    function_error_rate: float = 0.0
+    hang_rate: float = 0.0
+    hang_seconds: float = 60.0
+
+    def sample_latency(self, rng):
+        distribution = self.latency.get("distribution", "fixed")
+        if distribution == "fixed":
+            ms = self.latency.get("ms", 0)
+        elif distribution == "uniform":
+            ms = rng.uniform(self.latency["min_ms"], self.latency["max_ms"])
+        elif distribution == "lognormal":
+            ms = self.latency["median_ms"] * rng.lognormvariate(0, self.latency.get("sigma", 0.5))
+        else:
+            raise ValueError(f"Unknown latency distribution {distribution}")
+        return ms / 1000
+
+
+class CBCLambdaSimulator:
+    """
+    A local stand-in for the boto3 Lambda client used by CBCProxyClient, so that the send path can be run and
+    measured without AWS. It implements the contract of the {ee,three,o2,vodafone}-{1,2}-proxy lambdas: payloads
+    are checked as the real proxies would check them, and each route responds after a simulated latency, failing
+    some of the time according to its configured behaviour.
+
+    The profile is a dict of route to behaviour (see SimulatedRoute). A route's behaviour is built up from the
+    entries for "default", its MNO (e.g. "ee"), its lambda ("ee-1-proxy") and the route itself ("ee-1-proxy/cbc_a"),
+    with the more specific entries overriding the less specific ones. For example, to make Vodafone's primary proxy
+    slow and unreliable, while every other route answers quickly:
+
+        {
+            "default": {"latency": {"distribution": "lognormal", "median_ms": 150, "sigma": 0.4}},
+            "vodafone-1-proxy": {"latency": {"distribution": "uniform", "min_ms": 2000, "max_ms": 8000},
+                                 "function_error_rate": 0.3, "hang_rate": 0.05, "hang_seconds": 30}
+        }
+
+    Every invocation is recorded in `invocations` for inspection.
+    """
+
+    def __init__(self, profile=None, seed=None):
+        self._profile = profile or {}
+        self._routes = {}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.invocations = []
+
+    @classmethod
+    def from_config(cls, profile_json, seed=None):
+        return cls(json.loads(profile_json) if profile_json else None, seed=seed)
+
+    def invoke(self, FunctionName, InvocationType, Payload):
+        function_name = FunctionName.rsplit(":", 1)[-1]
+        match = FUNCTION_NAME_PATTERN.match(function_name)
+        if not match:
+            raise ClientError(
+                {"Error": {"Code": "ResourceNotFoundException", "Message": f"Function not found: {FunctionName}"}},
+                "Invoke",
+            )
+
+        payload = json.loads(Payload)
+        cbc_target = payload.get("cbc_target")
+        route = self._get_route(match.group("mno"), function_name, cbc_target)
+        with self._lock:
+            latency = route.sample_latency(self._rng)
+            outcome = self._rng.random()
+
+        start = time.monotonic()
+        try:
+            if outcome < route.hang_rate:
+                time.sleep(route.hang_seconds)
+                raise ReadTimeoutError(endpoint_url=f"https://lambda.simulated/{function_name}")
+
+            time.sleep(latency)
+            outcome -= route.hang_rate
+            if outcome < route.error_rate:
+                raise ClientError(
+                    {"Error": {"Code": "TooManyRequestsException", "Message": "Rate exceeded"}},
+                    "Invoke",
+                )
+
+            outcome -= route.error_rate
+            problem = self._check_payload(match.group("mno"), payload)
+            if problem is None and outcome < route.function_error_rate:
+                problem = f"Simulated failure connecting to {cbc_target}"
+
+            if problem is not None:
+                return {
+                    "StatusCode": 200,
+                    "FunctionError": "Unhandled",
+                    "Payload": BytesIO(json.dumps({"errorMessage": problem}).encode("utf-8")),
+                }
+
+            return {"StatusCode": 200, "Payload": BytesIO(json.dumps({"result": "success"}).encode("utf-8"))}
+        finally:
+            with self._lock:
+                self.invocations.append(
+                    {
+                        "function_name": function_name,
+                        "cbc_target": cbc_target,
+                        "message_type": payload.get("message_type"),
+                        "duration": time.monotonic() - start,
+                    }
+                )
+
+    def _get_route(self, mno, function_name, cbc_target):
+        route_key = f"{function_name}/{cbc_target}"
+        with self._lock:
+            if route_key not in self._routes:
+                behaviour = {}
+                for key in ["default", mno, function_name, route_key]:
+                    behaviour.update(self._profile.get(key, {}))
+                self._routes[route_key] = SimulatedRoute(**behaviour)
+            return self._routes[route_key]
+
+    @staticmethod
+    def _check_payload(mno, payload):
+        if payload.get("message_type") not in MESSAGE_TYPES:
+            return f"Unknown message_type {payload.get('message_type')}"
+        if payload.get("cbc_target") not in CBC_TARGETS:
+            return f"Unknown cbc_target {payload.get('cbc_target')}"
+        if not payload.get("identifier"):
+            return "Missing identifier"
+
+        expected_format = "ibag" if mno == "vodafone" else "cap"
+        if payload.get("message_format") != expected_format:
+            return f"Expected message_format {expected_format}, got {payload.get('message_format')}"
+        if mno == "vodafone" and not payload.get("message_number"):
+            return "Missing message_number"
+
+        if payload["message_type"] in {"alert", "update"}:
+            missing = {"headline", "description", "areas", "sent", "expires", "channel"} - payload.keys()
+            if missing:
+                return f"Missing fields {sorted(missing)}"
+            try:
+                areas = decode_areas(payload["areas"])
+            except Exception as e:
+                return f"Invalid areas: {e}"
+            if not all(len(area.get("polygon", [])) >= 3 for area in areas):
+                return "Invalid areas: every polygon needs at least 3 points"
+        if payload["message_type"] in {"update", "cancel"} and "references" not in payload:
+            return "Missing references"
+        return None
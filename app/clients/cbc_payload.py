@@ -0,0 +1,190 @@
+import base64
+import hashlib
+import json
+import zlib
+from dataclasses import asdict, dataclass
+from functools import cached_property
+
+from emergency_alerts_utils.template import non_gsm_characters
+from emergency_alerts_utils.xml.common import HEADLINE
+from flask import current_app
+
+AREAS_ENCODING_JSON = "json"
+# Quantised coordinates, delta encoded per polygon, then zlib compressed and base64 encoded. The proxy lambdas need
+# to decode this themselves, so it's opt-in (see decode_areas)
+AREAS_ENCODING_DELTA_ZLIB = "delta-zlib"
+
+
+@dataclass(frozen=True)
+class StagedBroadcastPayload:
+    """
+    The provider-independent part of the payload for an alert: its content, areas, times and channel.
+
+    Building this means converting every polygon and JSON encoding them, which for a large multi-polygon alert is
+    most of the work of a send. So it's staged once per broadcast event and stored on the event, and each provider
+    only adds its own identifier, message number, message format and name for the language.
+    """
+
+    # The shared fields, already encoded as a JSON object
+    fields_json: str
+    # Whether the description needs characters outside the GSM alphabet, in which case it's sent as Welsh
+    welsh: bool
+
+    @classmethod
+    def build(cls, *, headline, description, sent, expires, channel, areas=None, areas_json=None):
+        """
+        Pass either areas, or areas_json if they've already been encoded (see
+        app/broadcast_message/utils.py::stage_broadcast_message).
+        """
+        fields_json = json.dumps(
+            {
+                "headline": headline,
+                "description": description,
+                "sent": sent,
+                "expires": expires,
+                "channel": channel,
+            }
+        )
+        if areas_json is None:
+            areas_json = json.dumps(areas)
+        return cls(
+            fields_json=f'{fields_json[:-1]}, "areas": {areas_json}}}',
+            welsh=bool(non_gsm_characters(description)),
+        )
+
+    @classmethod
+    def for_broadcast_event(cls, broadcast_event, areas_json=None):
+        """
+        Returns the payload staged on the broadcast event, or builds it if the event hasn't been staged (for example
+        if it was queued before staging existed). areas_json can be passed if the event's areas have already been
+        encoded.
+        """
+        if broadcast_event.staged_payload:
+            return cls(**broadcast_event.staged_payload)
+
+        if areas_json is None:
+            areas_json = encode_areas(broadcast_event.transmitted_areas["simple_polygons"])
+
+        return cls.build(
+            headline=HEADLINE,
+            description=broadcast_event.transmitted_content["body"],
+            areas_json=areas_json,
+            sent=broadcast_event.sent_at_as_cap_datetime_string,
+            expires=broadcast_event.transmitted_finishes_at_as_cap_datetime_string,
+            channel=broadcast_event.service.broadcast_channel,
+        )
+
+    @cached_property
+    def area_counts(self):
+        """
+        The number of polygons and points in the areas, counted from the encoded JSON rather than by decoding it.
+        Staged areas only hold polygons, so each polygon is one '"polygon": ' and each point after a polygon's first
+        is one '], ['.
+        """
+        areas_json = self.fields_json[self.fields_json.rindex('"areas": ') + len('"areas": ') : -1]
+        if areas_json.startswith("{"):
+            header = json.loads(areas_json)
+            return header["polygon_count"], header["point_count"]
+
+        polygon_count = areas_json.count('"polygon": ')
+        return polygon_count, polygon_count + areas_json.count("], [")
+
+    def serialize(self):
+        return asdict(self)
+
+
+def encode_payload(payload, staged_payload=None):
+    """
+    JSON encode a lambda payload, splicing in the fields from staged_payload (if there is one) as they were encoded
+    when it was staged, rather than encoding them again.
+    """
+    encoded = json.dumps(payload)
+    if staged_payload is not None:
+        encoded = f"{encoded[:-1]}, {staged_payload.fields_json[1:]}"
+    return bytes(encoded, encoding="utf8")
+
+
+def quantise_polygons(polygons, decimal_places):
+    return [[[round(lat, decimal_places), round(lon, decimal_places)] for lat, lon in polygon] for polygon in polygons]
+
+
+def encode_areas(polygons, decimal_places=None, encoding=None):
+    """
+    Encode polygons as the JSON value for the areas in a lambda payload. Coordinates are rounded to
+    CBC_COORDINATE_DECIMAL_PLACES, as the CBCs don't honour any more precision than that, and encoded as set by
+    CBC_PAYLOAD_AREAS_ENCODING.
+    """
+    if decimal_places is None:
+        decimal_places = current_app.config["CBC_COORDINATE_DECIMAL_PLACES"]
+    if encoding is None:
+        encoding = current_app.config["CBC_PAYLOAD_AREAS_ENCODING"]
+
+    if encoding == AREAS_ENCODING_JSON:
+        return json.dumps([{"polygon": polygon} for polygon in quantise_polygons(polygons, decimal_places)])
+
+    if encoding != AREAS_ENCODING_DELTA_ZLIB:
+        raise ValueError(f"Unknown areas encoding {encoding}")
+
+    scale = 10**decimal_places
+    deltas = []
+    for polygon in polygons:
+        points = [(round(lat * scale), round(lon * scale)) for lat, lon in polygon]
+        polygon_deltas = list(points[0]) if points else []
+        for (previous_lat, previous_lon), (lat, lon) in zip(points, points[1:]):
+            polygon_deltas.extend([lat - previous_lat, lon - previous_lon])
+        deltas.append(polygon_deltas)
+
+    data = zlib.compress(json.dumps(deltas, separators=(",", ":")).encode("utf-8"))
+    return json.dumps(
+        {
+            "encoding": AREAS_ENCODING_DELTA_ZLIB,
+            "decimal_places": decimal_places,
+            "polygon_count": len(polygons),
+            "point_count": sum(len(polygon) for polygon in polygons),
+            "data": base64.b64encode(data).decode("ascii"),
+        }
+    )
+
+
+def decode_areas(areas):
+    """
+    The areas of a decoded lambda payload as a list of {"polygon": [[lat, lon], ...]}, however they were encoded.
+    This is the decoding the proxy lambdas do for AREAS_ENCODING_DELTA_ZLIB.
+    """
+    if isinstance(areas, list):
+        return areas
+
+    if areas.get("encoding") != AREAS_ENCODING_DELTA_ZLIB:
+        raise ValueError(f"Unknown areas encoding {areas.get('encoding')}")
+
+    scale = 10 ** areas["decimal_places"]
+    decoded = []
+    for polygon_deltas in json.loads(zlib.decompress(base64.b64decode(areas["data"]))):
+        polygon = []
+        lat = lon = 0
+        for index in range(0, len(polygon_deltas), 2):
+            lat += polygon_deltas[index]
+            lon += polygon_deltas[index + 1]
+            polygon.append([round(lat / scale, areas["decimal_places"]), round(lon / scale, areas["decimal_places"])])
+        decoded.append({"polygon": polygon})
+    return decoded
+
+
+def summarise_payload(payload, staged_payload=None):
+    """
+    A digest of a lambda payload to log in place of the payload itself, which for a complex alert can be megabytes
+    of polygons. cbc_target is left out of the hash so that it's the same for every route the payload is sent down.
+    """
+    encoded = encode_payload({key: value for key, value in payload.items() if key != "cbc_target"}, staged_payload)
+    if staged_payload is not None:
+        polygon_count, point_count = staged_payload.area_counts
+    else:
+        polygons = [area["polygon"] for area in payload.get("areas", [])]
+        polygon_count, point_count = len(polygons), sum(len(polygon) for polygon in polygons)
+
+    return {
+        "payload_sha256": hashlib.sha256(encoded).hexdigest(),
+        "payload_bytes": len(encoded),
+        "polygon_count": polygon_count,
+        "point_count": point_count,
+    }
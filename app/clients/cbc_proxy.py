@@ -1,15 +1,25 @@
 import json
+import logging
 import os
+import threading
 import uuid
 from abc import ABC, abstractmethod
-from datetime import datetime, timedelta, timezone
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from time import monotonic
 
-import boto3
 import botocore
-from emergency_alerts_utils.template import non_gsm_characters
 from flask import current_app
 from sqlalchemy.schema import Sequence
 
+from app.clients.cbc_circuit_breaker import CIRCUIT_OPEN, CBCCircuitBreaker
+from app.clients.cbc_lambda_simulator import CBCLambdaSimulator
+from app.clients.cbc_payload import (
+    StagedBroadcastPayload,
+    encode_payload,
+    summarise_payload,
+)
+from app.clients.cbc_route_table import CBCRouteTable
 from app.config import BroadcastProvider
 from app.utils import DATETIME_FORMAT, format_sequential_number
 
@@ -31,6 +41,10 @@ from app.utils import DATETIME_FORMAT, format_sequential_number
 
 aws_region = os.environ.get("AWS_REGION", "eu-west-2")
 
+# Full lambda payloads are only written here, and only if CBC_PROXY_PAYLOAD_LOG_FILE is set
+payload_logger = logging.getLogger("cbc_proxy_payloads")
+payload_logger.propagate = False
+
 
 class CBCProxyRetryableException(Exception):
     pass
@@ -39,12 +53,93 @@ class CBCProxyRetryableException(Exception):
 class CBCProxyClient:
     _lambda_client = None
     _arn_prefix = ""
+    _hedge_delay = None
+
+    def __init__(self):
+        self._route_table = CBCRouteTable()
+        self._circuit_breaker = CBCCircuitBreaker()
 
     def init_app(self, app):
         if app.config.get("CBC_PROXY_ENABLED"):
             if app.config.get("CBC_ACCOUNT_NUMBER") is not None:
                 self._arn_prefix = app.config.get("CBC_ACCOUNT_NUMBER") + ":function:"
-            self._lambda_client = boto3.client("lambda", region_name=aws_region)
+            if app.config.get("CBC_LAMBDA_SIMULATOR_ENABLED"):
+                self._lambda_client = CBCLambdaSimulator.from_config(app.config.get("CBC_LAMBDA_SIMULATOR_PROFILE"))
+            else:
+                # Import here so that app/__init__.py has finished executing, so aws_clients exists
+                from app import aws_clients
+
+                # One client, shared by every thread that invokes the lambdas. boto3 clients are thread safe, and
+                # the hedging and link test threads only last for one call, so a client each would mean a new one
+                # (and new connections) every time
+                self._lambda_client = aws_clients.client("lambda", region_name=aws_region)
+            self._hedge_delay = app.config.get("CBC_PROXY_HEDGE_DELAY_SECONDS")
+            if app.config.get("CBC_PROXY_PAYLOAD_LOG_FILE") and not payload_logger.handlers:
+                payload_logger.addHandler(logging.FileHandler(app.config["CBC_PROXY_PAYLOAD_LOG_FILE"]))
+                payload_logger.setLevel(logging.DEBUG)
+            self._route_table.init_app(app)
+            self._circuit_breaker.init_app(app)
+
+    def send_link_tests(self, providers, timeout):
+        """
+        Link test every route of every given provider at once, so that the results are a snapshot of the health of
+        all routes at the same moment. A probe that hasn't answered within the timeout is counted as failed; as
+        with hedged sends, it can't be recalled, so it's left to finish in the background.
+
+        The best route for each provider is then written to route_advisor in a single statement.
+
+        Returns a dict of (lambda name, CBC target) to whether the link test succeeded.
+        """
+        app = current_app._get_current_object()
+        proxies = [self.get_proxy(provider) for provider in providers]
+        probes = [(proxy, lambda_name, cbc_target) for proxy in proxies for lambda_name, cbc_target in proxy.routes]
+        if not probes:
+            return {}
+
+        def probe(proxy, lambda_name, cbc_target):
+            with app.app_context():
+                return proxy._invoke_link_test(lambda_name, cbc_target)
+
+        executor = ThreadPoolExecutor(max_workers=len(probes), thread_name_prefix="cbc-link-test")
+        try:
+            futures = {
+                executor.submit(probe, proxy, lambda_name, cbc_target): (lambda_name, cbc_target)
+                for proxy, lambda_name, cbc_target in probes
+            }
+            done, not_done = wait(futures, timeout=timeout)
+        finally:
+            executor.shutdown(wait=False)
+
+        results = {route: False for route in futures.values()}
+        for future in done:
+            try:
+                results[futures[future]] = bool(future.result())
+            except Exception:
+                current_app.logger.exception(
+                    f"Link test to lambda {futures[future][0]} failed",
+                    extra={"cbc_target": futures[future][1], "python_module": __name__},
+                )
+
+        if not_done:
+            current_app.logger.warning(
+                f"{len(not_done)} link tests didn't finish within {timeout}s",
+                extra={
+                    "python_module": __name__,
+                    "routes_timed_out": [f"{name} | {target}" for name, target in map(futures.get, not_done)],
+                },
+            )
+
+        failed_routes = [route for route, succeeded in results.items() if not succeeded]
+        current_app.logger.info(
+            f"Link tested {len(results)} routes, {len(results) - len(failed_routes)} succeeded",
+            extra={
+                "python_module": __name__,
+                "failed_routes": [f"{name} | {target}" for name, target in failed_routes],
+            },
+        )
+
+        self._route_table.persist_best_routes([proxy.mno for proxy in proxies])
+        return results
 
     def get_proxy(self, provider):
         proxy_classes = {
@@ -53,7 +148,13 @@ class CBCProxyClient:
             BroadcastProvider.O2: CBCProxyO2,
             BroadcastProvider.VODAFONE: CBCProxyVodafone,
         }
-        return proxy_classes[provider](self._lambda_client, self._arn_prefix)
+        return proxy_classes[provider](
+            self._lambda_client,
+            self._arn_prefix,
+            self._route_table,
+            self._circuit_breaker,
+            hedge_delay=self._hedge_delay,
+        )
 
 
 class CBCProxyClientBase(ABC):
@@ -80,9 +181,29 @@ class CBCProxyClientBase(ABC):
     def LANGUAGE_WELSH(self):
         pass
 
-    def __init__(self, lambda_client, arn_prefix):
+    def __init__(self, lambda_client, arn_prefix, route_table, circuit_breaker, hedge_delay=None):
         self._lambda_client = lambda_client
         self._arn_prefix = arn_prefix
+        self._route_table = route_table
+        self._circuit_breaker = circuit_breaker
+        # Seconds to wait on a route before also trying the next one in parallel. None means routes are
+        # tried strictly one after another.
+        self._hedge_delay = hedge_delay
+
+    @property
+    def routes(self):
+        routes = [
+            (self.primary_lambda, self.CBC_A),
+            (self.primary_lambda, self.CBC_B),
+        ]
+        if self.secondary_lambda:
+            routes.extend(
+                [
+                    (self.secondary_lambda, self.CBC_A),
+                    (self.secondary_lambda, self.CBC_B),
+                ]
+            )
+        return routes
 
     def send_link_test(self):
         self._send_link_test(self.primary_lambda, self.CBC_A)
@@ -102,18 +223,37 @@ class CBCProxyClientBase(ABC):
     def send_link_test_secondary_to_B(self):
         self._send_link_test(self.secondary_lambda, self.CBC_B)
 
-    @abstractmethod
     def _send_link_test(
         self,
         lambda_name,
         cbc_target,
     ):
-        pass
+        if self._invoke_link_test(lambda_name, cbc_target):
+            self._route_table.persist_best_route(self.mno)
 
     @abstractmethod
+    def _invoke_link_test(
+        self,
+        lambda_name,
+        cbc_target,
+    ):
+        pass
+
     def create_and_send_broadcast(
         self, identifier, headline, description, areas, sent, expires, channel, message_number=None
     ):
+        staged_payload = StagedBroadcastPayload.build(
+            headline=headline,
+            description=description,
+            areas=areas,
+            sent=sent,
+            expires=expires,
+            channel=channel,
+        )
+        self.send_staged_broadcast(identifier=identifier, staged_payload=staged_payload, message_number=message_number)
+
+    @abstractmethod
+    def send_staged_broadcast(self, identifier, staged_payload, message_number=None):
         pass
 
     # We have not implementated updating a broadcast
@@ -138,48 +278,131 @@ class CBCProxyClientBase(ABC):
     ):
         pass
 
-    def _invoke_lambdas_with_routing(self, payload):
-        # Import here so that app/__init__.py has finished executing create_app,
-        # so app.db exists and has been imported by app.dao.__init__
-        from app.dao.route_advisor_dao import dao_get_route_for_mno
+    @property
+    def mno(self):
+        return self.primary_lambda.split("-", 1)[0]
 
-        routes = [
-            (self.primary_lambda, self.CBC_A),
-            (self.primary_lambda, self.CBC_B),
-        ]
-        if self.secondary_lambda:
-            routes.extend(
-                [
-                    (self.secondary_lambda, self.CBC_A),
-                    (self.secondary_lambda, self.CBC_B),
-                ]
+    def _invoke_lambdas_with_routing(self, payload, staged_payload=None):
+        routes = self._route_table.order_routes(self.mno, self.routes)
+        # The payload is the same down every route, so only summarise it once
+        payload_summary = _summarise_payload_for_logging(payload, staged_payload)
+
+        routes_to_try = self._circuit_breaker.routes_for_sending(routes)
+        if len(routes_to_try) < len(routes):
+            current_app.logger.info(
+                f"Skipping routes for {self.mno} with open circuits",
+                extra={
+                    "python_module": __name__,
+                    "skipped_routes": [
+                        f"{name} | {target}" for name, target in routes if (name, target) not in routes_to_try
+                    ],
+                },
+            )
+        elif all(self._circuit_breaker.get_state(*route) == CIRCUIT_OPEN for route in routes):
+            current_app.logger.warning(
+                f"All routes for {self.mno} have open circuits, trying them anyway",
+                extra={"python_module": __name__},
             )
+        routes = routes_to_try
+
+        if self._hedge_delay is not None:
+            result = self._invoke_lambdas_hedged(routes, payload, staged_payload, payload_summary)
+        else:
+            result = self._invoke_lambdas_sequentially(routes, payload, staged_payload, payload_summary)
 
-        mno = self.primary_lambda.split("-", 1)[0]
-        route = dao_get_route_for_mno(mno)
-        if route:
-            preferred = (route.proxy, route.target)
-            routes.remove(preferred)
-            routes.insert(0, preferred)
+        if result:
+            return True
+
+        error_message = f"{self.primary_lambda} and {self.secondary_lambda} lambdas failed"
+        current_app.logger.info(error_message, extra={"python_module": __name__})
+        raise CBCProxyRetryableException(error_message)
 
+    def _invoke_lambdas_sequentially(self, routes, payload, staged_payload=None, payload_summary=None):
         for route in routes:
             payload["cbc_target"] = route[1]
-            result = self._invoke_lambda(route[0], payload, route[1])
+            result = self._invoke_lambda(route[0], payload, route[1], staged_payload, payload_summary)
             if result:
                 return True
 
-        error_message = f"{self.primary_lambda} and {self.secondary_lambda} lambdas failed"
-        current_app.logger.info(error_message, extra={"python_module": __name__})
-        raise CBCProxyRetryableException(error_message)
+        return False
+
+    def _invoke_lambdas_hedged(self, routes, payload, staged_payload=None, payload_summary=None):
+        """
+        Try the routes in order, but don't wait for a slow route to time out before trying the next one. If no route
+        in flight has answered within the hedge delay, the next route is started alongside it; a route that fails
+        outright is replaced by the next one straight away. The first route to ACK wins. Routes still in flight at
+        that point can't be recalled, so they are left to finish in the background and their outcome is logged.
+        """
+        app = current_app._get_current_object()
+        pending_routes = list(routes)
+        in_flight = {}
 
-    def _invoke_lambda(self, lambda_name, payload, cbc_target):
-        payload_bytes = bytes(json.dumps(payload), encoding="utf8")
+        def invoke(lambda_name, cbc_target):
+            with app.app_context():
+                return self._invoke_lambda(
+                    lambda_name, {**payload, "cbc_target": cbc_target}, cbc_target, staged_payload, payload_summary
+                )
+
+        def start_next_route():
+            lambda_name, cbc_target = pending_routes.pop(0)
+            in_flight[executor.submit(invoke, lambda_name, cbc_target)] = (lambda_name, cbc_target)
+
+        executor = ThreadPoolExecutor(max_workers=len(routes), thread_name_prefix="cbc-proxy-hedge")
+        try:
+            start_next_route()
+            while in_flight:
+                done, _ = wait(
+                    in_flight, timeout=self._hedge_delay if pending_routes else None, return_when=FIRST_COMPLETED
+                )
+
+                if not done:
+                    lambda_name, cbc_target = pending_routes[0]
+                    current_app.logger.info(
+                        f"No response within {self._hedge_delay}s, hedging with lambda {lambda_name}",
+                        extra={
+                            "cbc_target": cbc_target,
+                            "python_module": __name__,
+                            "routes_in_flight": [f"{name} | {target}" for name, target in in_flight.values()],
+                        },
+                    )
+                    start_next_route()
+                    continue
+
+                for future in done:
+                    in_flight.pop(future)
+
+                if any(future.exception() is None and future.result() for future in done):
+                    for future, (lambda_name, cbc_target) in in_flight.items():
+                        future.add_done_callback(
+                            lambda f, lambda_name=lambda_name, cbc_target=cbc_target: _log_hedged_route_outcome(
+                                app, lambda_name, cbc_target, f
+                            )
+                        )
+                    return True
+
+                # Everything that came back failed, so replace each of those routes straight away
+                for _ in range(min(len(done), len(pending_routes))):
+                    start_next_route()
+
+            return False
+        finally:
+            # Don't block on routes that are still in flight; the first ACK is all we need.
+            executor.shutdown(wait=False)
+
+    def _invoke_lambda(self, lambda_name, payload, cbc_target, staged_payload=None, payload_summary=None):
+        payload_bytes = encode_payload(payload, staged_payload)
+        if payload_summary is None:
+            payload_summary = _summarise_payload_for_logging(payload, staged_payload)
+        if "payload_sha256" in payload_summary:
+            _log_full_payload_once(payload_summary["payload_sha256"], payload_bytes)
+
+        start = monotonic()
         try:
             current_app.logger.info(
                 f"Calling lambda {lambda_name}",
                 extra={
                     "cbc_target": cbc_target,
-                    "lambda_payload": str(payload),
+                    **payload_summary,
                     "lambda_invocation_type": "RequestResponse",
                     "lambda_arn": f"{self._arn_prefix}{lambda_name}",
                 },
@@ -190,6 +413,7 @@ class CBCProxyClientBase(ABC):
                 Payload=payload_bytes,
             )
         except botocore.exceptions.ClientError as e:
+            self._record_outcome(lambda_name, cbc_target, False, monotonic() - start)
             current_app.logger.error(
                 f"Boto3 ClientError on lambda {lambda_name}",
                 extra={
@@ -200,6 +424,7 @@ class CBCProxyClientBase(ABC):
             )
             return False
         except Exception as e:
+            self._record_outcome(lambda_name, cbc_target, False, monotonic() - start)
             current_app.logger.error(
                 f"Unexpected error calling lambda {lambda_name}",
                 extra={
@@ -245,12 +470,54 @@ class CBCProxyClientBase(ABC):
             )
             success = True
 
+        self._record_outcome(lambda_name, cbc_target, success, monotonic() - start)
         return success
 
-    def infer_language_from(self, content):
-        if non_gsm_characters(content):
-            return self.LANGUAGE_WELSH
-        return self.LANGUAGE_ENGLISH
+    def _record_outcome(self, lambda_name, cbc_target, succeeded, latency):
+        self._route_table.record(lambda_name, cbc_target, succeeded, latency)
+        self._circuit_breaker.record(lambda_name, cbc_target, succeeded)
+
+
+_logged_payload_digests = OrderedDict()
+_logged_payload_digests_lock = threading.Lock()
+MAX_LOGGED_PAYLOAD_DIGESTS = 1000
+
+
+def _summarise_payload_for_logging(payload, staged_payload=None):
+    if current_app.config["CBC_PROXY_PAYLOAD_LOGGING"] == "full":
+        return {"lambda_payload": str(payload)}
+    return summarise_payload(payload, staged_payload)
+
+
+def _log_full_payload_once(payload_sha256, payload_bytes):
+    """
+    Write the full payload to the payload log the first time it's sent from this process. The same payload is sent
+    down each route and on each retry, and they can all be found from its digest in the application log.
+    """
+    if not payload_logger.isEnabledFor(logging.DEBUG):
+        return
+
+    with _logged_payload_digests_lock:
+        if payload_sha256 in _logged_payload_digests:
+            return
+        _logged_payload_digests[payload_sha256] = True
+        if len(_logged_payload_digests) > MAX_LOGGED_PAYLOAD_DIGESTS:
+            _logged_payload_digests.popitem(last=False)
+
+    payload_logger.debug("%s %s", payload_sha256, payload_bytes.decode("utf-8"))
+
+
+def _log_hedged_route_outcome(app, lambda_name, cbc_target, future):
+    succeeded = future.exception() is None and future.result()
+    app.logger.info(
+        f"Hedged lambda {lambda_name} finished after another route had already succeeded",
+        extra={
+            "proxy_lambda": lambda_name,
+            "cbc_target": cbc_target,
+            "python_module": __name__,
+            "hedged_route_succeeded": succeeded,
+        },
+    )
 
 
 def _convert_lambda_payload_to_json(byte_string):
@@ -263,7 +530,7 @@ class CBCProxyOne2ManyClient(CBCProxyClientBase):
     LANGUAGE_ENGLISH = "en-GB"
     LANGUAGE_WELSH = "cy-GB"
 
-    def _send_link_test(
+    def _invoke_link_test(
         self,
         lambda_name,
         cbc_target,
@@ -279,25 +546,16 @@ class CBCProxyOne2ManyClient(CBCProxyClientBase):
             "cbc_target": cbc_target,
         }
 
-        result = self._invoke_lambda(lambda_name=lambda_name, payload=payload, cbc_target=cbc_target)
-        _update_route_advisor(lambda_name, cbc_target, result)
+        return self._invoke_lambda(lambda_name=lambda_name, payload=payload, cbc_target=cbc_target)
 
-    def create_and_send_broadcast(
-        self, identifier, headline, description, areas, sent, expires, channel, message_number=None
-    ):
+    def send_staged_broadcast(self, identifier, staged_payload, message_number=None):
         payload = {
             "message_type": "alert",
             "identifier": identifier,
             "message_format": "cap",
-            "headline": headline,
-            "description": description,
-            "areas": areas,
-            "sent": sent,
-            "expires": expires,
-            "language": self.infer_language_from(description),
-            "channel": channel,
+            "language": self.LANGUAGE_WELSH if staged_payload.welsh else self.LANGUAGE_ENGLISH,
         }
-        self._invoke_lambdas_with_routing(payload=payload)
+        self._invoke_lambdas_with_routing(payload=payload, staged_payload=staged_payload)
 
     def cancel_broadcast(self, identifier, previous_provider_messages, sent, message_number=None):
         payload = {
@@ -349,7 +607,7 @@ class CBCProxyVodafone(CBCProxyClientBase):
     LANGUAGE_ENGLISH = "English"
     LANGUAGE_WELSH = "Welsh"
 
-    def _send_link_test(
+    def _invoke_link_test(
         self,
         lambda_name,
         cbc_target,
@@ -372,26 +630,17 @@ class CBCProxyVodafone(CBCProxyClientBase):
             "cbc_target": cbc_target,
         }
 
-        result = self._invoke_lambda(lambda_name=lambda_name, payload=payload, cbc_target=cbc_target)
-        _update_route_advisor(lambda_name, cbc_target, result)
+        return self._invoke_lambda(lambda_name=lambda_name, payload=payload, cbc_target=cbc_target)
 
-    def create_and_send_broadcast(
-        self, identifier, message_number, headline, description, areas, sent, expires, channel
-    ):
+    def send_staged_broadcast(self, identifier, staged_payload, message_number=None):
         payload = {
             "message_type": "alert",
             "identifier": identifier,
             "message_number": message_number,
             "message_format": "ibag",
-            "headline": headline,
-            "description": description,
-            "areas": areas,
-            "sent": sent,
-            "expires": expires,
-            "language": self.infer_language_from(description),
-            "channel": channel,
+            "language": self.LANGUAGE_WELSH if staged_payload.welsh else self.LANGUAGE_ENGLISH,
         }
-        self._invoke_lambdas_with_routing(payload=payload)
+        self._invoke_lambdas_with_routing(payload=payload, staged_payload=staged_payload)
 
     def cancel_broadcast(self, identifier, previous_provider_messages, sent, message_number):
         payload = {
@@ -424,31 +673,3 @@ class CBCProxyVodafone(CBCProxyClientBase):
         message_number=None,
     ):
         pass
-
-
-def _update_route_advisor(lambda_name, cbc_target, result):
-    # Import here so that app/__init__.py has finished executing create_app,
-    # so app.db exists and has been imported by app.dao.__init__
-    from app.dao.route_advisor_dao import (
-        dao_get_route_for_mno,
-        dao_set_route_for_mno,
-    )
-
-    if result:
-        mno = lambda_name.split("-", 1)[0]
-        validity_interval = datetime.now(timezone.utc) - timedelta(seconds=30)
-        current_route = dao_get_route_for_mno(mno)
-
-        # If the route advisor has not been verified within the last 30 seconds, assume
-        # the current successful route is the latest best known route
-        if current_route is None or current_route.updated_at < validity_interval:
-            current_app.logger.info(f"Updating route advisor for {mno}: {lambda_name} | {cbc_target}")
-            current_app.logger.info(
-                f"Updating route advisor for {mno}",
-                extra={
-                    "proxy_lambda": lambda_name,
-                    "cbc_target": cbc_target,
-                    "python_module": __name__,
-                },
-            )
-            dao_set_route_for_mno(mno, lambda_name, cbc_target)
@@ -0,0 +1,170 @@
+import threading
+import time
+from dataclasses import dataclass
+
+from flask import current_app
+
+
+@dataclass
+class RouteStats:
+    # Rolling averages, weighted towards the most recent invocations
+    latency: float
+    success_rate: float
+    observed_at: float
+
+
+class CBCRouteTable:
+    """
+    A process-local view of how healthy each (proxy lambda, CBC target) route is, used to decide the order in which
+    routes are tried when sending to an MNO.
+
+    Every lambda invocation feeds its latency and outcome into a rolling score for its route. Healthy routes are
+    tried first, best score first, then routes we haven't heard from recently, in the order the route_advisor table
+    suggests, and then failing routes. An untried route is never preferred to one that's working, however slow, as
+    it may cost a whole lambda timeout to find out that it isn't. route_advisor is cached for a short TTL so that a
+    send doesn't need a DB round trip.
+
+    Writes to route_advisor are deferred: the best route for an MNO is written back from the link tests, at most
+    once per TTL, rather than read and upserted on every successful invocation.
+    """
+
+    # Weight given to each new observation in the rolling averages
+    SMOOTHING = 0.3
+    # A route is healthy if at least this much of its recent invocations succeeded
+    HEALTHY_SUCCESS_RATE = 0.5
+    # Added to a route's score in proportion to how many of its recent invocations failed
+    FAILURE_PENALTY_SECONDS = 30.0
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._advised_routes = {}
+        self._persisted_at = {}
+        self.cache_ttl = 30
+        self.stats_ttl = 300
+
+    def init_app(self, app):
+        self.cache_ttl = app.config.get("CBC_ROUTE_ADVISOR_CACHE_TTL_SECONDS", self.cache_ttl)
+        self.stats_ttl = app.config.get("CBC_ROUTE_STATS_TTL_SECONDS", self.stats_ttl)
+
+    def record(self, lambda_name, cbc_target, succeeded, latency):
+        now = time.monotonic()
+        outcome = 1.0 if succeeded else 0.0
+        with self._lock:
+            stats = self._get_stats((lambda_name, cbc_target), now)
+            if stats is None:
+                self._stats[(lambda_name, cbc_target)] = RouteStats(latency, outcome, now)
+            else:
+                stats.latency += self.SMOOTHING * (latency - stats.latency)
+                stats.success_rate += self.SMOOTHING * (outcome - stats.success_rate)
+                stats.observed_at = now
+
+    def order_routes(self, mno, routes):
+        """
+        Order routes best first: healthy routes by score, then routes without recent observations in their given
+        order, with the route advised by route_advisor moved to the front of them, then failing routes by score.
+        """
+        routes = list(routes)
+        advised = self.get_advised_route(mno)
+        if advised in routes:
+            routes.remove(advised)
+            routes.insert(0, advised)
+
+        now = time.monotonic()
+        with self._lock:
+            return sorted(routes, key=lambda route: self._rank(route, now))
+
+    def get_advised_route(self, mno):
+        # Import here so that app/__init__.py has finished executing create_app,
+        # so app.db exists and has been imported by app.dao.__init__
+        from app.dao.route_advisor_dao import dao_get_route_for_mno
+
+        now = time.monotonic()
+        with self._lock:
+            cached = self._advised_routes.get(mno)
+        if cached is not None and now - cached[1] < self.cache_ttl:
+            return cached[0]
+
+        route = dao_get_route_for_mno(mno)
+        advised = (route.proxy, route.target) if route else None
+        with self._lock:
+            self._advised_routes[mno] = (advised, now)
+        return advised
+
+    def persist_best_route(self, mno):
+        # Import here so that app/__init__.py has finished executing create_app,
+        # so app.db exists and has been imported by app.dao.__init__
+        from app.dao.route_advisor_dao import dao_set_route_for_mno
+
+        best_route = self._choose_route_to_persist(mno, time.monotonic())
+        if best_route is None:
+            return
+
+        self._log_route_update(mno, *best_route)
+        dao_set_route_for_mno(mno, *best_route)
+
+    def persist_best_routes(self, mnos):
+        """
+        As persist_best_route, for several MNOs at once, writing all of their routes in one statement
+        """
+        from app.dao.route_advisor_dao import dao_set_routes_for_mnos
+
+        now = time.monotonic()
+        best_routes = {}
+        for mno in mnos:
+            best_route = self._choose_route_to_persist(mno, now)
+            if best_route is not None:
+                self._log_route_update(mno, *best_route)
+                best_routes[mno] = best_route
+
+        if best_routes:
+            dao_set_routes_for_mnos(best_routes)
+
+    def _choose_route_to_persist(self, mno, now):
+        with self._lock:
+            if now - self._persisted_at.get(mno, float("-inf")) < self.cache_ttl:
+                return None
+
+            healthy_routes = [
+                route
+                for route in list(self._stats)
+                if route[0].split("-", 1)[0] == mno
+                and (stats := self._get_stats(route, now))
+                and stats.success_rate >= self.HEALTHY_SUCCESS_RATE
+            ]
+            if not healthy_routes:
+                return None
+
+            best_route = min(healthy_routes, key=lambda route: self._score(route, now))
+            self._persisted_at[mno] = now
+            self._advised_routes[mno] = (best_route, now)
+            return best_route
+
+    def _log_route_update(self, mno, lambda_name, cbc_target):
+        current_app.logger.info(
+            f"Updating route advisor for {mno}",
+            extra={
+                "proxy_lambda": lambda_name,
+                "cbc_target": cbc_target,
+                "python_module": __name__,
+            },
+        )
+
+    def _get_stats(self, route, now):
+        stats = self._stats.get(route)
+        if stats is not None and now - stats.observed_at > self.stats_ttl:
+            # Too old to say anything about the route now, so forget it and let it be tried afresh
+            del self._stats[route]
+            return None
+        return stats
+
+    def _rank(self, route, now):
+        stats = self._get_stats(route, now)
+        if stats is None:
+            # sorted() is stable, so unobserved routes keep the order they were given in
+            return 1, 0
+        return (0 if stats.success_rate >= self.HEALTHY_SUCCESS_RATE else 2), self._score(route, now)
+
+    def _score(self, route, now):
+        stats = self._get_stats(route, now)
+        return stats.latency + (1 - stats.success_rate) * self.FAILURE_PENALTY_SECONDS
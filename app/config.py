@@ -60,6 +60,61 @@ class Config(object):
     CBC_ACCOUNT_NUMBER = os.getenv("CBC_ACCOUNT_NUMBER")
     CBC_PROXY_ENABLED = True
     ENABLED_CBCS = {BroadcastProvider.EE, BroadcastProvider.THREE, BroadcastProvider.O2, BroadcastProvider.VODAFONE}
+    # If set, a CBC route that hasn't responded within this many seconds has the next route tried alongside it,
+    # rather than waiting for the lambda to time out. Unset keeps route attempts strictly sequential.
+    CBC_PROXY_HEDGE_DELAY_SECONDS = (
+        float(os.getenv("CBC_PROXY_HEDGE_DELAY_SECONDS"))
+        if os.environ.get("CBC_PROXY_HEDGE_DELAY_SECONDS") is not None
+        else None
+    )
+    # How long each process trusts its cached copy of the route_advisor table before re-reading it
+    CBC_ROUTE_ADVISOR_CACHE_TTL_SECONDS = 30
+    # How long a route's rolling latency/success score is used for ordering after its last invocation
+    CBC_ROUTE_STATS_TTL_SECONDS = 300
+    # Consecutive failures after which broadcast sends stop trying a route, and how long until a link test may
+    # probe it again
+    CBC_ROUTE_BREAKER_FAILURE_THRESHOLD = int(os.environ.get("CBC_ROUTE_BREAKER_FAILURE_THRESHOLD", 3))
+    CBC_ROUTE_BREAKER_RESET_SECONDS = int(os.environ.get("CBC_ROUTE_BREAKER_RESET_SECONDS", 60))
+    # If true, send_broadcast_event sends to all providers concurrently from within the task, instead of queueing a
+    # send_broadcast_provider_message task per provider. Providers that fail are still retried by their own task.
+    CBC_CONCURRENT_PROVIDER_DISPATCH = os.environ.get("CBC_CONCURRENT_PROVIDER_DISPATCH", "false").lower() == "true"
+    CBC_CONCURRENT_PROVIDER_DISPATCH_MAX_WORKERS = int(
+        os.environ.get("CBC_CONCURRENT_PROVIDER_DISPATCH_MAX_WORKERS", 4)
+    )
+    # If true, send_broadcast_provider_message tasks go on a queue per provider (the high priority queue's name with
+    # the provider appended) instead of the shared high priority queue. Give each MNO guaranteed capacity by running
+    # a worker per provider queue, with WORKER_QUEUE_NAMES set to that queue and WORKER_THREADS to size it.
+    CBC_PROVIDER_QUEUES_ENABLED = os.environ.get("CBC_PROVIDER_QUEUES_ENABLED", "false").lower() == "true"
+    # How long the periodic link tests wait for each route to answer before counting it as failed
+    CBC_LINK_TEST_TIMEOUT_SECONDS = int(os.environ.get("CBC_LINK_TEST_TIMEOUT_SECONDS", 30))
+    # Use a local simulation of the CBC proxy lambdas instead of AWS, e.g. for load testing the send pipeline. The
+    # profile is JSON describing each route's latency and failure rates - see app/clients/cbc_lambda_simulator.py
+    CBC_LAMBDA_SIMULATOR_ENABLED = os.environ.get("CBC_LAMBDA_SIMULATOR_ENABLED", "false").lower() == "true"
+    CBC_LAMBDA_SIMULATOR_PROFILE = os.environ.get("CBC_LAMBDA_SIMULATOR_PROFILE")
+    # "digest" logs a hash, size and polygon counts for each lambda payload; "full" logs the payload itself.
+    # Full payloads can also be written once each to CBC_PROXY_PAYLOAD_LOG_FILE.
+    CBC_PROXY_PAYLOAD_LOGGING = os.environ.get("CBC_PROXY_PAYLOAD_LOGGING", "digest")
+    CBC_PROXY_PAYLOAD_LOG_FILE = os.environ.get("CBC_PROXY_PAYLOAD_LOG_FILE")
+    # Polygon coordinates sent to the CBCs are rounded to this many decimal places (6 is about 10cm)
+    CBC_COORDINATE_DECIMAL_PLACES = int(os.environ.get("CBC_COORDINATE_DECIMAL_PLACES", 6))
+    # "json" sends areas as a list of polygons. "delta-zlib" sends them delta encoded and compressed, which is much
+    # smaller for big alerts but needs proxy lambdas that can decode it - see app/clients/cbc_payload.py::decode_areas
+    CBC_PAYLOAD_AREAS_ENCODING = os.environ.get("CBC_PAYLOAD_AREAS_ENCODING", "json")
+    # Settings for the boto3 clients from app.aws_clients. A proxy lambda that hasn't answered within its read
+    # timeout is treated as failed and the broadcast is sent on the next route, so the timeout must be at least the
+    # proxy lambdas' own timeout - any shorter and a slow invocation that still reaches its CBC sends a duplicate
+    # alert. 60s is botocore's default. To try another route sooner, set CBC_PROXY_HEDGE_DELAY_SECONDS, which tries
+    # it alongside the slow one rather than giving up on it
+    AWS_CLIENT_MAX_POOL_CONNECTIONS = int(os.environ.get("AWS_CLIENT_MAX_POOL_CONNECTIONS", 20))
+    AWS_CLIENT_CONNECT_TIMEOUT_SECONDS = float(os.environ.get("AWS_CLIENT_CONNECT_TIMEOUT_SECONDS", 2))
+    AWS_CLIENT_READ_TIMEOUT_SECONDS = float(os.environ.get("AWS_CLIENT_READ_TIMEOUT_SECONDS", 30))
+    AWS_CLIENT_MAX_ATTEMPTS = int(os.environ.get("AWS_CLIENT_MAX_ATTEMPTS", 3))
+    CBC_PROXY_LAMBDA_READ_TIMEOUT_SECONDS = float(os.environ.get("CBC_PROXY_LAMBDA_READ_TIMEOUT_SECONDS", 60))
+    # How often workers write their per-actor metrics (see app/status/dramatiq_metrics.py)
+    DRAMATIQ_METRICS_FLUSH_INTERVAL_SECONDS = int(os.environ.get("DRAMATIQ_METRICS_FLUSH_INTERVAL_SECONDS", 60))
+    # Metrics recorded through app.metrics are buffered and sent to CloudWatch this often (see app/status/metrics.py)
+    METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "true").lower() != "false"
+    METRICS_FLUSH_INTERVAL_SECONDS = int(os.environ.get("METRICS_FLUSH_INTERVAL_SECONDS", 60))
 
     SQLALCHEMY_ENGINE_OPTIONS = {
         "pool_size": int(os.environ.get("SQLALCHEMY_POOL_SIZE", 5)),
@@ -146,6 +201,7 @@ class Config(object):
     QUEUE_PREFIX = ""  # Overidden in hosted for multitenancy
     DLQ_URL = os.environ.get("DLQ_URL")  # The DLQ URL to watch for retried tasks
     FAILED_QUEUE_URL = os.environ.get("FAILED_QUEUE_URL")  # The queue URL to post failed (post DLQ) tasks for analysis
+    DLQ_WATCHER_MAX_WORKERS = int(os.environ.get("DLQ_WATCHER_MAX_WORKERS", 4))  # Threads updating statuses per batch
 
     FROM_NUMBER = "development"
 
@@ -285,6 +341,7 @@ class Test(Config):
     ADMIN_EXTERNAL_URL = f"https://{TENANT}admin.{SUBDOMAIN}emergency-alerts.service.gov.uk"
     REPORTS_SLACK_WEBHOOK_URL = "https://hooks.slack.com/somewhere"
     CBC_PROXY_ENABLED = True
+    METRICS_ENABLED = False
 
     GOVUK_ALERTS_S3_BUCKET_NAME = "test-govuk-alerts-bucket"
 
@@ -3,8 +3,8 @@ from collections import Counter
 from datetime import datetime, timedelta, timezone
 
 from flask import current_app
-from sqlalchemy import and_, asc, case, desc, or_
-from sqlalchemy.orm import aliased
+from sqlalchemy import and_, asc, case, desc, or_, update
+from sqlalchemy.orm import aliased, joinedload, selectinload
 
 from app import db
 from app.dao.dao_utils import autocommit
@@ -23,6 +23,10 @@ from app.models import (
 )
 
 
+def dao_get_broadcast_message_by_id(broadcast_message_id):
+    return BroadcastMessage.query.filter(BroadcastMessage.id == broadcast_message_id).one()
+
+
 def dao_get_broadcast_message_by_id_and_service_id(broadcast_message_id, service_id):
     return BroadcastMessage.query.filter(
         BroadcastMessage.id == broadcast_message_id, BroadcastMessage.service_id == service_id
@@ -81,6 +85,31 @@ def dao_get_broadcast_event_by_id(broadcast_event_id) -> BroadcastEvent:
     return BroadcastEvent.query.filter(BroadcastEvent.id == broadcast_event_id).one()
 
 
+def dao_get_broadcast_event_for_sending(broadcast_event_id) -> BroadcastEvent:
+    """
+    Returns the BroadcastEvent along with everything send_broadcast_provider_message reads from it: the service and
+    its broadcast settings, the broadcast message, and every event for that message with their provider messages,
+    statuses and message numbers.
+
+    The service, settings and message are joined onto the event, and each collection is loaded with a single IN
+    query, so the number of queries doesn't grow with the number of earlier events or providers.
+    """
+    return (
+        BroadcastEvent.query.options(
+            joinedload(BroadcastEvent.service).joinedload(Service.service_broadcast_settings),
+            joinedload(BroadcastEvent.broadcast_message)
+            .selectinload(BroadcastMessage.events)
+            .selectinload(BroadcastEvent.provider_messages)
+            .options(
+                selectinload(BroadcastProviderMessage.statuses),
+                selectinload(BroadcastProviderMessage.broadcast_provider_message_number),
+            ),
+        )
+        .filter(BroadcastEvent.id == broadcast_event_id)
+        .one()
+    )
+
+
 def dao_get_broadcast_messages_for_service(service_id):
     return BroadcastMessage.query.filter(BroadcastMessage.service_id == service_id).order_by(
         BroadcastMessage.created_at
@@ -260,38 +289,67 @@ def dao_get_all_pre_broadcast_messages():
     )
 
 
-def dao_get_all_finished_broadcast_messages_with_outstanding_actions() -> list[BroadcastMessage]:
-    """
-    Find all BroadcastMessages that have finished (either expired or been cancelled)
-    and have one or more flags indicating actions due.
-    """
-
+def _finished_with_outstanding_actions_criteria():
     now = datetime.now(timezone.utc)
     return (
-        BroadcastMessage.query.join(Service)
-        .filter(
+        # The first two match the predicate of ix_broadcast_message_live_unacknowledged, so that it's used
+        BroadcastMessage.status.in_(BroadcastStatusType.LIVE_STATUSES),
+        BroadcastMessage.finished_govuk_acknowledged == False,  # noqa: E712
+        or_(
+            # Get those recently cancelled
+            BroadcastMessage.status == BroadcastStatusType.CANCELLED,
+            # Or have COMPLETED or are BROADCASTING and have naturally finished
+            # (Transitioning to COMPLETED occurs as a background activity)
+            BroadcastMessage.status == BroadcastStatusType.COMPLETED,
             and_(
-                or_(
-                    # Get those recently cancelled
-                    BroadcastMessage.status == BroadcastStatusType.CANCELLED,
-                    # Or have COMPLETED or are BROADCASTING and have naturally finished
-                    # (Transitioning to COMPLETED occurs as a background activity)
-                    BroadcastMessage.status == BroadcastStatusType.COMPLETED,
-                    and_(
-                        BroadcastMessage.finishes_at < now,
-                        BroadcastMessage.status == BroadcastStatusType.BROADCASTING,
-                    ),
-                ),
-                # And has an action due
-                BroadcastMessage.finished_govuk_acknowledged == False,  # noqa: E712
-                Service.restricted == False,  # noqa: E712
-                Service.active == True,  # noqa: E712
+                BroadcastMessage.finishes_at < now,
+                BroadcastMessage.status == BroadcastStatusType.BROADCASTING,
             ),
-        )
+        ),
+        Service.restricted == False,  # noqa: E712
+        Service.active == True,  # noqa: E712
+    )
+
+
+def dao_get_finished_broadcast_message_flags_with_outstanding_actions():
+    """
+    Find all BroadcastMessages, within active live services, that have finished (either expired or been cancelled)
+    and have one or more flags indicating actions due. Only the ID and action flags of each message are returned,
+    rather than the whole message, areas included.
+    """
+
+    return (
+        db.session.query(BroadcastMessage.id, BroadcastMessage.finished_govuk_acknowledged)
+        .join(Service)
+        .filter(*_finished_with_outstanding_actions_criteria())
         .all()
     )
 
 
+@autocommit
+def dao_expire_finished_broadcast_messages() -> list[uuid.UUID]:
+    """
+    Moves every broadcasting message that has reached its finishes_at to completed, flagging it for GOV.UK to
+    republish, in a single UPDATE. Returns the IDs of the messages expired.
+    """
+
+    result = db.session.execute(
+        update(BroadcastMessage)
+        .where(
+            BroadcastMessage.status == BroadcastStatusType.BROADCASTING,
+            BroadcastMessage.finishes_at <= datetime.now(),
+        )
+        .values(
+            status=BroadcastStatusType.COMPLETED,
+            finished_govuk_acknowledged=False,
+            updated_at=datetime.utcnow(),
+        )
+        .returning(BroadcastMessage.id)
+        .execution_options(synchronize_session=False)
+    )
+    return [row.id for row in result]
+
+
 def dao_get_public_messages_older_than(days):
     messages = (
         db.session.query(
@@ -311,20 +369,23 @@ def dao_get_public_messages_older_than(days):
     return [(str(row[0]), row[1]) for row in messages]
 
 
-def dao_mark_all_as_govuk_acknowledged():
+@autocommit
+def dao_mark_all_as_govuk_acknowledged() -> list[uuid.UUID]:
     """
     Find all BroadcastMessages, within active live services, that don't have the
-    finished_govuk_acknowledged flag and mark them as done.
+    finished_govuk_acknowledged flag and mark them as done, in a single UPDATE that
+    uses the same criteria as dao_get_finished_broadcast_message_flags_with_outstanding_actions.
+    Returns the IDs of the messages marked.
     """
 
-    pending = dao_get_all_finished_broadcast_messages_with_outstanding_actions()
-
-    for message in pending:
-        message.finished_govuk_acknowledged = True
-
-    db.session.commit()
-
-    return pending
+    result = db.session.execute(
+        update(BroadcastMessage)
+        .where(BroadcastMessage.service_id == Service.id, *_finished_with_outstanding_actions_criteria())
+        .values(finished_govuk_acknowledged=True)
+        .returning(BroadcastMessage.id)
+        .execution_options(synchronize_session=False)
+    )
+    return [row.id for row in result]
 
 
 def dao_purge_old_broadcast_messages(service, days_older_than=30, dry_run=False):
@@ -405,22 +466,6 @@ def dao_delete_records_for_broadcast(service, message_id, dry_run=False):
     return counter
 
 
-def get_earlier_events_for_broadcast_event(broadcast_event_id):
-    """
-    This is used to build up the references list.
-    """
-    this_event = BroadcastEvent.query.get(broadcast_event_id)
-
-    return (
-        BroadcastEvent.query.filter(
-            BroadcastEvent.broadcast_message_id == this_event.broadcast_message_id,
-            BroadcastEvent.sent_at < this_event.sent_at,
-        )
-        .order_by(BroadcastEvent.sent_at.asc())
-        .all()
-    )
-
-
 @autocommit
 def create_broadcast_provider_message(broadcast_event: BroadcastEvent, provider: str):
     broadcast_provider_message_status = BroadcastProviderMessageStatus(status=BROADCAST_PROVIDER_STATUS_SENDING)
@@ -3,7 +3,7 @@ from datetime import datetime, timezone
 from sqlalchemy.dialects.postgresql import insert as pg_insert
 
 from app import db
-from app.models import RouteAdvisor
+from app.models import RouteAdvisor, RouteCircuitState
 
 
 def dao_set_route_for_mno(mno, proxy, target):
@@ -24,5 +24,49 @@ def dao_set_route_for_mno(mno, proxy, target):
     db.session.commit()
 
 
+def dao_set_routes_for_mnos(routes):
+    """
+    Set the route for several MNOs in one statement. `routes` is a dict of MNO to a (proxy, target) tuple.
+    """
+    updated_at = datetime.now(timezone.utc)
+    sql = pg_insert(RouteAdvisor).values(
+        [
+            {"mno": mno, "proxy": proxy, "target": target, "updated_at": updated_at}
+            for mno, (proxy, target) in routes.items()
+        ]
+    )
+    sql = sql.on_conflict_do_update(
+        index_elements=["mno"],
+        set_={"proxy": sql.excluded.proxy, "target": sql.excluded.target, "updated_at": sql.excluded.updated_at},
+    )
+    db.session.execute(sql)
+    db.session.commit()
+
+
 def dao_get_route_for_mno(mno):
     return RouteAdvisor.query.filter_by(mno=mno).first()
+
+
+def dao_set_route_circuit_state(proxy, target, state, consecutive_failures, opened_at):
+    """
+    Written in its own transaction on its own connection rather than through db.session, as this is called in the
+    middle of sending a broadcast, where committing or rolling back the session would commit or throw away
+    whatever the send has pending and expire the objects it has loaded.
+    """
+    values = {
+        "state": state,
+        "consecutive_failures": consecutive_failures,
+        "opened_at": opened_at,
+        "updated_at": datetime.now(timezone.utc),
+    }
+    sql = (
+        pg_insert(RouteCircuitState)
+        .values(proxy=proxy, target=target, **values)
+        .on_conflict_do_update(index_elements=["proxy", "target"], set_=values)
+    )
+    with db.engine.begin() as connection:
+        connection.execute(sql)
+
+
+def dao_get_route_circuit_states():
+    return RouteCircuitState.query.order_by(RouteCircuitState.proxy, RouteCircuitState.target).all()
@@ -12,3 +12,23 @@ import app.tasks.stub_tasks  # noqa
 # By importing app we will have init-ed the flask_dramatiq package
 # ...and then we can steal its broker here for the worker process to import and make use of.
 broker = app.dramatiq.broker
+
+# Lets tasks see the message they're processing, e.g. to report how long it waited on the queue
+from dramatiq.middleware import CurrentMessage  # noqa: E402
+
+broker.add_middleware(CurrentMessage())
+
+# application.py calls the Flask app `application`; its `app` is the package
+from application import application as flask_app  # noqa: E402
+
+# Per-actor queue wait, execution time, retry and failure metrics, written as CloudWatch EMF log lines
+from app.status.dramatiq_metrics import ActorMetricsMiddleware  # noqa: E402
+
+broker.add_middleware(
+    ActorMetricsMiddleware(flush_interval=flask_app.config["DRAMATIQ_METRICS_FLUSH_INTERVAL_SECONDS"])
+)
+
+if flask_app.config["CBC_PROVIDER_QUEUES_ENABLED"]:
+    from app.tasks.broadcast_message_tasks import declare_provider_queues  # noqa: E402
+
+    declare_provider_queues(broker)
@@ -1,12 +1,13 @@
 import base64
 import json
 import logging
+from concurrent.futures import ThreadPoolExecutor
 
-import boto3
 from dramatiq.message import Message
 from emergency_alerts_utils.tasks import TaskNames
 from flask import current_app
 
+from app import aws_clients
 from app.dao.broadcast_message_dao import (
     add_broadcast_provider_message_status,
     dao_get_broadcast_event_by_id,
@@ -21,14 +22,27 @@ class DlqWatcher:
     Broadcasts tasks will have their BroadcastProviderMessageStatus updated accordingly to a 'permanently failed'
     status. Then all given messages/tasks will be put onto another queue for manual intervention.
 
+    Messages are received up to 10 (the SQS maximum) at a time. Their statuses are updated concurrently by up to
+    DLQ_WATCHER_MAX_WORKERS threads, and then the batch is forwarded and deleted in as few requests as SQS's size limits
+    allow. A message that couldn't be forwarded isn't deleted, so it will be received again once its visibility
+    timeout has passed.
+
     Assumes running under a Flask app context.
     """
 
+    # The most messages SQS will return from one receive, or accept in one batch request
+    BATCH_SIZE = 10
+    # The most SQS will accept in one batch request, across all of its messages. DLQ messages only carry ids and
+    # whatever dramatiq added to their options (such as the last traceback), so a full batch is normally far below it
+    MAX_BATCH_BYTES = 256 * 1024
+
     def __init__(self):
         self.logger = logging.getLogger(__name__)
-        self.sqs_client = boto3.client("sqs")
+        self.sqs_client = aws_clients.client("sqs")
         self.dlq_url = current_app.config["DLQ_URL"]
         self.failed_queue_url = current_app.config["FAILED_QUEUE_URL"]
+        self.max_workers = current_app.config["DLQ_WATCHER_MAX_WORKERS"]
+        self.app = current_app._get_current_object()
         self.stop = False
 
         assert self.dlq_url is not None, "DLQ_URL must be configured"
@@ -39,6 +53,7 @@ class DlqWatcher:
         response = self.sqs_client.receive_message(
             QueueUrl=self.dlq_url,
             WaitTimeSeconds=20,  # Long polling
+            MaxNumberOfMessages=self.BATCH_SIZE,
             MessageAttributeNames=["All"],
             AttributeNames=["All"],
         )
@@ -47,6 +62,22 @@ class DlqWatcher:
         self.logger.info("Got SQS messages: %s", messages)
         return messages
 
+    def process_messages(self, sqs_messages: list):
+        if not sqs_messages:
+            return
+
+        # Each thread needs its own app context (and so its own DB session)
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(sqs_messages))) as executor:
+            list(executor.map(self._process_sqs_message_with_app_context, sqs_messages))
+
+        # Regardless of 'processability', forward the messages to the failed SQS queue
+        forwarded_messages = self._send_to_failed_queue(sqs_messages)
+        self._delete_from_dlq(forwarded_messages)
+
+    def _process_sqs_message_with_app_context(self, sqs_message: dict):
+        with self.app.app_context():
+            self._process_sqs_message(sqs_message)
+
     def _process_sqs_message(self, sqs_message: dict):
         try:
             self.logger.info("Processing DLQ message %s", sqs_message["MessageId"])
@@ -64,22 +95,102 @@ class DlqWatcher:
                 self.logger.info("Was broadcast task, setting failed status")
                 self._add_final_failed_status(message.kwargs["broadcast_event_id"], message.kwargs["provider"])
         except Exception:
-            self.logger.warning("Failed to process as a Dramatiq message?", exc_info=True)
-        finally:
-            # Regardless of 'processability', forward the message to the failed SQS queue
-            self._send_to_failed_queue(sqs_message)
-            self.sqs_client.delete_message(QueueUrl=self.dlq_url, ReceiptHandle=sqs_message["ReceiptHandle"])
-
-    def _send_to_failed_queue(self, sqs_message):
+            self.logger.warning(
+                "Failed to process DLQ message %s as a Dramatiq message?", sqs_message.get("MessageId"), exc_info=True
+            )
+
+    def _send_to_failed_queue(self, sqs_messages: list) -> list:
+        """
+        Returns the messages that were sent successfully.
+
+        Messages are sent in batches that fit within SQS's limit on the total size of a batch request, in case an
+        unexpectedly large message would take a whole batch over it, and one at a time if a batch request fails
+        outright. Any message that isn't forwarded stays on the DLQ and is processed again when it's next received.
+        """
         # We don't send the body as base64 to make it easier to investigate in the console
         # Plus we keep the entire message intact, not just the Dramatiq JSON payload (e.g. attributes)
-        result = self.sqs_client.send_message(QueueUrl=self.failed_queue_url, MessageBody=json.dumps(sqs_message))
-        self.logger.info("Sent message to failed queue: %s", result)
+        bodies = [json.dumps(sqs_message) for sqs_message in sqs_messages]
+
+        forwarded_messages = []
+        batch, batch_bytes = [], 0
+        for sqs_message, body in zip(sqs_messages, bodies):
+            body_bytes = len(body.encode("utf-8"))
+            if batch and batch_bytes + body_bytes > self.MAX_BATCH_BYTES:
+                forwarded_messages += self._send_batch_to_failed_queue(batch)
+                batch, batch_bytes = [], 0
+            batch.append((sqs_message, body))
+            batch_bytes += body_bytes
+        if batch:
+            forwarded_messages += self._send_batch_to_failed_queue(batch)
+
+        return forwarded_messages
+
+    def _send_batch_to_failed_queue(self, batch: list) -> list:
+        try:
+            result = self.sqs_client.send_message_batch(
+                QueueUrl=self.failed_queue_url,
+                Entries=[{"Id": str(index), "MessageBody": body} for index, (_, body) in enumerate(batch)],
+            )
+        except Exception:
+            self.logger.exception(
+                "Failed to send batch of %s messages to failed queue, sending them one at a time", len(batch)
+            )
+            return [sqs_message for sqs_message, body in batch if self._send_one_to_failed_queue(sqs_message, body)]
+
+        self.logger.info("Sent messages to failed queue: %s", result)
+        for failure in result.get("Failed", []):
+            self.logger.error(
+                "Failed to send DLQ message %s to failed queue, leaving it on the DLQ: %s",
+                batch[int(failure["Id"])][0]["MessageId"],
+                failure,
+            )
+
+        return [batch[int(success["Id"])][0] for success in result.get("Successful", [])]
+
+    def _send_one_to_failed_queue(self, sqs_message: dict, body: str) -> bool:
+        try:
+            self.sqs_client.send_message(QueueUrl=self.failed_queue_url, MessageBody=body)
+        except Exception:
+            self.logger.exception(
+                "Failed to send DLQ message %s to failed queue, leaving it on the DLQ", sqs_message["MessageId"]
+            )
+            return False
+        return True
+
+    def _delete_from_dlq(self, sqs_messages: list):
+        if not sqs_messages:
+            return
+
+        try:
+            result = self.sqs_client.delete_message_batch(
+                QueueUrl=self.dlq_url,
+                Entries=[
+                    {"Id": str(index), "ReceiptHandle": sqs_message["ReceiptHandle"]}
+                    for index, sqs_message in enumerate(sqs_messages)
+                ],
+            )
+        except Exception:
+            self.logger.exception("Failed to delete %s messages from the DLQ", len(sqs_messages))
+            return
+
+        for failure in result.get("Failed", []):
+            self.logger.error(
+                "Failed to delete DLQ message %s: %s", sqs_messages[int(failure["Id"])]["MessageId"], failure
+            )
 
     def _add_final_failed_status(self, broadcast_event_id: str, provider: str):
         broadcast_event = dao_get_broadcast_event_by_id(broadcast_event_id)
         broadcast_provider_message = broadcast_event.get_provider_message(provider)
 
+        # A message that couldn't be forwarded is received again, and it should only be marked as failed once
+        latest_status = broadcast_provider_message.get_latest_status_entry()
+        if latest_status is not None and latest_status.status == BROADCAST_PROVIDER_STATUS_ERR_RETRY_EXHAUSTED:
+            self.logger.info(
+                "BroadcastProviderMessage ID: %s already has BROADCAST_PROVIDER_STATUS_ERR_RETRY_EXHAUSTED status",
+                broadcast_provider_message.id,
+            )
+            return
+
         add_broadcast_provider_message_status(
             broadcast_provider_message, status=BROADCAST_PROVIDER_STATUS_ERR_RETRY_EXHAUSTED
         )
@@ -92,8 +203,6 @@ class DlqWatcher:
         self.logger.info("Running DlqWatcher")
 
         while not self.stop:
-            messages = self.get_dlq_messages()
-            for message in messages:
-                self._process_sqs_message(message)
+            self.process_messages(self.get_dlq_messages())
 
         self.logger.info("DlqWatcher stopped")
@@ -901,6 +901,20 @@ class BroadcastMessage(db.Model):
             ["template_id", "template_version"],
             ["templates_history.id", "templates_history.version"],
         ),
+        # These keep the once a minute after-alert scan (see queue_after_alert_activities) small however many alerts
+        # have been sent, as only live alerts and those that GOV.UK hasn't yet acknowledged are indexed
+        Index(
+            "ix_broadcast_message_broadcasting_finishes_at",
+            "finishes_at",
+            postgresql_where=db.text("status = 'broadcasting'"),
+        ),
+        Index(
+            "ix_broadcast_message_live_unacknowledged",
+            "status",
+            postgresql_where=db.text(
+                "status IN ('broadcasting', 'completed', 'cancelled') AND finished_govuk_acknowledged = false"
+            ),
+        ),
         {},
     )
 
@@ -972,6 +986,10 @@ class BroadcastMessage(db.Model):
 
     stubbed = db.Column(db.Boolean, nullable=False)
 
+    # work done ahead of time while the message is pending approval, so that approving it has less to do.
+    # see app/broadcast_message/utils.py::stage_broadcast_message
+    staged_event = db.Column(JSONB(none_as_null=True), nullable=True)
+
     CheckConstraint("created_by_id is not null or created_by_api_key_id is not null")
 
     @property
@@ -1121,6 +1139,10 @@ class BroadcastEvent(db.Model):
     transmitted_starts_at = db.Column(db.DateTime, nullable=True)
     transmitted_finishes_at = db.Column(db.DateTime, nullable=True)
 
+    # the provider-independent part of the CBC proxy payload, built once before the event is sent to each provider.
+    # see app/clients/cbc_payload.py::StagedBroadcastPayload
+    staged_payload = db.Column(JSONB(none_as_null=True), nullable=True)
+
     @property
     def reference(self):
         notify_email_domain = current_app.config["NOTIFY_EMAIL_DOMAIN"]
@@ -1149,11 +1171,12 @@ class BroadcastEvent(db.Model):
         Return the full provider_message object rather than just an identifier, since the different providers expect
         reference to contain different things - let the cbc_proxy work out what information is relevant.
         """
-        from app.dao.broadcast_message_dao import (
-            get_earlier_events_for_broadcast_event,
+        # Use the events already loaded on the broadcast message (see dao_get_broadcast_event_for_sending) rather
+        # than querying for them again
+        earlier_events = sorted(
+            (event for event in self.broadcast_message.events if event.sent_at < self.sent_at),
+            key=lambda event: event.sent_at,
         )
-
-        earlier_events = [event for event in get_earlier_events_for_broadcast_event(self.id)]
         ret = []
         for event in earlier_events:
             provider_message = event.get_provider_message(provider)
@@ -1522,3 +1545,29 @@ class RouteAdvisor(db.Model):
             "target": self.target,
             "updated_at": self.updated_at,
         }
+
+
+class RouteCircuitState(db.Model):
+    """
+    The last circuit breaker state change recorded by a worker for a route between our infrastructure and a CBC.
+    Workers decide locally whether to skip a route; this table is only so that the state can be reported.
+    """
+
+    __tablename__ = "route_circuit_state"
+
+    proxy = db.Column(db.String(255), primary_key=True)
+    target = db.Column(db.String(255), primary_key=True)
+    state = db.Column(db.String(255), nullable=False)
+    consecutive_failures = db.Column(db.Integer, nullable=False, default=0)
+    opened_at = db.Column(db.DateTime(timezone=True), nullable=True)
+    updated_at = db.Column(db.DateTime(timezone=True), nullable=False)
+
+    def serialize(self):
+        return {
+            "proxy": self.proxy,
+            "target": self.target,
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "opened_at": self.opened_at,
+            "updated_at": self.updated_at,
+        }
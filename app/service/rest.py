@@ -1,11 +1,11 @@
 import os
 from datetime import datetime, timedelta, timezone
 
-import boto3
 from flask import Blueprint, current_app, jsonify, request
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm.exc import NoResultFound
 
+from app import aws_clients
 from app.dao.api_key_dao import (
     expire_api_key,
     get_model_api_keys,
@@ -391,7 +391,7 @@ def purge_govuk_s3_bucket(older_than):
 
     try:
         bucket = current_app.config["GOVUK_ALERTS_S3_BUCKET_NAME"]
-        s3 = boto3.client("s3")
+        s3 = aws_clients.client("s3")
         prefix = "alerts/"
         cutoff = datetime.now(timezone.utc) - timedelta(days=older_than)
         paginator = s3.get_paginator("list_objects_v2")
@@ -0,0 +1,148 @@
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+
+from dramatiq.middleware import Middleware
+from emergency_alerts_utils.tasks import TaskNames
+
+NAMESPACE = "Emergency Alerts/Dramatiq"
+# CloudWatch takes at most 100 values for a metric in one EMF log line
+MAX_VALUES_PER_LINE = 100
+# Actors whose metrics are also broken down by their provider argument
+PROVIDER_TAGGED_ACTORS = {TaskNames.SEND_BROADCAST_PROVIDER_MESSAGE}
+
+logger = logging.getLogger(__name__)
+
+# EMF lines have to reach stdout as bare JSON for CloudWatch to pick them up, so they get a logger of their own
+# rather than going through the app's log formatting
+emf_logger = logging.getLogger("dramatiq_metrics")
+emf_logger.propagate = False
+if not emf_logger.handlers:
+    _handler = logging.StreamHandler(sys.stdout)
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    emf_logger.addHandler(_handler)
+    emf_logger.setLevel(logging.INFO)
+
+
+class ActorMetricsMiddleware(Middleware):
+    """
+    Measures every message a worker processes: how long it waited between being enqueued and starting, how long it
+    ran for, how many times it had been retried and whether it failed. send_broadcast_provider_message is also
+    broken down by provider.
+
+    Measurements are batched per actor (and provider) and written as CloudWatch Embedded Metric Format log lines
+    by a background thread every flush_interval seconds, so CloudWatch turns them into metrics without any API
+    calls. As with MetricsBuffer, the thread is started when the first message is measured in a process, so that
+    each forked worker process gets its own, and a quiet worker's last messages aren't held until the next one
+    arrives. A batch is also written as soon as it reaches the most values CloudWatch takes in a line, and whatever
+    is left when the worker shuts down. Queue wait is measured from when the message was first enqueued, so for a
+    retry it includes the earlier attempts.
+    """
+
+    def __init__(self, flush_interval=60):
+        self.flush_interval = flush_interval
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._batches = defaultdict(_new_batch)
+        self._thread = None
+        self._thread_pid = None
+
+    def before_process_message(self, broker, message):
+        self._local.started = (time.time(), time.perf_counter())
+
+    def after_process_message(self, broker, message, *, result=None, exception=None):
+        started = getattr(self._local, "started", None)
+        if started is None:
+            return
+        self._local.started = None
+        started_at, started_perf = started
+
+        key = (message.actor_name, _get_provider(message))
+        with self._lock:
+            batch = self._batches[key]
+            batch["QueueWaitTime"].append(max(0, round(started_at * 1000) - message.message_timestamp))
+            batch["ExecutionTime"].append(round((time.perf_counter() - started_perf) * 1000, 3))
+            batch["Retries"].append(message.options.get("retries", 0))
+            batch["Messages"] += 1
+            batch["Failures"] += exception is not None
+            should_flush = len(batch["ExecutionTime"]) >= MAX_VALUES_PER_LINE
+
+        self._ensure_flush_thread()
+        if should_flush:
+            self.flush()
+
+    # Skipped messages (e.g. expired ones) never run, so after_process_message isn't called for them
+    def after_skip_message(self, broker, message):
+        self._local.started = None
+
+    def after_worker_shutdown(self, broker, worker):
+        self.flush()
+
+    def flush(self):
+        with self._lock:
+            batches, self._batches = self._batches, defaultdict(_new_batch)
+
+        timestamp = round(time.time() * 1000)
+        for (actor_name, provider), batch in batches.items():
+            emf_logger.info(json.dumps(_emf_line(timestamp, actor_name, provider, batch)))
+
+    def _ensure_flush_thread(self):
+        if self._thread_pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread_pid == os.getpid():
+                return
+            self._thread_pid = os.getpid()
+            self._thread = threading.Thread(target=self._flush_periodically, name="dramatiq-metrics-flush", daemon=True)
+            self._thread.start()
+
+    def _flush_periodically(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Failed to flush dramatiq metrics", extra={"python_module": __name__})
+
+
+def _new_batch():
+    return {"QueueWaitTime": [], "ExecutionTime": [], "Retries": [], "Messages": 0, "Failures": 0}
+
+
+def _get_provider(message):
+    if message.actor_name in PROVIDER_TAGGED_ACTORS:
+        return message.kwargs.get("provider")
+    return None
+
+
+def _emf_line(timestamp, actor_name, provider, batch):
+    dimensions = [["Actor"]]
+    line = {"Actor": actor_name}
+    if provider is not None:
+        dimensions.append(["Actor", "Provider"])
+        line["Provider"] = provider
+
+    return {
+        "_aws": {
+            "Timestamp": timestamp,
+            "CloudWatchMetrics": [
+                {
+                    "Namespace": NAMESPACE,
+                    "Dimensions": dimensions,
+                    "Metrics": [
+                        {"Name": "QueueWaitTime", "Unit": "Milliseconds"},
+                        {"Name": "ExecutionTime", "Unit": "Milliseconds"},
+                        {"Name": "Retries", "Unit": "Count"},
+                        {"Name": "Messages", "Unit": "Count"},
+                        {"Name": "Failures", "Unit": "Count"},
+                    ],
+                }
+            ],
+        },
+        **line,
+        **batch,
+    }
@@ -1,9 +1,12 @@
-import boto3
+from datetime import datetime, timedelta, timezone
+
 from flask import Blueprint, jsonify
 
-from app import current_app, db, version
+from app import aws_clients, current_app, db, metrics, version
 from app.authentication.auth import requires_admin_auth
+from app.clients.cbc_circuit_breaker import CIRCUIT_HALF_OPEN, CIRCUIT_OPEN
 from app.dao.organisation_dao import dao_count_organisations_with_live_services
+from app.dao.route_advisor_dao import dao_get_route_circuit_states
 from app.dao.services_dao import dao_count_live_services
 from app.errors import register_errors
 
@@ -36,6 +39,24 @@ def full_api_status():
     )
 
 
+@status.route("/_api_status/cbc-routes", methods=["GET"])
+def cbc_route_status():
+    # Restricted in the same way as the full status, as it exposes internal routing details
+    requires_admin_auth()
+
+    # Circuits are only recorded when they open or close; one that has been open for longer than the reset
+    # period is half-open, and the next send or link test to reach it will probe it
+    reset_before = datetime.now(timezone.utc) - timedelta(seconds=current_app.config["CBC_ROUTE_BREAKER_RESET_SECONDS"])
+    routes = []
+    for circuit in dao_get_route_circuit_states():
+        route = circuit.serialize()
+        if circuit.state == CIRCUIT_OPEN and circuit.opened_at < reset_before:
+            route["state"] = CIRCUIT_HALF_OPEN
+        routes.append(route)
+
+    return jsonify(routes=routes), 200
+
+
 @status.route("/_api_status/live-service-and-organisation-counts")
 def live_service_and_organisation_counts():
     return (
@@ -53,53 +74,57 @@ def get_db_version():
     return full_name
 
 
+# The post_*_to_cloudwatch functions record their metrics in app.metrics, which sends them in its next batch
 def post_app_version_to_cloudwatch():
-    try:
-        boto3.client("cloudwatch").put_metric_data(
-            MetricData=[
-                {
-                    "MetricName": "AppVersion",
-                    "Dimensions": [
-                        {
-                            "Name": "Application",
-                            "Value": current_app.config["SERVICE"],
-                        },
-                        {
-                            "Name": "Version",
-                            "Value": version.app_version,
-                        },
-                    ],
-                    "Unit": "Count",
-                    "Value": 1,
-                }
-            ],
-            Namespace="Emergency Alerts",
-        )
-    except Exception:
-        current_app.logger.exception("Couldn't post app version to CloudWatch. App version: %s", version.app_version)
+    metrics.gauge(
+        "AppVersion", 1, dimensions={"Application": current_app.config["SERVICE"], "Version": version.app_version}
+    )
 
 
 def post_db_version_to_cloudwatch(db_version: str):
-    try:
-        boto3.client("cloudwatch").put_metric_data(
-            MetricData=[
-                {
-                    "MetricName": "DBVersion",
-                    "Dimensions": [
-                        {
-                            "Name": "Application",
-                            "Value": current_app.config["SERVICE"],
-                        },
-                        {
-                            "Name": "Version",
-                            "Value": db_version,
-                        },
-                    ],
-                    "Unit": "Count",
-                    "Value": 1,
-                }
-            ],
-            Namespace="Emergency Alerts",
+    metrics.gauge("DBVersion", 1, dimensions={"Application": current_app.config["SERVICE"], "Version": db_version})
+
+
+def post_provider_queue_depths_to_cloudwatch():
+    # Import here as the tasks can't be imported until the app has been created
+    from app.tasks.broadcast_message_tasks import provider_queue_name
+
+    sqs_client = aws_clients.client("sqs")
+    for provider in sorted(current_app.config["ENABLED_CBCS"]):
+        queue_name = provider_queue_name(provider)
+        try:
+            queue_url = sqs_client.get_queue_url(QueueName=f"{current_app.config['QUEUE_PREFIX']}{queue_name}")[
+                "QueueUrl"
+            ]
+            attributes = sqs_client.get_queue_attributes(
+                QueueUrl=queue_url,
+                AttributeNames=["ApproximateNumberOfMessages", "ApproximateNumberOfMessagesNotVisible"],
+            )["Attributes"]
+        except Exception:
+            current_app.logger.exception("Couldn't get depth of queue %s", queue_name)
+            continue
+
+        waiting = int(attributes["ApproximateNumberOfMessages"])
+        in_flight = int(attributes["ApproximateNumberOfMessagesNotVisible"])
+        current_app.logger.info(
+            f"Queue {queue_name} has {waiting} messages waiting and {in_flight} in flight",
+            extra={
+                "queue_name": queue_name,
+                "cbc_provider": provider,
+                "messages_waiting": waiting,
+                "messages_in_flight": in_flight,
+                "python_module": __name__,
+            },
+        )
+        metrics.gauge("ProviderQueueDepth", waiting, dimensions={"Provider": provider})
+        metrics.gauge("ProviderQueueInFlight", in_flight, dimensions={"Provider": provider})
+
+
+def post_aws_client_counts_to_cloudwatch():
+    # Clients are reused, so a count that keeps climbing means something is creating them per call
+    for service_name, count in sorted(aws_clients.clients_created.items()):
+        metrics.gauge(
+            "AwsClientsCreated",
+            count,
+            dimensions={"Application": current_app.config["SERVICE"], "AwsService": service_name},
         )
-    except Exception:
-        current_app.logger.exception("Couldn't post DB version to CloudWatch. DB version: %s", db_version)
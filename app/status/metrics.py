@@ -0,0 +1,155 @@
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+DEFAULT_NAMESPACE = "Emergency Alerts"
+# The most metrics CloudWatch accepts in one put_metric_data call
+MAX_METRICS_PER_REQUEST = 1000
+# The most distinct values CloudWatch accepts in one metric's Values/Counts
+MAX_VALUES_PER_METRIC = 150
+
+logger = logging.getLogger(__name__)
+
+
+class MetricsBuffer:
+    """
+    The one place the app records metrics. Counters are summed, gauges keep their latest value and timings keep
+    every value (so CloudWatch can work out percentiles), per metric name, unit and dimensions, and everything
+    recorded is sent to CloudWatch in batches by a background thread every METRICS_FLUSH_INTERVAL_SECONDS. Recording
+    only takes a lock and updates a dict, so it's cheap enough to do on hot paths.
+
+        metrics.increment("BroadcastsSent", dimensions={"Provider": "ee"})
+        metrics.gauge("ProviderQueueDepth", 12, dimensions={"Provider": "ee"})
+        with metrics.timer("CapValidation"):
+            ...
+
+    The thread is started when the first metric is recorded in a process (so each forked worker gets its own), and
+    anything still buffered is flushed when the process exits. Nothing is recorded if METRICS_ENABLED is off.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.flush_interval = 60
+        self._lock = threading.Lock()
+        self._counters = Counter()
+        self._gauges = {}
+        self._timings = defaultdict(list)
+        self._thread = None
+        self._thread_pid = None
+
+    def init_app(self, app):
+        self.enabled = app.config["METRICS_ENABLED"]
+        self.flush_interval = app.config["METRICS_FLUSH_INTERVAL_SECONDS"]
+        if self.enabled:
+            atexit.register(self.flush)
+
+    def increment(self, name, value=1, dimensions=None, namespace=DEFAULT_NAMESPACE):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[_key(namespace, name, "Count", dimensions)] += value
+        self._ensure_flush_thread()
+
+    def gauge(self, name, value, unit="Count", dimensions=None, namespace=DEFAULT_NAMESPACE):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._gauges[_key(namespace, name, unit, dimensions)] = value
+        self._ensure_flush_thread()
+
+    def timing(self, name, milliseconds, dimensions=None, namespace=DEFAULT_NAMESPACE):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._timings[_key(namespace, name, "Milliseconds", dimensions)].append(milliseconds)
+        self._ensure_flush_thread()
+
+    @contextmanager
+    def timer(self, name, dimensions=None, namespace=DEFAULT_NAMESPACE):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timing(name, (time.perf_counter() - start) * 1000, dimensions=dimensions, namespace=namespace)
+
+    def flush(self):
+        with self._lock:
+            counters, self._counters = self._counters, Counter()
+            gauges, self._gauges = self._gauges, {}
+            timings, self._timings = self._timings, defaultdict(list)
+
+        timestamp = datetime.now(timezone.utc)
+        metric_data = defaultdict(list)
+        for (namespace, name, unit, dimensions), value in [*counters.items(), *gauges.items()]:
+            metric_data[namespace].append(_datum(name, unit, dimensions, timestamp, Value=value))
+        for (namespace, name, unit, dimensions), values in timings.items():
+            counts = sorted(Counter(round(value, 3) for value in values).items())
+            for start in range(0, len(counts), MAX_VALUES_PER_METRIC):
+                chunk = counts[start : start + MAX_VALUES_PER_METRIC]
+                metric_data[namespace].append(
+                    _datum(
+                        name,
+                        unit,
+                        dimensions,
+                        timestamp,
+                        Values=[value for value, _ in chunk],
+                        Counts=[count for _, count in chunk],
+                    )
+                )
+
+        if metric_data:
+            self._put_metric_data(metric_data)
+
+    def _put_metric_data(self, metric_data):
+        # Import here as app imports this module when it's created
+        from app import aws_clients
+
+        for namespace, data in metric_data.items():
+            for start in range(0, len(data), MAX_METRICS_PER_REQUEST):
+                try:
+                    aws_clients.client("cloudwatch").put_metric_data(
+                        Namespace=namespace, MetricData=data[start : start + MAX_METRICS_PER_REQUEST]
+                    )
+                except Exception:
+                    # Metrics are best effort, so these are dropped rather than held on to
+                    logger.exception(
+                        "Couldn't post metrics to CloudWatch",
+                        extra={"namespace": namespace, "metric_count": len(data), "python_module": __name__},
+                    )
+
+    def _ensure_flush_thread(self):
+        if self._thread_pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread_pid == os.getpid():
+                return
+            self._thread_pid = os.getpid()
+            self._thread = threading.Thread(target=self._flush_periodically, name="metrics-flush", daemon=True)
+            self._thread.start()
+
+    def _flush_periodically(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Failed to flush metrics", extra={"python_module": __name__})
+
+
+def _key(namespace, name, unit, dimensions):
+    return namespace, name, unit, tuple((dimensions or {}).items())
+
+
+def _datum(name, unit, dimensions, timestamp, **values):
+    return {
+        "MetricName": name,
+        "Dimensions": [{"Name": dimension, "Value": str(value)} for dimension, value in dimensions],
+        "Timestamp": timestamp,
+        "Unit": unit,
+        **values,
+    }
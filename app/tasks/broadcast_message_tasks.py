@@ -1,17 +1,28 @@
-from datetime import datetime, timezone
-
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+
+import requests
+import urllib3
+from dramatiq import Retry
+from dramatiq.middleware import CurrentMessage
 from dramatiq.threading import Interrupt
 from emergency_alerts_utils.tasks import QueueNames, TaskNames
 from emergency_alerts_utils.xml.common import HEADLINE
 from flask import current_app
 
 from app import cbc_proxy_client, dramatiq
+from app.clients.cbc_payload import StagedBroadcastPayload
 from app.clients.cbc_proxy import CBCProxyRetryableException
 from app.dao.broadcast_message_dao import (
     add_broadcast_provider_message_status,
     create_broadcast_provider_message,
     dao_get_broadcast_event_by_id,
+    dao_get_broadcast_event_for_sending,
+    dao_get_broadcast_message_by_id,
 )
+from app.dao.dao_utils import dao_save_object
 from app.models import (
     BROADCAST_PROVIDER_STATUS_ACK,
     BROADCAST_PROVIDER_STATUS_ERR,
@@ -24,11 +35,54 @@ from app.models import (
 from app.tasks.stub_tasks import publish_govuk_alerts
 from app.utils import format_sequential_number, is_local_host
 
+# Not yet in emergency_alerts_utils.tasks.TaskNames
+CREATE_P1_ZENDESK_ALERT = "create-p1-zendesk-alert"
+RUN_LINK_TESTS = "run-link-tests"
+
 
 class BroadcastIntegrityError(Exception):
     pass
 
 
+class SideEffectRetryableException(Exception):
+    pass
+
+
+class CBCProxyRetryScheduled(CBCProxyRetryableException, Retry):
+    """
+    A retryable CBC proxy failure that carries the delay, in milliseconds, before the send should be tried again
+    """
+
+    def __init__(self, message, delay):  # noqa: B042
+        Retry.__init__(self, message, delay=delay)
+
+
+# Retries start quickly, as most failures to reach a CBC are momentary, and back off after a few attempts
+RETRY_FAST_ATTEMPTS = 3
+RETRY_FAST_INITIAL_DELAY_MS = 1_000
+RETRY_BACKOFF_INITIAL_DELAY_MS = 15_000
+RETRY_MAX_DELAY_MS = 300_000
+
+
+def get_retry_delay_ms(attempt, expires_at, now=None):
+    """
+    How long to wait before retrying a send to a provider after the given (1-based) attempt has failed, or None if
+    the broadcast will have expired by then and there's no point retrying.
+
+    Delays are jittered so that retries for every provider (and every worker) don't all land at the same instant.
+    """
+    if attempt <= RETRY_FAST_ATTEMPTS:
+        delay = RETRY_FAST_INITIAL_DELAY_MS * 2 ** (attempt - 1)
+    else:
+        delay = min(RETRY_BACKOFF_INITIAL_DELAY_MS * 2 ** (attempt - RETRY_FAST_ATTEMPTS - 1), RETRY_MAX_DELAY_MS)
+    delay = round(delay / 2 + random.uniform(0, delay / 2))
+
+    now = now or datetime.now(timezone.utc)
+    if now + timedelta(milliseconds=delay) >= expires_at.replace(tzinfo=timezone.utc):
+        return None
+    return delay
+
+
 def _check_event_is_authorised_to_be_sent(broadcast_event, provider):
     if not broadcast_event.service.active:
         raise BroadcastIntegrityError(
@@ -116,19 +170,27 @@ def send_broadcast_event(broadcast_event_id):
         publish_task = publish_govuk_alerts.send(broadcast_event_id=broadcast_event_id)
         current_app.logger.info("Enqueued publish GOV UK Alerts: %s", publish_task.asdict())
 
+        if broadcast_event.message_type != BroadcastEventMessageType.CANCEL and not broadcast_event.staged_payload:
+            _stage_broadcast_payload(broadcast_event)
+
         providers = broadcast_event.service.get_available_broadcast_providers()
+        concurrent_dispatch = current_app.config["CBC_CONCURRENT_PROVIDER_DISPATCH"]
         current_app.logger.info(
             "Send broadcast event",
             extra={
                 "broadcast_event_id": broadcast_event_id,
                 "message_type": broadcast_event.message_type,
                 "providers": "|".join(providers),
+                "concurrent_dispatch": concurrent_dispatch,
                 "python_module": __name__,
             },
         )
 
-        for provider in providers:
-            send_broadcast_provider_message.send(broadcast_event_id=broadcast_event_id, provider=provider)
+        if concurrent_dispatch and providers:
+            _send_to_providers_concurrently(broadcast_event_id, providers)
+        else:
+            for provider in providers:
+                queue_broadcast_provider_message(broadcast_event_id, provider)
     except Exception as e:
         current_app.logger.exception(
             f"Failed to send broadcast (event id {broadcast_event_id})",
@@ -141,14 +203,135 @@ def send_broadcast_event(broadcast_event_id):
         raise
 
 
+def _stage_broadcast_payload(broadcast_event):
+    """
+    Build the part of the payload that's the same for every provider once, here, rather than in each of the
+    provider tasks. Staging is only an optimisation - a provider task builds the payload itself if the event hasn't
+    been staged - so a failure here is logged rather than getting in the way of the send.
+    """
+    try:
+        broadcast_event.staged_payload = StagedBroadcastPayload.for_broadcast_event(broadcast_event).serialize()
+        dao_save_object(broadcast_event)
+    except Exception:
+        current_app.logger.exception(
+            "Failed to stage broadcast payload, providers will build it themselves",
+            extra={"broadcast_event_id": broadcast_event.id, "python_module": __name__},
+        )
+
+
+def _send_to_providers_concurrently(broadcast_event_id, providers):
+    """
+    Send to every provider from this task, each in its own thread, rather than queueing a
+    send_broadcast_provider_message task per provider. This saves a queue round trip per provider, and means one
+    provider can't be held up waiting for a worker thread that another provider's task is occupying.
+
+    Each provider still gets its own broadcast_provider_message and statuses. A provider whose send fails with a
+    CBCProxyRetryableException is handed to its own send_broadcast_provider_message task, which retries it exactly
+    as it would have been retried had it been queued in the first place. Other failures aren't retried, just as
+    the task wouldn't retry them.
+    """
+    app = current_app._get_current_object()
+
+    def send(provider):
+        with app.app_context():
+            _send_broadcast_provider_message(broadcast_event_id=broadcast_event_id, provider=provider)
+
+    max_workers = min(len(providers), current_app.config["CBC_CONCURRENT_PROVIDER_DISPATCH_MAX_WORKERS"])
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="cbc-provider-dispatch") as executor:
+        futures = {executor.submit(send, provider): provider for provider in providers}
+        for future in as_completed(futures):
+            provider = futures[future]
+            exception = future.exception()
+            if exception is None:
+                continue
+
+            if not isinstance(exception, CBCProxyRetryableException):
+                # Not something a retry would fix (e.g. a BroadcastIntegrityError), so as with a queued task the
+                # provider message is left in its failed state
+                current_app.logger.exception(
+                    "Concurrent send failed and can't be retried",
+                    exc_info=exception,
+                    extra={
+                        "broadcast_event_id": broadcast_event_id,
+                        "cbc_provider": provider,
+                        "python_module": __name__,
+                    },
+                )
+                continue
+
+            current_app.logger.info(
+                "Concurrent send failed, queueing broadcast_provider_message task to retry",
+                extra={
+                    "broadcast_event_id": broadcast_event_id,
+                    "cbc_provider": provider,
+                    "python_module": __name__,
+                },
+            )
+            queue_broadcast_provider_message(broadcast_event_id, provider)
+
+
+def provider_queue_name(provider):
+    return f"{QueueNames.HIGH_PRIORITY}-{provider}"
+
+
+def declare_provider_queues(broker):
+    """
+    Declare the per-provider send queues on a broker, so that workers can consume from them
+    """
+    for provider in BroadcastProvider.PROVIDERS:
+        broker.declare_queue(provider_queue_name(provider))
+
+
+def queue_broadcast_provider_message(broadcast_event_id, provider):
+    """
+    Queue a send_broadcast_provider_message task for a provider.
+
+    With CBC_PROVIDER_QUEUES_ENABLED, each provider's tasks, and their retries, go on a queue of the provider's own
+    rather than the shared high priority queue. Each queue can then be given workers of its own, so a provider that
+    is slow or failing can't hold up sends to the others by occupying every worker thread.
+    """
+    if not current_app.config["CBC_PROVIDER_QUEUES_ENABLED"]:
+        return send_broadcast_provider_message.send(broadcast_event_id=broadcast_event_id, provider=provider)
+
+    queue_name = provider_queue_name(provider)
+    broker = send_broadcast_provider_message.broker
+    broker.declare_queue(queue_name)
+    message = send_broadcast_provider_message.message_with_options(
+        kwargs={"broadcast_event_id": broadcast_event_id, "provider": provider}
+    )
+    return broker.enqueue(message.copy(queue_name=queue_name))
+
+
 @dramatiq.actor(
     actor_name=TaskNames.SEND_BROADCAST_PROVIDER_MESSAGE,
     queue_name=QueueNames.HIGH_PRIORITY,
     allow_retry=True,
     retry_for={CBCProxyRetryableException, Interrupt},
+    # Retries stop when get_retry_delay_ms says the broadcast will have expired, not after a fixed number - dramatiq's
+    # default of 20 would give up after about an hour, long before a multi-hour broadcast ends
+    max_retries=None,
 )
 # Note: Adjusting the args? You may need to edit DlqWatcher accordingly
 def send_broadcast_provider_message(*, broadcast_event_id, provider):
+    message = CurrentMessage.get_current_message()
+    if message is not None:
+        current_app.logger.info(
+            "Picked up broadcast_provider_message task",
+            extra={
+                "broadcast_event_id": broadcast_event_id,
+                "cbc_provider": provider,
+                "queue_name": message.queue_name,
+                # time since the task was first queued, including any retries
+                "queue_wait_ms": round(time.time() * 1000) - message.message_timestamp,
+                "retries": message.options.get("retries", 0),
+                "python_module": __name__,
+            },
+        )
+
+    _send_broadcast_provider_message(broadcast_event_id=broadcast_event_id, provider=provider)
+
+
+def _send_broadcast_provider_message(*, broadcast_event_id, provider):
     if not current_app.config["CBC_PROXY_ENABLED"]:
         current_app.logger.info(
             "CBC Proxy disabled, unable to send broadcast_provider_message",
@@ -160,10 +343,11 @@ def send_broadcast_provider_message(*, broadcast_event_id, provider):
         )
         return
 
+    broadcast_event = None
     broadcast_provider_message = None
 
     try:
-        broadcast_event = dao_get_broadcast_event_by_id(broadcast_event_id)
+        broadcast_event = dao_get_broadcast_event_for_sending(broadcast_event_id)
 
         _check_event_is_authorised_to_be_sent(broadcast_event, provider)
         _check_event_makes_sense_in_sequence(broadcast_event, provider)
@@ -172,7 +356,11 @@ def send_broadcast_provider_message(*, broadcast_event_id, provider):
         broadcast_provider_message = broadcast_event.get_provider_message(provider)
         is_retry = broadcast_provider_message is not None
         if broadcast_provider_message is None:
-            broadcast_provider_message = create_broadcast_provider_message(broadcast_event, provider)
+            create_broadcast_provider_message(broadcast_event, provider)
+            # Committing the new provider message expires everything in the session, so load the event graph again
+            # in one go rather than lazily, one relationship at a time
+            broadcast_event = dao_get_broadcast_event_for_sending(broadcast_event_id)
+            broadcast_provider_message = broadcast_event.get_provider_message(provider)
 
         formatted_message_number = None
         if provider == BroadcastProvider.VODAFONE:
@@ -190,21 +378,15 @@ def send_broadcast_provider_message(*, broadcast_event_id, provider):
             },
         )
 
-        areas = [{"polygon": polygon} for polygon in broadcast_event.transmitted_areas["simple_polygons"]]
-
         cbc_proxy_provider_client = cbc_proxy_client.get_proxy(provider)
 
-        if not is_local_host():
+        # Locally there are no lambdas to call, unless they're being simulated
+        if not is_local_host() or current_app.config["CBC_LAMBDA_SIMULATOR_ENABLED"]:
             if broadcast_event.message_type == BroadcastEventMessageType.ALERT:
-                cbc_proxy_provider_client.create_and_send_broadcast(
+                cbc_proxy_provider_client.send_staged_broadcast(
                     identifier=str(broadcast_provider_message.id),
                     message_number=formatted_message_number,
-                    headline=HEADLINE,
-                    description=broadcast_event.transmitted_content["body"],
-                    areas=areas,
-                    sent=broadcast_event.sent_at_as_cap_datetime_string,
-                    expires=broadcast_event.transmitted_finishes_at_as_cap_datetime_string,
-                    channel=broadcast_event.service.broadcast_channel,
+                    staged_payload=StagedBroadcastPayload.for_broadcast_event(broadcast_event),
                 )
             elif broadcast_event.message_type == BroadcastEventMessageType.UPDATE:
                 cbc_proxy_provider_client.update_and_send_broadcast(
@@ -212,7 +394,7 @@ def send_broadcast_provider_message(*, broadcast_event_id, provider):
                     message_number=formatted_message_number,
                     headline=HEADLINE,
                     description=broadcast_event.transmitted_content["body"],
-                    areas=areas,
+                    areas=[{"polygon": polygon} for polygon in broadcast_event.transmitted_areas["simple_polygons"]],
                     previous_provider_messages=broadcast_event.get_earlier_provider_messages(provider),
                     sent=broadcast_event.sent_at_as_cap_datetime_string,
                     expires=broadcast_event.transmitted_finishes_at_as_cap_datetime_string,
@@ -246,14 +428,107 @@ def send_broadcast_provider_message(*, broadcast_event_id, provider):
             },
         )
 
+        error_detail = {"exception": exception_detail}
+        retryable = isinstance(e, (CBCProxyRetryableException, Interrupt)) and broadcast_event is not None
+        if retryable:
+            message = CurrentMessage.get_current_message()
+            attempt = message.options.get("retries", 0) + 1 if message is not None else 1
+            retry_delay = get_retry_delay_ms(attempt, broadcast_event.transmitted_finishes_at)
+            error_detail["attempt"] = attempt
+            error_detail["retry_in_ms"] = retry_delay
+
         if broadcast_provider_message is not None:
             add_broadcast_provider_message_status(
                 broadcast_provider_message,
                 status=BROADCAST_PROVIDER_STATUS_ERR,
-                error_detail={"exception": exception_detail},
+                error_detail=error_detail,
             )
 
-        raise
+        if not retryable:
+            raise
+
+        if retry_delay is None:
+            # Not in retry_for, so the task fails now instead of being retried after the broadcast has expired
+            raise BroadcastIntegrityError(
+                f"Cannot retry broadcast_event {broadcast_event_id} to provider {provider}: "
+                + f"it will have expired at {broadcast_event.transmitted_finishes_at} before it could be retried"
+            ) from e
+
+        if isinstance(e, Interrupt):
+            # Leave dramatiq's handling of interrupted tasks (e.g. time limits) as it is
+            raise
+
+        raise CBCProxyRetryScheduled(exception_detail, delay=retry_delay) from e
+
+
+@dramatiq.actor(
+    actor_name=CREATE_P1_ZENDESK_ALERT,
+    queue_name=QueueNames.BROADCASTS,
+    allow_retry=True,
+    retry_for={SideEffectRetryableException},
+)
+def create_p1_zendesk_alert(broadcast_message_id, queued_at):
+    """
+    Raise a P1 Zendesk ticket for a broadcast that has gone live. This is queued once the broadcast has been sent
+    to the providers, so that a slow or unavailable Zendesk can't hold up the broadcast itself.
+
+    Zendesk tickets can't be created idempotently through our client, so this is only retried if the connection to
+    Zendesk couldn't be made at all (see _zendesk_was_not_reached). Any other failure, such as a read timeout, may
+    have happened after the ticket was created, and retrying it could page the on-call team again for the same
+    broadcast.
+    """
+    # Import here as app.broadcast_message.utils imports this module to queue the tasks
+    from app.broadcast_message.utils import send_p1_zendesk_alert
+
+    # time between the broadcast being approved and this task starting, including any retries
+    queue_delay = time.time() - queued_at
+    start = time.monotonic()
+    succeeded = False
+    try:
+        send_p1_zendesk_alert(dao_get_broadcast_message_by_id(broadcast_message_id))
+        succeeded = True
+    except requests.exceptions.ConnectionError as e:
+        if not _zendesk_was_not_reached(e):
+            raise
+        raise SideEffectRetryableException(
+            f"Failed to create P1 Zendesk ticket for broadcast_message {broadcast_message_id}"
+        ) from e
+    finally:
+        current_app.logger.info(
+            f"Ran {CREATE_P1_ZENDESK_ALERT} for broadcast_message {broadcast_message_id}",
+            extra={
+                "side_effect": CREATE_P1_ZENDESK_ALERT,
+                "succeeded": succeeded,
+                "side_effect_queue_delay_ms": round(queue_delay * 1000),
+                "side_effect_duration_ms": round((time.monotonic() - start) * 1000),
+                "python_module": __name__,
+            },
+        )
+
+
+def _zendesk_was_not_reached(exception):
+    """
+    Whether a request failed before a connection to Zendesk was made - a connect timeout, refused connection or DNS
+    failure - so that nothing can have been sent. requests wraps these in a ConnectionError around urllib3's
+    MaxRetryError, whose reason is a ConnectTimeoutError (NewConnectionError is one too). Errors once connected,
+    such as a dropped connection, are wrapped in a ConnectionError as well, but with a different reason.
+    """
+    if isinstance(exception, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(exception.args[0], "reason", None) if exception.args else None
+    return isinstance(reason, urllib3.exceptions.ConnectTimeoutError)
+
+
+@dramatiq.actor(actor_name=RUN_LINK_TESTS, queue_name=QueueNames.BROADCASTS)
+def run_link_tests():
+    """
+    Link test every route of every enabled CBC concurrently, as one task. The per-route link test tasks below are
+    kept for triggering a single link test by hand.
+    """
+    current_app.logger.info("run_link_tests", extra={"python_module": __name__})
+    cbc_proxy_client.send_link_tests(
+        sorted(current_app.config["ENABLED_CBCS"]), timeout=current_app.config["CBC_LINK_TEST_TIMEOUT_SECONDS"]
+    )
 
 
 @dramatiq.actor(actor_name=TaskNames.TRIGGER_LINK_TEST, queue_name=QueueNames.BROADCASTS)
@@ -8,7 +8,8 @@ from sqlalchemy.exc import SQLAlchemyError
 
 from app import db, dramatiq
 from app.dao.broadcast_message_dao import (
-    dao_get_all_finished_broadcast_messages_with_outstanding_actions,
+    dao_expire_finished_broadcast_messages,
+    dao_get_finished_broadcast_message_flags_with_outstanding_actions,
 )
 from app.dao.invited_org_user_dao import (
     delete_org_invitations_created_more_than_two_days_ago,
@@ -21,19 +22,16 @@ from app.dao.users_dao import (
     get_user_by_email,
     save_model_user,
 )
-from app.models import BroadcastMessage, BroadcastStatusType, Event
+from app.models import Event
 from app.publish_task_progress.rest import purge_publish_tasks
 from app.status.healthcheck import (
     get_db_version,
     post_app_version_to_cloudwatch,
+    post_aws_client_counts_to_cloudwatch,
     post_db_version_to_cloudwatch,
+    post_provider_queue_depths_to_cloudwatch,
 )
-from app.tasks.broadcast_message_tasks import (
-    trigger_link_test_primary_to_A,
-    trigger_link_test_primary_to_B,
-    trigger_link_test_secondary_to_A,
-    trigger_link_test_secondary_to_B,
-)
+from app.tasks.broadcast_message_tasks import run_link_tests
 from app.tasks.stub_tasks import publish_govuk_alerts, publish_govuk_alerts_full
 
 
@@ -42,6 +40,9 @@ def run_health_check():
     try:
         post_app_version_to_cloudwatch()
         post_db_version_to_cloudwatch(get_db_version())
+        if current_app.config["CBC_PROVIDER_QUEUES_ENABLED"]:
+            post_provider_queue_depths_to_cloudwatch()
+        post_aws_client_counts_to_cloudwatch()
 
         time_stamp = int(time.time())
         with open("/eas/emergency-alerts-api/celery-beat-healthcheck", mode="w") as file:
@@ -87,24 +88,20 @@ def trigger_link_tests():
         current_app.logger.info(
             "trigger_link_tests", extra={"python_module": __name__, "target_queue": QueueNames.BROADCASTS}
         )
-        for cbc_name in current_app.config["ENABLED_CBCS"]:
-            trigger_link_test_primary_to_A.send(provider=cbc_name)
-            trigger_link_test_primary_to_B.send(provider=cbc_name)
-            trigger_link_test_secondary_to_A.send(provider=cbc_name)
-            trigger_link_test_secondary_to_B.send(provider=cbc_name)
+        run_link_tests.send()
 
 
 def auto_expire_broadcast_messages():
-    expired_broadcasts = BroadcastMessage.query.filter(
-        BroadcastMessage.finishes_at <= datetime.now(),
-        BroadcastMessage.status == BroadcastStatusType.BROADCASTING,
-    ).all()
-
-    for broadcast in expired_broadcasts:
-        broadcast.status = BroadcastStatusType.COMPLETED
-        broadcast.finished_govuk_acknowledged = False
-
-    db.session.commit()
+    expired_broadcast_ids = dao_expire_finished_broadcast_messages()
+    if expired_broadcast_ids:
+        current_app.logger.info(
+            "Expired %d broadcast messages",
+            len(expired_broadcast_ids),
+            extra={
+                "python_module": __name__,
+                "broadcast_message_ids": [str(broadcast_id) for broadcast_id in expired_broadcast_ids],
+            },
+        )
 
 
 @dramatiq.actor(
@@ -190,7 +187,7 @@ def queue_after_alert_activities():
     auto_expire_broadcast_messages()
 
     # Find recently expired which have one or more actions due
-    expired_and_pending_alerts = dao_get_all_finished_broadcast_messages_with_outstanding_actions()
+    expired_and_pending_alerts = dao_get_finished_broadcast_message_flags_with_outstanding_actions()
 
     current_app.logger.info(
         "There are %d recently expired/cancelled alerts with pending activities", len(expired_and_pending_alerts)
@@ -1,5 +1,7 @@
-from itertools import chain, combinations
+from itertools import chain
 
+import numpy as np
+import shapely
 from emergency_alerts_utils.api_key import KEY_TYPE_TEAM, KEY_TYPE_TEST
 from emergency_alerts_utils.polygons import Polygons
 from emergency_alerts_utils.template import BroadcastMessageTemplate
@@ -11,7 +13,11 @@ from sqlalchemy.orm.exc import MultipleResultsFound
 from app import api_user, authenticated_service
 from app.authentication.auth import AuthError
 from app.broadcast_message import utils as broadcast_utils
-from app.broadcast_message.translators import cap_xml_to_dict
+from app.broadcast_message.translators import (
+    CAP_POLYGON_TAG,
+    cap_tree_to_dict,
+    cap_xml_polygon_to_array,
+)
 from app.dao.broadcast_message_dao import (
     dao_get_broadcast_message_by_references_and_service_id,
 )
@@ -24,7 +30,7 @@ from app.v2.broadcast.broadcast_schemas import (
     post_broadcast_schema,
 )
 from app.v2.errors import BadRequestError, ValidationError
-from app.xml_schemas import validate_xml
+from app.xml_schemas import parse_xml_stream
 
 
 @v2_broadcast_blueprint.route("", methods=["POST"])
@@ -42,18 +48,27 @@ def create_broadcast():
             status_code=415,
         )
 
-    cap_xml = request.get_data()
-
-    current_app.logger.info("Provided with CAP XML: %s", cap_xml)
-
-    xml_validation_error = validate_xml(cap_xml, "CAP-v1.2.xsd")
+    # The body is parsed as it's read rather than read into memory first, and polygons are counted as they're
+    # parsed, so a document that's too long or too complex is rejected without reading the rest of it. At most
+    # MAX_BROADCASTS_XML_LENGTH bytes are read, and the most memory a request takes is the lxml tree of a document
+    # that size plus MAX_BROADCAST_POLYGON_POINT_COUNT coordinates, rather than that plus the raw body.
+    current_app.logger.info("Provided with CAP XML of length %s", request.content_length)
+
+    complexity_check = _BroadcastComplexityCheck()
+    cap_alert, xml_validation_error = parse_xml_stream(
+        request.stream,
+        "CAP-v1.2.xsd",
+        content_length=request.content_length,
+        tag=CAP_POLYGON_TAG,
+        on_element=complexity_check,
+    )
     if xml_validation_error is not None:
         raise BadRequestError(
             message="Request data is not valid CAP XML: " + xml_validation_error,
             status_code=400,
         )
 
-    broadcast_json = cap_xml_to_dict(cap_xml)
+    broadcast_json = cap_tree_to_dict(cap_alert, parsed_polygons=complexity_check.polygons)
 
     if broadcast_json["msgType"] == "Cancel":
         # A Cancel only needs <references>; it doesn't carry the alert content an
@@ -71,14 +86,16 @@ def create_broadcast():
         return jsonify(broadcast_message.serialize()), 201
 
     else:
-        validate(broadcast_json, post_broadcast_schema)
-        _check_broadcast_complexity(broadcast_json)
+        validate(_for_schema_validation(broadcast_json), post_broadcast_schema)
         _validate_template(broadcast_json)
 
+        # CAP gives points as lat,lon, so swap each polygon's columns to get x,y. Polygons needs lists of [x, y]
+        # lists rather than arrays, so this is where they're converted
         polygons = Polygons(
             list(
                 chain.from_iterable(
-                    ([[[y, x] for x, y in polygon] for polygon in area["polygons"]] for area in broadcast_json["areas"])
+                    ([np.asarray(polygon)[:, ::-1].tolist() for polygon in area["polygons"]])
+                    for area in broadcast_json["areas"]
                 )
             )
         )
@@ -120,6 +137,7 @@ def create_broadcast():
         current_app.logger.info(f"Saving new BroadcastMessage to database: {broadcast_message.serialize()}")
 
         dao_save_object(broadcast_message)
+        broadcast_utils.stage_broadcast_message(broadcast_message)
 
         current_app.logger.info(
             f"Broadcast message {broadcast_message.id} created for service "
@@ -161,35 +179,71 @@ def _cancel_or_reject_broadcast(references_to_original_broadcast, service_id):
     return broadcast_message
 
 
-def _check_broadcast_complexity(broadcast_json):
+class _BroadcastComplexityCheck:
     """
     Reject excessively large polygons before Shapely/pyproj processing.
     The 12-polygon / 250-point check in create_broadcast only triggers
     simplification. Without this check, an authenticated broadcast key
     could submit thousands of disjoint unmergeable polygons or a single
     polygon with a huge point count and exhaust API worker CPU/memory.
+
+    Called with each <polygon> element as it's parsed, so that parsing stops
+    as soon as either limit is passed. Points are counted by parsing the
+    polygon's coordinates, and the arrays are kept in self.polygons so that
+    cap_tree_to_dict doesn't parse them again.
     """
-    polygon_count = 0
-    point_count = 0
-    for area in broadcast_json["areas"]:
-        for polygon in area["polygons"]:
-            polygon_count += 1
-            point_count += len(polygon)
 
-    max_polygons = current_app.config["MAX_BROADCAST_POLYGON_COUNT"]
-    max_points = current_app.config["MAX_BROADCAST_POLYGON_POINT_COUNT"]
+    def __init__(self):
+        self.max_polygons = current_app.config["MAX_BROADCAST_POLYGON_COUNT"]
+        self.max_points = current_app.config["MAX_BROADCAST_POLYGON_POINT_COUNT"]
+        self.polygon_count = 0
+        self.point_count = 0
+        # The arrays parsed from each <polygon>, for cap_tree_to_dict to reuse
+        self.polygons = {}
+
+    def __call__(self, polygon):
+        self.polygon_count += 1
+        try:
+            points = cap_xml_polygon_to_array(polygon.text or "")
+        except ValueError:
+            # Left for cap_tree_to_dict to parse, so that the schema describes what's wrong with it
+            self.point_count += len((polygon.text or "").split())
+        else:
+            self.polygons[polygon] = points
+            self.point_count += len(points)
 
-    if polygon_count > max_polygons:
-        raise BadRequestError(
-            message=f"Too many polygons ({polygon_count}); the maximum is {max_polygons}",
-            status_code=400,
-        )
+        if self.polygon_count > self.max_polygons:
+            raise BadRequestError(
+                message=f"Too many polygons ({self.polygon_count}); the maximum is {self.max_polygons}",
+                status_code=400,
+            )
 
-    if point_count > max_points:
-        raise BadRequestError(
-            message=f"Too many coordinates ({point_count}); the maximum is {max_points}",
-            status_code=400,
-        )
+        if self.point_count > self.max_points:
+            raise BadRequestError(
+                message=f"Too many coordinates ({self.point_count}); the maximum is {self.max_points}",
+                status_code=400,
+            )
+
+
+def _for_schema_validation(broadcast_json):
+    """
+    Polygons that cap_tree_to_dict parsed into arrays are already known to be pairs of numbers, so only give
+    jsonschema their first four points, which is enough for it to check they have the minimum number. Walking
+    every point takes it seconds at MAX_BROADCAST_POLYGON_POINT_COUNT. Polygons that are too short, or that
+    weren't parsed into arrays, are validated in full so the error messages are the same as ever.
+    """
+    return {
+        **broadcast_json,
+        "areas": [
+            {
+                **area,
+                "polygons": [
+                    polygon[:4].tolist() if isinstance(polygon, np.ndarray) else polygon for polygon in area["polygons"]
+                ],
+            }
+            for area in broadcast_json["areas"]
+        ],
+    }
 
 
 def _validate_template(broadcast_json):
@@ -218,30 +272,33 @@ def _check_key_type_allowed(key_type):
 
 def _validate_polygons(polygons):
     try:
-        # Build each Shapely polygon exactly once rather than reconstructing both
-        # operands on every pass of the nested loop below. The polygon count is
-        # bounded up front by _check_broadcast_complexity.
+        # Build each Shapely polygon exactly once. The polygon count is bounded
+        # up front by _BroadcastComplexityCheck.
         shapely_polygons = [
             polygon if isinstance(polygon, ShapelyPolygon) else ShapelyPolygon(polygon) for polygon in polygons
         ]
 
         # Check for overlapping polygons, including partial intersections and
-        # enclosed polygons (holes). intersects() is symmetric, so only compare
-        # each unordered pair once.
-        for p1, p2 in combinations(shapely_polygons, 2):
-            if p1.intersects(p2):
-                raise ValidationError(
-                    message="Overlapping areas are not supported.",
-                    status_code=400,
-                )
-        for p in shapely_polygons:
-            # Check if valid (no self-intersections, no duplicate vertices,
-            # minimum vertex count, no overlapping segments)
-            if not p.is_valid:
-                raise ValidationError(
-                    message=f"Invalid polygon: {explain_validity(p)}",
-                    status_code=400,
-                )
+        # enclosed polygons (holes). Rather than testing every pair, query a
+        # spatial index with all the polygons at once, so that intersects() is
+        # only run on pairs whose bounding boxes overlap. Every polygon
+        # intersects itself, so only a match with another polygon counts.
+        matches, candidates = shapely.STRtree(shapely_polygons).query(shapely_polygons, predicate="intersects")
+        if np.any(matches != candidates):
+            raise ValidationError(
+                message="Overlapping areas are not supported.",
+                status_code=400,
+            )
+
+        # Check if valid (no self-intersections, no duplicate vertices,
+        # minimum vertex count, no overlapping segments), reporting the first
+        # invalid polygon
+        valid = shapely.is_valid(shapely_polygons)
+        if not valid.all():
+            raise ValidationError(
+                message=f"Invalid polygon: {explain_validity(shapely_polygons[np.argmin(valid)])}",
+                status_code=400,
+            )
 
     except Exception as e:
         raise ValidationError(
@@ -1,37 +1,135 @@
+import threading
+import time
 from pathlib import Path
 
 from flask import current_app
 from lxml import etree
 
+from app import metrics
 
-def validate_xml(document: bytes, schema_file_name):
+SCHEMA_DIRECTORY = Path(__file__).resolve().parent
+
+
+class XmlTooLongError(Exception):
+    pass
+
+
+class _LengthLimitedReader:
     """
-    Validate an XML string against a schema.
-    This will either return a string with a description of how validation
-    failed or None.
+    Reads a stream for lxml, raising XmlTooLongError as soon as more than max_length bytes have been read.
     """
-    max_length = current_app.config["MAX_BROADCASTS_XML_LENGTH"]
-    doc_length = len(document)
-    if doc_length > max_length:
-        return f"XML must be {max_length} characters or fewer"
 
-    path = Path(__file__).resolve().parent / schema_file_name
-    contents = path.read_text()
+    def __init__(self, stream, max_length):
+        self._stream = stream
+        self._max_length = max_length
+        self.bytes_read = 0
 
-    xml_parser = etree.XMLParser(
-        resolve_entities=False,
-        ns_clean=True,
-        encoding="utf-8",
-    )
+    def read(self, size=-1):
+        chunk = self._stream.read(size)
+        self.bytes_read += len(chunk)
+        if self.bytes_read > self._max_length:
+            raise XmlTooLongError()
+        return chunk
 
-    schema_xml = etree.XML(contents.encode("utf-8"))
-    schema = etree.XMLSchema(schema_xml)
 
-    try:
-        doc = etree.fromstring(document, parser=xml_parser)
+class SchemaRegistry:
+    """
+    Compiled validators for the XSDs in app/xml_schemas, so that a schema is read and compiled once rather than on
+    every request. lxml schemas and parsers can't be shared between threads, so each thread gets its own validator
+    for each schema, compiled the first time that thread needs it; init_app compiles every schema up front, which
+    also means a broken XSD fails at startup rather than on the first request.
 
-        schema.assertValid(doc)
-    except (etree.XMLSyntaxError, etree.DocumentInvalid) as e:
-        return str(e)
+    Compile and validation times are recorded in app.metrics as XmlSchemaCompileTime and XmlValidationTime.
+    """
+
+    def __init__(self, directory=SCHEMA_DIRECTORY):
+        self._directory = directory
+        self._schema_sources = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def init_app(self, app):
+        for path in sorted(self._directory.glob("*.xsd")):
+            self.get_validator(path.name)
+
+    def get_validator(self, schema_file_name) -> etree.XMLSchema:
+        validators = getattr(self._local, "validators", None)
+        if validators is None:
+            validators = self._local.validators = {}
+
+        if schema_file_name not in validators:
+            start = time.perf_counter()
+            validators[schema_file_name] = etree.XMLSchema(etree.XML(self._get_schema_source(schema_file_name)))
+            metrics.timing(
+                "XmlSchemaCompileTime", (time.perf_counter() - start) * 1000, dimensions={"Schema": schema_file_name}
+            )
+        return validators[schema_file_name]
+
+    def parse_stream(self, stream, schema_file_name, max_length, tag=None, on_element=None):
+        """
+        Parses a document from a file-like object and validates it against the schema, returning its root element.
+        on_element is called with each element (or each element with the given tag) as soon as it's been parsed, and
+        can raise to stop parsing there.
 
-    return None
+        The whole tree is still built, as it's validated once complete and the caller reads it, so this doesn't use
+        less memory than parsing the document in one go, other than not holding a copy of the raw document too. What
+        it gains is rejecting a document as soon as it goes over max_length or on_element raises, without reading or
+        parsing the rest of it.
+
+        Raises etree.XMLSyntaxError or etree.DocumentInvalid if the document isn't valid, and XmlTooLongError once
+        more than max_length bytes have been read.
+        """
+        schema = self.get_validator(schema_file_name)
+        start = time.perf_counter()
+        try:
+            # The document is validated once it's complete rather than with iterparse's schema argument, as that
+            # lets a truncated document through
+            events = etree.iterparse(
+                _LengthLimitedReader(stream, max_length),
+                events=("end",),
+                tag=tag,
+                resolve_entities=False,
+                encoding="utf-8",
+            )
+            for _, element in events:
+                if on_element is not None:
+                    on_element(element)
+
+            schema.assertValid(events.root)
+            return events.root
+        finally:
+            metrics.timing(
+                "XmlValidationTime", (time.perf_counter() - start) * 1000, dimensions={"Schema": schema_file_name}
+            )
+
+    def _get_schema_source(self, schema_file_name):
+        with self._lock:
+            if schema_file_name not in self._schema_sources:
+                self._schema_sources[schema_file_name] = (self._directory / schema_file_name).read_bytes()
+            return self._schema_sources[schema_file_name]
+
+
+schema_registry = SchemaRegistry()
+
+
+def parse_xml_stream(stream, schema_file_name, content_length=None, tag=None, on_element=None):
+    """
+    Parse an XML document from a stream (e.g. request.stream) and validate it against a schema.
+    This will either return the document's root element and None, or None
+    and a string with a description of how validation failed.
+
+    The length is checked against Content-Length before anything is read, and again as it's read in case that was
+    missing or wrong, so at most MAX_BROADCASTS_XML_LENGTH bytes are ever parsed. See SchemaRegistry.parse_stream
+    for tag and on_element.
+    """
+    max_length = current_app.config["MAX_BROADCASTS_XML_LENGTH"]
+    too_long_error = f"XML must be {max_length} characters or fewer"
+    if content_length is not None and content_length > max_length:
+        return None, too_long_error
+
+    try:
+        return schema_registry.parse_stream(stream, schema_file_name, max_length, tag=tag, on_element=on_element), None
+    except XmlTooLongError:
+        return None, too_long_error
+    except (etree.XMLSyntaxError, etree.DocumentInvalid) as e:
+        return None, str(e)
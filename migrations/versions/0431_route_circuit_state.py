@@ -0,0 +1,30 @@
+"""
+
+Revision ID: 0431_route_circuit_state
+Revises: 0430_add_bpm_err_retry_exhausted
+Create Date: 2026-10-17 09:12:00
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+revision = "0431_route_circuit_state"
+down_revision = "0430_add_bpm_err_retry_exhausted"
+
+
+def upgrade():
+    op.create_table(
+        "route_circuit_state",
+        sa.Column("proxy", sa.String(length=255), nullable=False),
+        sa.Column("target", sa.String(length=255), nullable=False),
+        sa.PrimaryKeyConstraint("proxy", "target"),
+        sa.Column("state", sa.String(length=255), nullable=False),
+        sa.Column("consecutive_failures", sa.Integer(), nullable=False),
+        sa.Column("opened_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=False),
+    )
+
+
+def downgrade():
+    op.drop_table("route_circuit_state")
@@ -0,0 +1,25 @@
+"""
+
+Revision ID: 0432_broadcast_event_staged_payload
+Revises: 0431_route_circuit_state
+Create Date: 2026-10-17 11:40:00
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+revision = "0432_broadcast_event_staged_payload"
+down_revision = "0431_route_circuit_state"
+
+
+def upgrade():
+    op.add_column(
+        "broadcast_event",
+        sa.Column("staged_payload", postgresql.JSONB(none_as_null=True, astext_type=sa.Text()), nullable=True),
+    )
+
+
+def downgrade():
+    op.drop_column("broadcast_event", "staged_payload")
@@ -0,0 +1,25 @@
+"""
+
+Revision ID: 0433_broadcast_message_staged_event
+Revises: 0432_broadcast_event_staged_payload
+Create Date: 2026-10-17 13:05:00
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+revision = "0433_broadcast_message_staged_event"
+down_revision = "0432_broadcast_event_staged_payload"
+
+
+def upgrade():
+    op.add_column(
+        "broadcast_message",
+        sa.Column("staged_event", postgresql.JSONB(none_as_null=True, astext_type=sa.Text()), nullable=True),
+    )
+
+
+def downgrade():
+    op.drop_column("broadcast_message", "staged_event")
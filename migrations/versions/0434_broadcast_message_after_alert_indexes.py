@@ -0,0 +1,35 @@
+"""
+
+Revision ID: 0434_broadcast_message_after_alert_indexes
+Revises: 0433_broadcast_message_staged_event
+Create Date: 2026-10-17 15:20:00
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+revision = "0434_broadcast_message_after_alert_indexes"
+down_revision = "0433_broadcast_message_staged_event"
+
+
+def upgrade():
+    op.create_index(
+        "ix_broadcast_message_broadcasting_finishes_at",
+        "broadcast_message",
+        ["finishes_at"],
+        postgresql_where=sa.text("status = 'broadcasting'"),
+    )
+    op.create_index(
+        "ix_broadcast_message_live_unacknowledged",
+        "broadcast_message",
+        ["status"],
+        postgresql_where=sa.text(
+            "status IN ('broadcasting', 'completed', 'cancelled') AND finished_govuk_acknowledged = false"
+        ),
+    )
+
+
+def downgrade():
+    op.drop_index("ix_broadcast_message_live_unacknowledged", table_name="broadcast_message")
+    op.drop_index("ix_broadcast_message_broadcasting_finishes_at", table_name="broadcast_message")
@@ -166,7 +166,7 @@ run_api(){
 
 run_worker(){
     cd $DIR_API;
-    export SERVICE=api_worker && . $VENV_API/bin/activate && exec $PYTHON_COMMAND dramatiq --skip-logging --processes 1 --threads 4 app.dramatiq_broker:broker --queues $WORKER_QUEUE_NAMES
+    export SERVICE=api_worker && . $VENV_API/bin/activate && exec $PYTHON_COMMAND dramatiq --skip-logging --processes 1 --threads ${WORKER_THREADS:-4} app.dramatiq_broker:broker --queues $WORKER_QUEUE_NAMES
 }
 
 run_periodiq(){
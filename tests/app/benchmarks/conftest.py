@@ -0,0 +1,21 @@
+"""
+Benchmarks take a while and their timings mean nothing on a busy CI runner, so they're skipped unless
+RUN_BENCHMARKS is set. Each case is run a number of times that can be overridden with BENCHMARK_RUNS. Run them,
+with their results printed, with:
+
+    RUN_BENCHMARKS=1 pytest tests/app/benchmarks -s
+"""
+
+import os
+
+import pytest
+
+
+def pytest_collection_modifyitems(config, items):
+    if os.environ.get("RUN_BENCHMARKS"):
+        return
+
+    skip_benchmark = pytest.mark.skip(reason="set RUN_BENCHMARKS=1 to run benchmarks")
+    for item in items:
+        if "benchmarks" in item.nodeid.split("/"):
+            item.add_marker(skip_benchmark)
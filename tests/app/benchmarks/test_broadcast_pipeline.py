@@ -0,0 +1,264 @@
+"""
+Times each stage of sending a broadcast, from the CAP XML arriving to every provider's lambda having ACKed it:
+
+* post_broadcast: POST /v2/broadcast with the CAP XML
+* approve: POST .../status to move the broadcast to broadcasting, as the admin app does when it's approved
+* send_broadcast_event: the task queued by approval
+* send_broadcast_provider_message: the task queued for each provider
+
+The stages run one after another in the test process against the real test DB. The broker is replaced by capturing
+the messages each stage sends, and the CBC lambdas by CBCLambdaSimulator with a fixed latency, so that what's
+measured is our own work. Each stage reports wall time percentiles, CPU time and the number of statements sent to the
+DB, for alerts ranging from a single simple polygon up to MAX_BROADCAST_POLYGON_COUNT polygons and
+MAX_BROADCAST_POLYGON_POINT_COUNT points.
+
+The results are printed and written as JSON to $BENCHMARK_OUTPUT (default broadcast-pipeline-benchmark.json) so
+they can be compared between builds.
+"""
+
+import json
+import math
+import os
+import platform
+import statistics
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.clients.cbc_proxy import CBCProxyClient
+from app.dao.broadcast_message_dao import dao_get_broadcast_message_by_id
+from app.dao.broadcast_service_dao import set_service_broadcast_providers
+from app.dao.dao_utils import dao_save_object
+from app.models import (
+    BROADCAST_PROVIDER_STATUS_ACK,
+    BroadcastEvent,
+    BroadcastStatusType,
+)
+from app.tasks.broadcast_message_tasks import (
+    send_broadcast_event,
+    send_broadcast_provider_message,
+)
+from tests import (
+    create_admin_authorization_header,
+    create_service_authorization_header,
+)
+from tests.app.benchmarks.utils import benchmark_runs, percentiles
+from tests.conftest import set_config_values
+from tests.utils import count_sqlalchemy_statements
+
+PROVIDERS = ["ee", "o2", "three", "vodafone"]
+RUNS = benchmark_runs(10)
+OUTPUT_PATH = os.environ.get("BENCHMARK_OUTPUT", "broadcast-pipeline-benchmark.json")
+LAMBDA_LATENCY_MS = 50
+STAGES = ["post_broadcast", "approve", "send_broadcast_event", "send_broadcast_provider_message"]
+
+# (polygons, points per polygon). The last case is at both MAX_BROADCAST_POLYGON_COUNT and
+# MAX_BROADCAST_POLYGON_POINT_COUNT.
+ALERT_SHAPES = [
+    (1, 5),
+    (1, 1_000),
+    (12, 20),
+    (100, 50),
+    (1_000, 5),
+    (1_000, 50),
+]
+
+CAP_XML = """
+    <alert xmlns='urn:oasis:names:tc:emergency:cap:1.2'>
+        <identifier>{identifier}</identifier>
+        <sender>broadcasts@notifications.service.gov.uk</sender>
+        <sent>2025-02-16T23:01:13-00:00</sent>
+        <status>Actual</status>
+        <msgType>Alert</msgType>
+        <scope>Public</scope>
+        <info>
+            <language>en-GB</language>
+            <category>Safety</category>
+            <event>Benchmark Alert</event>
+            <urgency>Expected</urgency>
+            <severity>Severe</severity>
+            <certainty>Likely</certainty>
+            <expires>2025-02-17T21:31:13-00:00</expires>
+            <senderName>GOV.UK Emergency Alerts</senderName>
+            <headline>GOV.UK Emergency Alert</headline>
+            <description>This is a benchmark of sending an emergency alert</description>
+            {areas}
+        </info>
+    </alert>
+"""
+
+results = {}
+
+
+def _cap_xml(identifier, polygon_count, points_per_polygon):
+    """
+    A CAP alert with one area per polygon. The polygons are disjoint circles laid out in a grid over England, each
+    with points_per_polygon points (including the point that closes the ring).
+    """
+    columns = math.ceil(math.sqrt(polygon_count))
+    spacing = 4 / columns
+    radius = spacing / 4
+    areas = []
+    for index in range(polygon_count):
+        centre_lat = 51 + spacing * (index // columns + 0.5)
+        centre_lon = -3 + spacing * (index % columns + 0.5)
+        vertices = points_per_polygon - 1
+        ring = [
+            (
+                centre_lat + radius * math.sin(2 * math.pi * vertex / vertices),
+                centre_lon + radius * math.cos(2 * math.pi * vertex / vertices),
+            )
+            for vertex in range(vertices)
+        ]
+        ring.append(ring[0])
+        polygon = " ".join(f"{lat:.6f},{lon:.6f}" for lat, lon in ring)
+        areas.append(f"<area><areaDesc>area {index}</areaDesc><polygon>{polygon}</polygon></area>")
+    return CAP_XML.format(identifier=identifier, areas="".join(areas))
+
+
+def _summarise(samples):
+    wall_times = [sample["wall_ms"] for sample in samples]
+    p50, p95, p99 = percentiles(wall_times, 50, 95, 99)
+    return {
+        "samples": len(samples),
+        "wall_ms": {"p50": p50, "p95": p95, "p99": p99, "max": max(wall_times)},
+        "cpu_ms": {"p50": statistics.median(sample["cpu_ms"] for sample in samples)},
+        "db_statements": {
+            "p50": statistics.median(sample["db_statements"] for sample in samples),
+            "max": max(sample["db_statements"] for sample in samples),
+        },
+    }
+
+
+class StageTimer:
+    def __init__(self):
+        self.samples = {stage: [] for stage in STAGES}
+
+    @contextmanager
+    def measure(self, stage):
+        with count_sqlalchemy_statements() as get_statement_count:
+            cpu_start = time.process_time()
+            start = time.perf_counter()
+            yield
+            wall_ms = (time.perf_counter() - start) * 1000
+            cpu_ms = (time.process_time() - cpu_start) * 1000
+            self.samples[stage].append({"wall_ms": wall_ms, "cpu_ms": cpu_ms, "db_statements": get_statement_count()})
+
+
+@pytest.fixture(scope="module", autouse=True)
+def write_results():
+    yield
+    if not results:
+        return
+
+    with open(OUTPUT_PATH, "w") as output:
+        json.dump(
+            {
+                "benchmark": "broadcast_pipeline",
+                "created_at": datetime.utcnow().isoformat(),
+                "python": platform.python_version(),
+                "runs": RUNS,
+                "lambda_latency_ms": LAMBDA_LATENCY_MS,
+                "results": results,
+            },
+            output,
+            indent=2,
+        )
+    print(f"\nWrote results to {OUTPUT_PATH}")
+
+
+@pytest.fixture
+def simulated_cbc_proxy_client(mocker):
+    cbc_proxy_client = CBCProxyClient()
+    cbc_proxy_client.init_app(
+        mocker.Mock(
+            config={
+                "CBC_PROXY_ENABLED": True,
+                "CBC_ACCOUNT_NUMBER": None,
+                "CBC_LAMBDA_SIMULATOR_ENABLED": True,
+                "CBC_LAMBDA_SIMULATOR_PROFILE": json.dumps(
+                    {"default": {"latency": {"distribution": "fixed", "ms": LAMBDA_LATENCY_MS}}}
+                ),
+            }
+        )
+    )
+    mocker.patch("app.tasks.broadcast_message_tasks.cbc_proxy_client", cbc_proxy_client)
+    return cbc_proxy_client
+
+
+@pytest.mark.parametrize("polygon_count, points_per_polygon", ALERT_SHAPES)
+def test_broadcast_pipeline(
+    mocker,
+    client,
+    notify_db_session,
+    sample_broadcast_service,
+    sample_user,
+    simulated_cbc_proxy_client,
+    polygon_count,
+    points_per_polygon,
+):
+    mocker.patch("app.tasks.broadcast_message_tasks.publish_govuk_alerts.send")
+    mock_send_broadcast_event = mocker.patch("app.broadcast_message.utils.send_broadcast_event.send")
+    mock_send_provider_message = mocker.patch("app.tasks.broadcast_message_tasks.send_broadcast_provider_message.send")
+    set_service_broadcast_providers(sample_broadcast_service, PROVIDERS)
+    timer = StageTimer()
+
+    with set_config_values(client.application, {"ENABLED_CBCS": set(PROVIDERS), "CBC_LAMBDA_SIMULATOR_ENABLED": True}):
+        for run in range(RUNS):
+            cap_xml = _cap_xml(
+                f"benchmark-{polygon_count}-{points_per_polygon}-{run}", polygon_count, points_per_polygon
+            )
+            auth_header = create_service_authorization_header(service_id=sample_broadcast_service.id)
+
+            with timer.measure("post_broadcast"):
+                response = client.post(
+                    path="/v2/broadcast",
+                    data=cap_xml,
+                    headers=[("Content-Type", "application/cap+xml"), auth_header],
+                )
+            assert response.status_code == 201, response.get_data(as_text=True)
+
+            # The approver picks how long the alert lasts before approving it
+            broadcast_message = dao_get_broadcast_message_by_id(response.json["id"])
+            broadcast_message.finishes_at = datetime.utcnow() + timedelta(hours=4)
+            dao_save_object(broadcast_message)
+
+            with timer.measure("approve"):
+                response = client.post(
+                    f"/service/{sample_broadcast_service.id}/broadcast-message/{broadcast_message.id}/status",
+                    data=json.dumps({"status": BroadcastStatusType.BROADCASTING, "created_by": str(sample_user.id)}),
+                    headers=[("Content-Type", "application/json"), create_admin_authorization_header()],
+                )
+            assert response.status_code == 200, response.get_data(as_text=True)
+
+            broadcast_event_id = mock_send_broadcast_event.call_args.kwargs["broadcast_event_id"]
+            mock_send_provider_message.reset_mock()
+            with timer.measure("send_broadcast_event"):
+                send_broadcast_event(broadcast_event_id)
+
+            for call in mock_send_provider_message.call_args_list:
+                with timer.measure("send_broadcast_provider_message"):
+                    send_broadcast_provider_message(**call.kwargs)
+
+            notify_db_session.expire_all()
+            broadcast_event = BroadcastEvent.query.get(broadcast_event_id)
+            assert {provider: broadcast_event.get_provider_message(provider).status for provider in PROVIDERS} == {
+                provider: BROADCAST_PROVIDER_STATUS_ACK for provider in PROVIDERS
+            }
+
+    case = f"{polygon_count}x{points_per_polygon}"
+    results[case] = {
+        "polygons": polygon_count,
+        "points": polygon_count * points_per_polygon,
+        "stages": {stage: _summarise(samples) for stage, samples in timer.samples.items()},
+    }
+
+    print(f"\n{polygon_count} polygons, {polygon_count * points_per_polygon} points, {RUNS} runs")
+    for stage, summary in results[case]["stages"].items():
+        print(
+            f"  {stage:>31}: p50 {summary['wall_ms']['p50']:7.1f}ms, p95 {summary['wall_ms']['p95']:7.1f}ms, "
+            f"p99 {summary['wall_ms']['p99']:7.1f}ms, cpu {summary['cpu_ms']['p50']:7.1f}ms, "
+            f"{summary['db_statements']['p50']:.0f} statements"
+        )
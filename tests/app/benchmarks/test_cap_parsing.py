@@ -0,0 +1,80 @@
+"""
+Compares how /v2/broadcast turns CAP XML into a broadcast: parsing it with lxml to validate it and then again with
+BeautifulSoup to read it, as it used to, against reading the validated lxml tree with cap_tree_to_dict. Alerts
+range from a single small polygon up to MAX_BROADCAST_POLYGON_COUNT polygons.
+
+Peak memory is measured with tracemalloc, which only sees memory allocated by Python. That's what BeautifulSoup's
+tree is made of, but not lxml's, which both paths build once for validation.
+"""
+
+import tracemalloc
+from io import BytesIO
+
+import pytest
+from bs4 import BeautifulSoup
+
+from app.broadcast_message.translators import (
+    cap_tree_to_dict,
+    cap_xml_polygon_to_list,
+)
+from app.xml_schemas import SchemaRegistry
+from tests.app.benchmarks.utils import benchmark_runs, median_milliseconds
+from tests.app.v2.broadcast.sample_cap_xml_documents import (
+    WITH_PLACEHOLDER_FOR_AREAS,
+)
+
+RUNS = benchmark_runs(20)
+SCHEMA_FILE_NAME = "CAP-v1.2.xsd"
+
+
+def parse_twice(registry, cap_xml):
+    registry.parse_stream(BytesIO(cap_xml), SCHEMA_FILE_NAME, len(cap_xml))
+    # As cap_xml_to_dict did before it read the lxml tree
+    info = BeautifulSoup(cap_xml, "xml", from_encoding="utf-8").alert.info
+    return [
+        [cap_xml_polygon_to_list(polygon.text) for polygon in area.find_all("polygon")]
+        for area in info.find_all("area")
+    ]
+
+
+def parse_once(registry, cap_xml):
+    return [
+        area["polygons"]
+        for area in cap_tree_to_dict(registry.parse_stream(BytesIO(cap_xml), SCHEMA_FILE_NAME, len(cap_xml)))["areas"]
+    ]
+
+
+def cap_xml(polygon_count, points_per_polygon):
+    polygon = " ".join(f"{51 + point / 10000:.5f},{point / 10000:.5f}" for point in range(points_per_polygon - 1))
+    polygon += f" {51:.5f},{0:.5f}"
+    areas = "</polygon><polygon>".join([polygon] * polygon_count)
+    return WITH_PLACEHOLDER_FOR_AREAS.format(areas).encode("utf-8")
+
+
+def measure(parse, registry, document):
+    p50 = median_milliseconds(parse, registry, document, runs=RUNS)
+
+    tracemalloc.start()
+    parse(registry, document)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return p50, peak / 1024 / 1024
+
+
+@pytest.mark.parametrize("polygon_count, points_per_polygon", [(1, 5), (12, 20), (100, 50), (1_000, 50)])
+def test_cap_parsing(polygon_count, points_per_polygon):
+    registry = SchemaRegistry()
+    registry.init_app(None)
+    document = cap_xml(polygon_count, points_per_polygon)
+
+    assert [[polygon.tolist() for polygon in polygons] for polygons in parse_once(registry, document)] == parse_twice(
+        registry, document
+    )
+
+    print(f"\n{polygon_count} polygons, {polygon_count * points_per_polygon} points, {len(document) / 1024:.0f}KB")
+    results = {}
+    for name, parse in [("parse twice", parse_twice), ("parse once", parse_once)]:
+        results[name] = measure(parse, registry, document)
+        print(f"  {name:>11}: p50 {results[name][0]:8.2f}ms, peak {results[name][1]:7.2f}MB")
+
+    assert results["parse once"][1] < results["parse twice"][1]
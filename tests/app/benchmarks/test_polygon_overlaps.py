@@ -0,0 +1,49 @@
+"""
+Compares checking a broadcast's polygons for overlaps the way _validate_polygons used to, running intersects() on
+every pair, with querying an STRtree so that only pairs whose bounding boxes overlap are tested. The polygons are
+separate, so every pair has to be ruled out, which is the worst case for both.
+"""
+
+from itertools import combinations
+
+import pytest
+from shapely.geometry import Point
+from shapely.geometry import Polygon as ShapelyPolygon
+
+from app.v2.broadcast.post_broadcast import _validate_polygons
+from tests.app.benchmarks.utils import benchmark_runs, median_milliseconds
+
+RUNS = benchmark_runs(5)
+
+
+def validate_every_pair(polygons):
+    shapely_polygons = [ShapelyPolygon(polygon) for polygon in polygons]
+    for p1, p2 in combinations(shapely_polygons, 2):
+        if p1.intersects(p2):
+            raise ValueError("Overlapping areas are not supported.")
+    for p in shapely_polygons:
+        if not p.is_valid:
+            raise ValueError("Invalid polygon")
+    return True
+
+
+def separate_polygons(polygon_count):
+    # Octagons 0.01° across in a grid 40 wide, with 0.01° between each one
+    return [
+        Point(0.02 * (index % 40), 51 + 0.02 * (index // 40)).buffer(0.005, quad_segs=2).exterior.coords[:]
+        for index in range(polygon_count)
+    ]
+
+
+@pytest.mark.parametrize("polygon_count", [10, 100, 500, 1_000])
+def test_polygon_overlaps(polygon_count):
+    polygons = separate_polygons(polygon_count)
+
+    assert _validate_polygons(polygons) is validate_every_pair(polygons) is True
+
+    print(f"\n{polygon_count} polygons")
+    results = {}
+    for name, validate in [("every pair", validate_every_pair), ("STRtree", _validate_polygons)]:
+        results[name] = median_milliseconds(validate, polygons, runs=RUNS)
+        print(f"  {name:>10}: p50 {results[name]:9.2f}ms")
+    print(f"  STRtree is {results['every pair'] / results['STRtree']:.1f}x as fast")
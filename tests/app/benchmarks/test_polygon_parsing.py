@@ -0,0 +1,64 @@
+"""
+Compares how /v2/broadcast turns the coordinates in a CAP <polygon> into the points it builds Polygons from: the way
+it used to, with a float() call per coordinate, jsonschema checking every point and a comprehension to swap lat,lon
+to x,y, against parsing them into an array, checking only as many points as the schema needs and swapping the
+columns of the array. Polygons range from a handful of points up to MAX_BROADCAST_POLYGON_POINT_COUNT.
+"""
+
+import numpy as np
+import pytest
+
+from app.broadcast_message.translators import (
+    cap_xml_polygon_to_array,
+    cap_xml_polygon_to_list,
+)
+from app.schema_validation import validate
+from app.v2.broadcast.broadcast_schemas import post_broadcast_schema
+from app.v2.broadcast.post_broadcast import _for_schema_validation
+from tests.app.benchmarks.utils import benchmark_runs, median_milliseconds
+
+RUNS = benchmark_runs(5)
+
+
+def broadcast_json(polygon):
+    return {
+        "msgType": "Alert",
+        "reference": "abc123",
+        "cap_event": "Test",
+        "category": "Other",
+        "content": "Test",
+        "areas": [{"name": "area", "polygons": [polygon]}],
+    }
+
+
+def parse_as_lists(polygon_string):
+    polygon = cap_xml_polygon_to_list(polygon_string)
+    validate(broadcast_json(polygon), post_broadcast_schema)
+    return [[y, x] for x, y in polygon]
+
+
+def parse_as_array(polygon_string):
+    polygon = cap_xml_polygon_to_array(polygon_string)
+    validate(_for_schema_validation(broadcast_json(polygon)), post_broadcast_schema)
+    return np.asarray(polygon)[:, ::-1].tolist()
+
+
+def polygon_string(point_count):
+    points = [f"{51 + point / 100_000:.5f},{point / 100_000:.5f}" for point in range(point_count - 1)]
+    return " ".join(points + [points[0]])
+
+
+@pytest.mark.parametrize("point_count", [10, 250, 5_000, 50_000])
+def test_polygon_parsing(point_count):
+    document = polygon_string(point_count)
+
+    assert parse_as_array(document) == parse_as_lists(document)
+
+    print(f"\n{point_count} points")
+    results = {}
+    for name, parse in [("lists", parse_as_lists), ("array", parse_as_array)]:
+        results[name] = median_milliseconds(parse, document, runs=RUNS)
+        print(f"  {name:>5}: p50 {results[name]:9.2f}ms")
+
+    if point_count >= 5_000:
+        assert results["array"] < results["lists"]
@@ -0,0 +1,117 @@
+"""
+Compares the two ways send_broadcast_event can dispatch a broadcast to the providers:
+
+* fan-out, where a send_broadcast_provider_message task is queued per provider
+* concurrent, where the send_broadcast_event task sends to every provider itself, from a thread each
+
+The CBC lambdas are replaced by a fixed delay, and the broker by an in-process worker with a fixed number of threads
+that picks up each message after a fixed delay, so what's measured is the dispatch overhead and the effect of
+competing with other tasks for worker threads. The DB is the real test DB.
+"""
+
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from flask import current_app
+
+from app.dao.broadcast_service_dao import set_service_broadcast_providers
+from app.models import BROADCAST_TYPE, BroadcastStatusType
+from app.tasks.broadcast_message_tasks import (
+    send_broadcast_event,
+    send_broadcast_provider_message,
+)
+from tests.app.benchmarks.utils import benchmark_runs
+from tests.app.db import (
+    create_broadcast_event,
+    create_broadcast_message,
+    create_template,
+)
+from tests.conftest import set_config_values
+
+PROVIDERS = ["ee", "o2", "three", "vodafone"]
+RUNS = benchmark_runs(5)
+LAMBDA_LATENCY_SECONDS = 0.2
+# Time for SQS to deliver a message and a worker to pick it up
+QUEUE_PICKUP_SECONDS = 0.05
+# As started with `dramatiq --threads 4`
+WORKER_THREADS = 4
+# How long tasks that were already running when the broadcast was sent keep their worker threads
+BUSY_TASK_SECONDS = 0.5
+
+
+class FakeWorker:
+    """
+    Stands in for SQS and a dramatiq worker: each message sent is run on one of a fixed number of threads, after
+    the pickup delay. Some of the threads can start off busy with other tasks.
+    """
+
+    def __init__(self, busy_threads=0):
+        self._app = current_app._get_current_object()
+        self._queue = ThreadPoolExecutor(thread_name_prefix="fake-sqs")
+        self._threads = ThreadPoolExecutor(max_workers=WORKER_THREADS, thread_name_prefix="fake-worker")
+        self._messages = []
+        for _ in range(busy_threads):
+            self._threads.submit(time.sleep, BUSY_TASK_SECONDS)
+
+    def send(self, *, broadcast_event_id, provider):
+        self._messages.append(self._queue.submit(self._deliver, broadcast_event_id, provider))
+
+    def join(self):
+        for message in self._messages:
+            message.result().result()
+        self._queue.shutdown()
+        self._threads.shutdown()
+
+    def _deliver(self, broadcast_event_id, provider):
+        time.sleep(QUEUE_PICKUP_SECONDS)
+        return self._threads.submit(self._run, broadcast_event_id, provider)
+
+    def _run(self, broadcast_event_id, provider):
+        with self._app.app_context():
+            send_broadcast_provider_message(broadcast_event_id=broadcast_event_id, provider=provider)
+
+
+def _send_to_lambda(*args, **kwargs):
+    time.sleep(LAMBDA_LATENCY_SECONDS)
+
+
+@pytest.mark.parametrize("busy_threads", [0, 2, 4])
+def test_provider_dispatch(mocker, notify_api, notify_db_session, sample_broadcast_service, busy_threads):
+    mocker.patch("app.tasks.broadcast_message_tasks.publish_govuk_alerts.send")
+    for proxy in ["EE", "O2", "Three", "Vodafone"]:
+        mocker.patch(f"app.clients.cbc_proxy.CBCProxy{proxy}.send_staged_broadcast", side_effect=_send_to_lambda)
+
+    set_service_broadcast_providers(sample_broadcast_service, PROVIDERS)
+    template = create_template(sample_broadcast_service, BROADCAST_TYPE)
+
+    results = {}
+    for concurrent_dispatch in [False, True]:
+        timings = []
+        for _ in range(RUNS):
+            broadcast_message = create_broadcast_message(template, status=BroadcastStatusType.BROADCASTING)
+            event = create_broadcast_event(broadcast_message)
+            worker = FakeWorker(busy_threads=busy_threads)
+            mocker.patch("app.tasks.broadcast_message_tasks.send_broadcast_provider_message.send", new=worker.send)
+
+            with set_config_values(
+                notify_api, {"ENABLED_CBCS": set(PROVIDERS), "CBC_CONCURRENT_PROVIDER_DISPATCH": concurrent_dispatch}
+            ):
+                start = time.perf_counter()
+                send_broadcast_event(str(event.id))
+                worker.join()
+                timings.append(time.perf_counter() - start)
+
+            # the providers were sent to from other threads, with their own sessions
+            notify_db_session.expire_all()
+            assert all(event.get_provider_message(provider) for provider in PROVIDERS)
+
+        results["concurrent" if concurrent_dispatch else "fan-out"] = timings
+
+    print(f"\nbusy worker threads: {busy_threads}/{WORKER_THREADS}")
+    for mode, timings in results.items():
+        print(
+            f"  {mode:>10}: median {statistics.median(timings) * 1000:.0f}ms, max {max(timings) * 1000:.0f}ms "
+            f"to send to {len(PROVIDERS)} providers"
+        )
@@ -0,0 +1,40 @@
+"""
+Compares validating a CAP document the way /v2/broadcast used to, reading and compiling the XSD on every request,
+with validating it through the SchemaRegistry, which compiles it once per thread.
+"""
+
+import statistics
+from io import BytesIO
+
+from lxml import etree
+
+from app.xml_schemas import SCHEMA_DIRECTORY, SchemaRegistry
+from tests.app.benchmarks.utils import benchmark_runs, percentiles, time_runs
+from tests.app.v2.broadcast.sample_cap_xml_documents import WAINFLEET
+
+RUNS = benchmark_runs(200)
+SCHEMA_FILE_NAME = "CAP-v1.2.xsd"
+
+
+def validate_compiling_every_time(document):
+    schema = etree.XMLSchema(etree.XML((SCHEMA_DIRECTORY / SCHEMA_FILE_NAME).read_text().encode("utf-8")))
+    parser = etree.XMLParser(resolve_entities=False, ns_clean=True, encoding="utf-8")
+    schema.assertValid(etree.fromstring(document, parser=parser))
+
+
+def test_xml_schema_validation():
+    document = WAINFLEET.encode()
+    registry = SchemaRegistry()
+    registry.init_app(None)
+
+    uncached = time_runs(validate_compiling_every_time, document, runs=RUNS)
+    cached = time_runs(
+        lambda document: registry.parse_stream(BytesIO(document), SCHEMA_FILE_NAME, len(document)), document, runs=RUNS
+    )
+
+    print(f"\nValidating a CAP document, {RUNS} runs")
+    for name, timings in [("compiling every time", uncached), ("schema registry", cached)]:
+        p50, p99 = percentiles(timings, 50, 99)
+        print(f"  {name:>20}: p50 {p50:6.3f}ms, p99 {p99:6.3f}ms")
+
+    assert statistics.median(cached) < statistics.median(uncached)
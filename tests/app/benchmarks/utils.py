@@ -0,0 +1,28 @@
+import os
+import statistics
+import time
+
+
+def benchmark_runs(default):
+    """The number of times each benchmark case is run: $BENCHMARK_RUNS if it's set, otherwise default"""
+    return int(os.environ.get("BENCHMARK_RUNS", default))
+
+
+def time_runs(function, *args, runs):
+    """Calls function(*args) runs times, returning how long each call took in milliseconds"""
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        function(*args)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def median_milliseconds(function, *args, runs):
+    return statistics.median(time_runs(function, *args, runs=runs))
+
+
+def percentiles(timings, *points):
+    """The given percentiles of timings, e.g. percentiles(timings, 50, 99) for p50 and p99"""
+    quantiles = statistics.quantiles(timings, n=100, method="inclusive")
+    return [quantiles[point - 1] for point in points]
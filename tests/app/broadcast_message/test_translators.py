@@ -0,0 +1,125 @@
+import pytest
+from lxml import etree
+
+from app.broadcast_message.translators import (
+    cap_tree_to_dict,
+    cap_xml_polygon_to_array,
+    cap_xml_polygon_to_list,
+)
+from tests.app.v2.broadcast import sample_cap_xml_documents
+
+
+def parse(cap_xml):
+    return etree.fromstring(cap_xml.encode("utf-8"))
+
+
+def test_cap_tree_to_dict_extracts_alert():
+    broadcast = cap_tree_to_dict(parse(sample_cap_xml_documents.WAINFLEET))
+
+    assert broadcast["msgType"] == "Alert"
+    assert broadcast["references"] is None
+    assert broadcast["reference"] == "50385fcb0ab7aa447bbd46d848ce8466E"
+    assert broadcast["cap_event"] == "053/055 Issue Severe Flood Warning EA"
+    assert broadcast["category"] == "Met"
+    assert broadcast["expires"] == "2020-02-26T23:01:14-00:00"
+    assert broadcast["content"].startswith("A severe flood warning has been issued.")
+    assert [area["name"] for area in broadcast["areas"]] == ["River Steeping in Wainfleet All Saints"]
+    assert broadcast["areas"][0]["polygons"][0][:2].tolist() == [[53.10569, 0.24453], [53.10593, 0.2443]]
+
+
+def test_cap_tree_to_dict_extracts_every_area_and_polygon():
+    broadcast = cap_tree_to_dict(
+        parse(
+            sample_cap_xml_documents.WITH_TWO_PLACEHOLDERS_FOR_AREAS.format(
+                "1,2 3,4 5,6 1,2",
+                "7,8 9,10 11,12 7,8",
+            )
+        )
+    )
+
+    assert [area["name"] for area in broadcast["areas"]] == ["area-1", "area-2"]
+    assert [polygon.tolist() for polygon in broadcast["areas"][0]["polygons"]] == [
+        [[1, 2], [3, 4], [5, 6], [1, 2]],
+        [[7, 8], [9, 10], [11, 12], [7, 8]],
+    ]
+    assert len(broadcast["areas"][1]["polygons"]) == 1
+
+
+def test_cap_tree_to_dict_reads_cdata_and_empty_elements():
+    broadcast = cap_tree_to_dict(parse(sample_cap_xml_documents.WAINFLEET_CANCEL_WITH_REFERENCES))
+
+    assert broadcast["cap_event"] == "Remove Severe Flood Warning - Cell Broadcast"
+    assert broadcast["content"] == ""
+
+
+@pytest.mark.parametrize(
+    "cap_xml, expected_references",
+    [
+        (sample_cap_xml_documents.WAINFLEET_CANCEL_WITH_REFERENCES, "www.gov.uk/environment-agency,"),
+        (sample_cap_xml_documents.WAINFLEET_CANCEL_WITH_EMPTY_REFERENCES, ""),
+        (sample_cap_xml_documents.WAINFLEET_CANCEL_WITH_MISSING_REFERENCES, None),
+    ],
+)
+def test_cap_tree_to_dict_extracts_references(cap_xml, expected_references):
+    references = cap_tree_to_dict(parse(cap_xml))["references"]
+
+    if expected_references:
+        assert references.startswith(expected_references)
+    else:
+        assert references == expected_references
+
+
+def test_cap_tree_to_dict_handles_alert_without_info():
+    broadcast = cap_tree_to_dict(parse(sample_cap_xml_documents.WAINFLEET_CANCEL_MINIMAL))
+
+    assert broadcast["msgType"] == "Cancel"
+    assert broadcast["content"] is None
+    assert broadcast["areas"] == []
+
+
+def test_cap_xml_polygon_to_list():
+    assert cap_xml_polygon_to_list(" 53.1,0.2 53.2,0.3 ") == [[53.1, 0.2], [53.2, 0.3]]
+
+
+def test_cap_tree_to_dict_falls_back_to_lists_for_polygons_that_are_not_pairs():
+    broadcast = cap_tree_to_dict(
+        parse(sample_cap_xml_documents.WITH_TWO_PLACEHOLDERS_FOR_AREAS.format("1,2 3 5,6,7 1,2", "1,2 3,4 5,6 1,2"))
+    )
+
+    assert broadcast["areas"][0]["polygons"][0] == [[1, 2], [3], [5, 6, 7], [1, 2]]
+    assert broadcast["areas"][0]["polygons"][1].tolist() == [[1, 2], [3, 4], [5, 6], [1, 2]]
+
+
+def test_cap_tree_to_dict_reuses_parsed_polygons():
+    alert = parse(
+        sample_cap_xml_documents.WITH_TWO_PLACEHOLDERS_FOR_AREAS.format("1,2 3,4 5,6 1,2", "7,8 9,10 11,12 7,8")
+    )
+    first_polygon = alert.find(".//{urn:oasis:names:tc:emergency:cap:1.2}polygon")
+    parsed_polygon = cap_xml_polygon_to_array(first_polygon.text)
+
+    broadcast = cap_tree_to_dict(alert, parsed_polygons={first_polygon: parsed_polygon})
+
+    assert broadcast["areas"][0]["polygons"][0] is parsed_polygon
+    assert broadcast["areas"][0]["polygons"][1].tolist() == [[7, 8], [9, 10], [11, 12], [7, 8]]
+
+
+@pytest.mark.parametrize(
+    "polygon_string, expected_points",
+    [
+        ("53.1,0.2 53.2,0.3", [[53.1, 0.2], [53.2, 0.3]]),
+        ("\n  53.1,0.2\n  53.2,-0.3\n", [[53.1, 0.2], [53.2, -0.3]]),
+        ("", []),
+    ],
+)
+def test_cap_xml_polygon_to_array(polygon_string, expected_points):
+    points = cap_xml_polygon_to_array(polygon_string)
+
+    assert points.dtype == float
+    assert points.shape == (len(expected_points), 2)
+    assert points.tolist() == expected_points
+
+
+@pytest.mark.parametrize("polygon_string", ["53.1,0.2 53.2", "53.1,0.2,1 53.2 0.3", "53.1,0.2 a,b"])
+def test_cap_xml_polygon_to_array_rejects_anything_but_pairs_of_numbers(polygon_string):
+    with pytest.raises(ValueError):
+        cap_xml_polygon_to_array(polygon_string)
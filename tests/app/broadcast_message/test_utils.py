@@ -1,7 +1,13 @@
+import json
+from datetime import datetime
+from unittest.mock import ANY, Mock
+
 import pytest
 
 from app.broadcast_message.utils import (
     _create_p1_zendesk_alert,
+    send_p1_zendesk_alert,
+    stage_broadcast_message,
     update_broadcast_message_status,
 )
 from app.errors import InvalidRequest
@@ -375,7 +381,9 @@ def test_update_broadcast_message_status_creates_zendesk_ticket(mocker, notify_a
     approver = create_user(email="approver@gov.uk")
     sample_broadcast_service.users.append(approver)
 
-    mocker.patch("app.tasks.broadcast_message_tasks.send_broadcast_event.send")
+    tasks = Mock()
+    tasks.attach_mock(mocker.patch("app.tasks.broadcast_message_tasks.send_broadcast_event.send"), "send_event")
+    tasks.attach_mock(mocker.patch("app.tasks.broadcast_message_tasks.create_p1_zendesk_alert.send"), "zendesk")
     mock_send_ticket_to_zendesk = mocker.patch(
         "app.broadcast_message.utils.zendesk_client.send_ticket_to_zendesk",
         autospec=True,
@@ -384,7 +392,10 @@ def test_update_broadcast_message_status_creates_zendesk_ticket(mocker, notify_a
     with set_config(notify_api, "HOST", "production"):
         update_broadcast_message_status(broadcast_message, BroadcastStatusType.BROADCASTING, approver)
 
-    mock_send_ticket_to_zendesk.assert_called_once()
+    # the ticket is queued, after the broadcast has been sent, rather than created inline
+    assert [name for name, _, _ in tasks.mock_calls] == ["send_event", "zendesk"]
+    tasks.zendesk.assert_called_once_with(broadcast_message_id=str(broadcast_message.id), queued_at=ANY)
+    mock_send_ticket_to_zendesk.assert_not_called()
 
 
 def test_create_p1_zendesk_alert(sample_broadcast_service, mocker, notify_api):
@@ -395,13 +406,28 @@ def test_create_p1_zendesk_alert(sample_broadcast_service, mocker, notify_api):
         areas={"names": ["England", "Scotland"]},
     )
 
+    mock_create_p1_zendesk_alert = mocker.patch("app.tasks.broadcast_message_tasks.create_p1_zendesk_alert.send")
+
+    with set_config(notify_api, "HOST", "production"):
+        _create_p1_zendesk_alert(broadcast_message)
+
+    mock_create_p1_zendesk_alert.assert_called_once_with(broadcast_message_id=str(broadcast_message.id), queued_at=ANY)
+
+
+def test_send_p1_zendesk_alert(sample_broadcast_service, mocker, notify_api):
+    broadcast_message = create_broadcast_message(
+        service=sample_broadcast_service,
+        content="tailor made emergency broadcast content",
+        status=BroadcastStatusType.BROADCASTING,
+        areas={"names": ["England", "Scotland"]},
+    )
+
     mock_send_ticket_to_zendesk = mocker.patch(
         "app.broadcast_message.utils.zendesk_client.send_ticket_to_zendesk",
         autospec=True,
     )
 
-    with set_config(notify_api, "HOST", "production"):
-        _create_p1_zendesk_alert(broadcast_message)
+    send_p1_zendesk_alert(broadcast_message)
 
     ticket = mock_send_ticket_to_zendesk.call_args_list[0].args[0]
     assert ticket.subject == "Live broadcast sent"
@@ -419,15 +445,12 @@ def test_create_p1_zendesk_alert_doesnt_alert_when_cancelling(mocker, notify_api
         areas={"names": ["England", "Scotland"]},
     )
 
-    mock_send_ticket_to_zendesk = mocker.patch(
-        "app.broadcast_message.utils.zendesk_client.send_ticket_to_zendesk",
-        autospec=True,
-    )
+    mock_create_p1_zendesk_alert = mocker.patch("app.tasks.broadcast_message_tasks.create_p1_zendesk_alert.send")
 
     with set_config(notify_api, "HOST", "production"):
         _create_p1_zendesk_alert(broadcast_message)
 
-    mock_send_ticket_to_zendesk.assert_not_called()
+    mock_create_p1_zendesk_alert.assert_not_called()
 
 
 def test_create_p1_zendesk_alert_doesnt_alert_on_staging(mocker, notify_api, sample_broadcast_service):
@@ -438,15 +461,12 @@ def test_create_p1_zendesk_alert_doesnt_alert_on_staging(mocker, notify_api, sam
         areas={"names": ["England", "Scotland"]},
     )
 
-    mock_send_ticket_to_zendesk = mocker.patch(
-        "app.broadcast_message.utils.zendesk_client.send_ticket_to_zendesk",
-        autospec=True,
-    )
+    mock_create_p1_zendesk_alert = mocker.patch("app.tasks.broadcast_message_tasks.create_p1_zendesk_alert.send")
 
     with set_config(notify_api, "HOST", "staging"):
         _create_p1_zendesk_alert(broadcast_message)
 
-    mock_send_ticket_to_zendesk.assert_not_called()
+    mock_create_p1_zendesk_alert.assert_not_called()
 
 
 def test_create_p1_zendesk_alert_doesnt_alert_for_stubbed_messages(mocker, notify_api, sample_broadcast_service):
@@ -458,15 +478,12 @@ def test_create_p1_zendesk_alert_doesnt_alert_for_stubbed_messages(mocker, notif
         stubbed=True,
     )
 
-    mock_send_ticket_to_zendesk = mocker.patch(
-        "app.broadcast_message.utils.zendesk_client.send_ticket_to_zendesk",
-        autospec=True,
-    )
+    mock_create_p1_zendesk_alert = mocker.patch("app.tasks.broadcast_message_tasks.create_p1_zendesk_alert.send")
 
     with set_config(notify_api, "HOST", "production"):
         _create_p1_zendesk_alert(broadcast_message)
 
-    mock_send_ticket_to_zendesk.assert_not_called()
+    mock_create_p1_zendesk_alert.assert_not_called()
 
 
 def test_update_broadcast_message_status_for_rejecting_broadcast_message_with_reason_via_admin_ui(
@@ -527,3 +544,87 @@ def test_update_broadcast_message_status_for_rejecting_broadcast_message_with_re
 
     assert not mock_task.called
     assert len(broadcast_message.events) == 0
+
+
+def test_update_broadcast_message_status_stages_message_when_submitted_for_approval(
+    notify_api, sample_broadcast_service
+):
+    broadcast_message = create_broadcast_message(
+        service=sample_broadcast_service,
+        content="Hello <b>World</b>",
+        status=BroadcastStatusType.DRAFT,
+        areas={"ids": ["london"], "simple_polygons": [[[51.30, 0.7], [51.28, 0.8], [51.25, -0.7]]]},
+    )
+    submitter = create_user(email="submitter@gov.uk")
+
+    update_broadcast_message_status(broadcast_message, BroadcastStatusType.PENDING_APPROVAL, submitter)
+
+    assert broadcast_message.staged_event == {
+        "fingerprint": ANY,
+        "content": "Hello &lt;b&gt;World&lt;/b&gt;",
+        "areas_json": '[{"polygon": [[51.3, 0.7], [51.28, 0.8], [51.25, -0.7]]}]',
+    }
+
+
+def test_stage_broadcast_message_does_not_raise_if_staging_fails(mocker, sample_broadcast_service):
+    broadcast_message = create_broadcast_message(
+        service=sample_broadcast_service,
+        content="emergency broadcast",
+        status=BroadcastStatusType.PENDING_APPROVAL,
+    )
+    mocker.patch("app.broadcast_message.utils._staging_fingerprint", side_effect=ValueError)
+
+    stage_broadcast_message(broadcast_message)
+
+    assert broadcast_message.staged_event is None
+
+
+def test_update_broadcast_message_status_creates_event_from_staged_message(sample_broadcast_service, mocker):
+    broadcast_message = create_broadcast_message(
+        service=sample_broadcast_service,
+        content="emergency broadcast",
+        status=BroadcastStatusType.PENDING_APPROVAL,
+        finishes_at=datetime(2050, 8, 1, 15, 0),
+        areas={"ids": ["london"], "simple_polygons": [[[51.30, 0.7], [51.28, 0.8], [51.25, -0.7]]]},
+    )
+    stage_broadcast_message(broadcast_message)
+    # prove that the staged content is what gets sent
+    broadcast_message.staged_event = {**broadcast_message.staged_event, "content": "staged content"}
+    approver = create_user(email="approver@gov.uk")
+    sample_broadcast_service.users.append(approver)
+    mocker.patch("app.tasks.broadcast_message_tasks.send_broadcast_event.send")
+
+    update_broadcast_message_status(broadcast_message, BroadcastStatusType.BROADCASTING, approver)
+
+    alert_event = broadcast_message.events[0]
+    assert alert_event.transmitted_content == {"body": "staged content"}
+    assert alert_event.staged_payload["welsh"] is False
+    assert json.loads(alert_event.staged_payload["fields_json"]) == {
+        "headline": "GOV.UK Emergency Alert",
+        "description": "staged content",
+        "areas": [{"polygon": [[51.30, 0.7], [51.28, 0.8], [51.25, -0.7]]}],
+        "sent": alert_event.sent_at_as_cap_datetime_string,
+        "expires": alert_event.transmitted_finishes_at_as_cap_datetime_string,
+        "channel": "severe",
+    }
+
+
+def test_update_broadcast_message_status_ignores_staging_if_message_changed_since(sample_broadcast_service, mocker):
+    broadcast_message = create_broadcast_message(
+        service=sample_broadcast_service,
+        content="emergency broadcast",
+        status=BroadcastStatusType.PENDING_APPROVAL,
+        finishes_at=datetime(2050, 8, 1, 15, 0),
+        areas={"ids": ["london"], "simple_polygons": [[[51.30, 0.7], [51.28, 0.8], [51.25, -0.7]]]},
+    )
+    stage_broadcast_message(broadcast_message)
+    broadcast_message.content = "edited emergency broadcast"
+    approver = create_user(email="approver@gov.uk")
+    sample_broadcast_service.users.append(approver)
+    mocker.patch("app.tasks.broadcast_message_tasks.send_broadcast_event.send")
+
+    update_broadcast_message_status(broadcast_message, BroadcastStatusType.BROADCASTING, approver)
+
+    alert_event = broadcast_message.events[0]
+    assert alert_event.transmitted_content == {"body": "edited emergency broadcast"}
+    assert alert_event.staged_payload is None
@@ -0,0 +1,58 @@
+import threading
+
+import pytest
+
+from app.clients.aws_clients import AwsClientFactory
+
+
+@pytest.fixture
+def aws_client_factory(notify_api):
+    factory = AwsClientFactory()
+    factory.init_app(notify_api)
+    return factory
+
+
+def test_client_is_reused_within_a_thread(aws_client_factory):
+    client = aws_client_factory.client("sqs")
+
+    assert aws_client_factory.client("sqs") is client
+    assert aws_client_factory.client("s3") is not client
+    assert aws_client_factory.clients_created == {"sqs": 1, "s3": 1}
+
+
+def test_clients_with_different_arguments_are_cached_separately(aws_client_factory):
+    client = aws_client_factory.client("sqs")
+
+    assert aws_client_factory.client("sqs", endpoint_url="http://localstack:4566") is not client
+    assert aws_client_factory.clients_created == {"sqs": 2}
+
+
+def test_each_thread_gets_its_own_client(aws_client_factory):
+    clients = []
+    threads = [threading.Thread(target=lambda: clients.append(aws_client_factory.client("sqs"))) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert clients[0] is not clients[1]
+    assert aws_client_factory.clients_created == {"sqs": 2}
+
+
+def test_clients_are_configured_from_app_config(notify_api, aws_client_factory):
+    config = aws_client_factory.client("s3")._client_config
+
+    assert config.region_name == notify_api.config["AWS_REGION"]
+    assert config.max_pool_connections == notify_api.config["AWS_CLIENT_MAX_POOL_CONNECTIONS"]
+    assert config.connect_timeout == notify_api.config["AWS_CLIENT_CONNECT_TIMEOUT_SECONDS"]
+    assert config.read_timeout == notify_api.config["AWS_CLIENT_READ_TIMEOUT_SECONDS"]
+    assert config.tcp_keepalive is True
+    assert config.retries == {"mode": "standard", "total_max_attempts": notify_api.config["AWS_CLIENT_MAX_ATTEMPTS"]}
+
+
+def test_lambda_clients_leave_retries_to_the_cbc_proxy(notify_api, aws_client_factory):
+    config = aws_client_factory.client("lambda")._client_config
+
+    assert config.read_timeout == notify_api.config["CBC_PROXY_LAMBDA_READ_TIMEOUT_SECONDS"]
+    assert config.retries == {"mode": "standard", "total_max_attempts": 1}
+    assert config.max_pool_connections == notify_api.config["AWS_CLIENT_MAX_POOL_CONNECTIONS"]
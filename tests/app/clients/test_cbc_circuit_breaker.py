@@ -0,0 +1,112 @@
+from unittest.mock import ANY
+
+import pytest
+
+from app.clients.cbc_circuit_breaker import (
+    CIRCUIT_CLOSED,
+    CIRCUIT_HALF_OPEN,
+    CIRCUIT_OPEN,
+    CBCCircuitBreaker,
+)
+
+
+@pytest.fixture
+def circuit_breaker(notify_api):
+    return CBCCircuitBreaker()
+
+
+@pytest.fixture
+def mock_set_circuit_state(mocker):
+    return mocker.patch("app.dao.route_advisor_dao.dao_set_route_circuit_state")
+
+
+def test_circuit_starts_closed(circuit_breaker):
+    assert circuit_breaker.get_state("ee-1-proxy", "cbc_a") == CIRCUIT_CLOSED
+
+
+def test_circuit_opens_after_consecutive_failures(circuit_breaker, mock_set_circuit_state):
+    circuit_breaker.record("ee-1-proxy", "cbc_a", False)
+    circuit_breaker.record("ee-1-proxy", "cbc_a", False)
+    assert circuit_breaker.get_state("ee-1-proxy", "cbc_a") == CIRCUIT_CLOSED
+
+    circuit_breaker.record("ee-1-proxy", "cbc_a", False)
+
+    assert circuit_breaker.get_state("ee-1-proxy", "cbc_a") == CIRCUIT_OPEN
+    assert circuit_breaker.get_state("ee-1-proxy", "cbc_b") == CIRCUIT_CLOSED
+    mock_set_circuit_state.assert_called_once_with("ee-1-proxy", "cbc_a", CIRCUIT_OPEN, 3, ANY)
+
+
+def test_success_resets_failure_count(circuit_breaker, mock_set_circuit_state):
+    circuit_breaker.record("ee-1-proxy", "cbc_a", False)
+    circuit_breaker.record("ee-1-proxy", "cbc_a", False)
+    circuit_breaker.record("ee-1-proxy", "cbc_a", True)
+    circuit_breaker.record("ee-1-proxy", "cbc_a", False)
+
+    assert circuit_breaker.get_state("ee-1-proxy", "cbc_a") == CIRCUIT_CLOSED
+    mock_set_circuit_state.assert_not_called()
+
+
+def test_circuit_is_half_open_after_reset_period(circuit_breaker, mock_set_circuit_state):
+    circuit_breaker.failure_threshold = 1
+    circuit_breaker.reset_seconds = 0
+
+    circuit_breaker.record("ee-1-proxy", "cbc_a", False)
+
+    assert circuit_breaker.get_state("ee-1-proxy", "cbc_a") == CIRCUIT_HALF_OPEN
+
+
+ROUTES = [("ee-1-proxy", "cbc_a"), ("ee-1-proxy", "cbc_b"), ("ee-2-proxy", "cbc_a"), ("ee-2-proxy", "cbc_b")]
+
+
+def test_routes_for_sending_leaves_out_open_circuits(circuit_breaker, mock_set_circuit_state):
+    circuit_breaker.failure_threshold = 1
+    circuit_breaker.record("ee-1-proxy", "cbc_a", False)
+
+    assert circuit_breaker.routes_for_sending(ROUTES) == ROUTES[1:]
+
+
+def test_routes_for_sending_tries_half_open_circuits_after_closed_ones(circuit_breaker, mock_set_circuit_state):
+    circuit_breaker.failure_threshold = 1
+    circuit_breaker.reset_seconds = 0
+    circuit_breaker.record("ee-1-proxy", "cbc_a", False)
+
+    assert circuit_breaker.routes_for_sending(ROUTES) == ROUTES[1:] + ROUTES[:1]
+
+
+def test_routes_for_sending_tries_every_route_if_every_circuit_is_open(circuit_breaker, mock_set_circuit_state):
+    circuit_breaker.failure_threshold = 1
+    for route in ROUTES:
+        circuit_breaker.record(*route, False)
+
+    assert circuit_breaker.routes_for_sending(ROUTES) == ROUTES
+
+
+def test_successful_probe_closes_half_open_circuit(circuit_breaker, mock_set_circuit_state):
+    circuit_breaker.failure_threshold = 1
+    circuit_breaker.reset_seconds = 0
+    circuit_breaker.record("ee-1-proxy", "cbc_a", False)
+
+    circuit_breaker.record("ee-1-proxy", "cbc_a", True)
+
+    assert circuit_breaker.get_state("ee-1-proxy", "cbc_a") == CIRCUIT_CLOSED
+    mock_set_circuit_state.assert_called_with("ee-1-proxy", "cbc_a", CIRCUIT_CLOSED, 0, None)
+
+
+def test_failed_probe_reopens_half_open_circuit(circuit_breaker, mock_set_circuit_state):
+    circuit_breaker.failure_threshold = 1
+    circuit_breaker.reset_seconds = 0
+    circuit_breaker.record("ee-1-proxy", "cbc_a", False)
+    circuit_breaker.reset_seconds = 60
+
+    circuit_breaker.record("ee-1-proxy", "cbc_a", False)
+
+    assert circuit_breaker.get_state("ee-1-proxy", "cbc_a") == CIRCUIT_OPEN
+
+
+def test_failing_to_record_state_change_is_not_raised(circuit_breaker, mock_set_circuit_state):
+    mock_set_circuit_state.side_effect = Exception("db down")
+    circuit_breaker.failure_threshold = 1
+
+    circuit_breaker.record("ee-1-proxy", "cbc_a", False)
+
+    assert circuit_breaker.get_state("ee-1-proxy", "cbc_a") == CIRCUIT_OPEN
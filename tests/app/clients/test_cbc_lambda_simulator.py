@@ -0,0 +1,203 @@
+import json
+
+import pytest
+from botocore.exceptions import ClientError, ReadTimeoutError
+
+from app.clients.cbc_lambda_simulator import CBCLambdaSimulator
+from app.clients.cbc_payload import (
+    AREAS_ENCODING_DELTA_ZLIB,
+    AREAS_ENCODING_JSON,
+    StagedBroadcastPayload,
+    encode_areas,
+)
+from app.clients.cbc_proxy import CBCProxyClient, CBCProxyRetryableException
+
+
+def link_test_payload(cbc_target="cbc_a", **kwargs):
+    return json.dumps(
+        {"message_type": "test", "identifier": "abc", "message_format": "cap", "cbc_target": cbc_target, **kwargs}
+    )
+
+
+def invoke(simulator, function_name="ee-1-proxy", payload=None):
+    return simulator.invoke(
+        FunctionName=function_name, InvocationType="RequestResponse", Payload=payload or link_test_payload()
+    )
+
+
+@pytest.fixture
+def simulated_cbc_proxy_client(client, mocker):
+    client = CBCProxyClient()
+    client.init_app(
+        mocker.Mock(
+            config={
+                "CBC_PROXY_ENABLED": True,
+                "CBC_ACCOUNT_NUMBER": "123456789012",
+                "CBC_LAMBDA_SIMULATOR_ENABLED": True,
+                "CBC_LAMBDA_SIMULATOR_PROFILE": json.dumps({"ee-1-proxy": {"function_error_rate": 1}}),
+            }
+        )
+    )
+    return client
+
+
+def test_simulator_acks_valid_payloads():
+    response = invoke(CBCLambdaSimulator())
+
+    assert response["StatusCode"] == 200
+    assert "FunctionError" not in response
+
+
+def test_simulator_accepts_function_arns():
+    response = invoke(CBCLambdaSimulator(), function_name="123456789012:function:vodafone-2-proxy")
+
+    # Found the lambda, but a Vodafone payload needs a message number and IBAG format
+    assert response["FunctionError"] == "Unhandled"
+    assert json.loads(response["Payload"].read()) == {"errorMessage": "Expected message_format ibag, got cap"}
+
+
+def test_simulator_raises_for_unknown_lambdas():
+    with pytest.raises(ClientError) as e:
+        invoke(CBCLambdaSimulator(), function_name="bt-1-proxy")
+
+    assert e.value.response["Error"]["Code"] == "ResourceNotFoundException"
+
+
+@pytest.mark.parametrize(
+    "payload, expected_error",
+    [
+        (link_test_payload(message_type="heartbeat"), "Unknown message_type heartbeat"),
+        (link_test_payload(cbc_target="cbc_c"), "Unknown cbc_target cbc_c"),
+        (link_test_payload(message_type="alert"), "Missing fields"),
+        (link_test_payload(message_type="cancel"), "Missing references"),
+    ],
+)
+def test_simulator_rejects_invalid_payloads(payload, expected_error):
+    response = invoke(CBCLambdaSimulator(), payload=payload)
+
+    assert response["FunctionError"] == "Unhandled"
+    assert json.loads(response["Payload"].read())["errorMessage"].startswith(expected_error)
+
+
+def test_simulator_returns_function_errors_at_configured_rate():
+    simulator = CBCLambdaSimulator({"ee-1-proxy/cbc_a": {"function_error_rate": 1}})
+
+    assert "FunctionError" in invoke(simulator, payload=link_test_payload(cbc_target="cbc_a"))
+    assert "FunctionError" not in invoke(simulator, payload=link_test_payload(cbc_target="cbc_b"))
+
+
+def test_simulator_raises_client_errors_at_configured_rate():
+    with pytest.raises(ClientError) as e:
+        invoke(CBCLambdaSimulator({"ee": {"error_rate": 1}}))
+
+    assert e.value.response["Error"]["Code"] == "TooManyRequestsException"
+
+
+def test_simulator_hangs_then_times_out_at_configured_rate(mocker):
+    mock_sleep = mocker.patch("app.clients.cbc_lambda_simulator.time.sleep")
+
+    with pytest.raises(ReadTimeoutError):
+        invoke(CBCLambdaSimulator({"default": {"hang_rate": 1, "hang_seconds": 30}}))
+
+    mock_sleep.assert_called_once_with(30)
+
+
+@pytest.mark.parametrize(
+    "latency, expected_seconds",
+    [
+        ({"distribution": "fixed", "ms": 250}, 0.25),
+        ({"distribution": "uniform", "min_ms": 100, "max_ms": 100}, 0.1),
+        ({"distribution": "lognormal", "median_ms": 200, "sigma": 0}, 0.2),
+    ],
+)
+def test_simulator_waits_for_sampled_latency(mocker, latency, expected_seconds):
+    mock_sleep = mocker.patch("app.clients.cbc_lambda_simulator.time.sleep")
+
+    invoke(CBCLambdaSimulator({"default": {"latency": latency}}))
+
+    assert mock_sleep.call_args.args[0] == pytest.approx(expected_seconds)
+
+
+def test_simulator_layers_route_behaviour_over_defaults(mocker):
+    mock_sleep = mocker.patch("app.clients.cbc_lambda_simulator.time.sleep")
+    simulator = CBCLambdaSimulator(
+        {
+            "default": {"latency": {"distribution": "fixed", "ms": 100}},
+            "ee-1-proxy": {"function_error_rate": 1},
+        }
+    )
+
+    response = invoke(simulator)
+
+    assert "FunctionError" in response
+    mock_sleep.assert_called_once_with(0.1)
+    assert simulator.invocations == [
+        {
+            "function_name": "ee-1-proxy",
+            "cbc_target": "cbc_a",
+            "message_type": "test",
+            "duration": pytest.approx(0, abs=1),
+        }
+    ]
+
+
+def test_cbc_proxy_client_uses_simulator_when_enabled(simulated_cbc_proxy_client):
+    assert isinstance(simulated_cbc_proxy_client._lambda_client, CBCLambdaSimulator)
+
+
+def test_cbc_proxy_fails_over_between_simulated_routes(simulated_cbc_proxy_client):
+    simulator = simulated_cbc_proxy_client._lambda_client
+
+    simulated_cbc_proxy_client.get_proxy("ee").send_staged_broadcast(
+        identifier="my-identifier",
+        staged_payload=StagedBroadcastPayload.build(
+            headline="my-headline",
+            description="test-description",
+            areas=[{"polygon": [[51.12, -1.2], [51.12, 1.2], [51.74, 1.2]]}],
+            sent="a-passed-through-sent-value",
+            expires="a-passed-through-expires-value",
+            channel="severe",
+        ),
+    )
+
+    assert [(call["function_name"], call["cbc_target"]) for call in simulator.invocations] == [
+        ("ee-1-proxy", "cbc_a"),
+        ("ee-1-proxy", "cbc_b"),
+        ("ee-2-proxy", "cbc_a"),
+    ]
+
+
+def test_cbc_proxy_raises_if_every_simulated_route_fails(client, mocker):
+    cbc_proxy_client = CBCProxyClient()
+    cbc_proxy_client.init_app(
+        mocker.Mock(
+            config={
+                "CBC_PROXY_ENABLED": True,
+                "CBC_LAMBDA_SIMULATOR_ENABLED": True,
+                "CBC_LAMBDA_SIMULATOR_PROFILE": json.dumps({"o2": {"function_error_rate": 1}}),
+            }
+        )
+    )
+
+    with pytest.raises(CBCProxyRetryableException):
+        cbc_proxy_client.get_proxy("o2").cancel_broadcast(
+            identifier="my-identifier", previous_provider_messages=[], sent="now"
+        )
+
+    assert len(cbc_proxy_client._lambda_client.invocations) == 4
+
+
+@pytest.mark.parametrize("encoding", [AREAS_ENCODING_JSON, AREAS_ENCODING_DELTA_ZLIB])
+def test_simulator_decodes_areas(encoding):
+    areas = json.loads(encode_areas([[[51.12, -1.2], [51.12, 1.2], [51.74, 1.2]]], decimal_places=5, encoding=encoding))
+    payload = link_test_payload(
+        message_type="alert",
+        headline="my-headline",
+        description="my-description",
+        areas=areas,
+        sent="now",
+        expires="later",
+        channel="severe",
+    )
+
+    assert "FunctionError" not in invoke(CBCLambdaSimulator(), payload=payload)
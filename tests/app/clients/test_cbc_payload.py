@@ -0,0 +1,72 @@
+import json
+
+import pytest
+
+from app.clients.cbc_payload import (
+    AREAS_ENCODING_DELTA_ZLIB,
+    AREAS_ENCODING_JSON,
+    StagedBroadcastPayload,
+    decode_areas,
+    encode_areas,
+    quantise_polygons,
+)
+from tests.conftest import set_config
+
+POLYGONS = [
+    [
+        [51.123456789, -0.123456789],
+        [51.223456789, -0.123456789],
+        [51.223456789, 0.076543211],
+        [51.123456789, -0.123456789],
+    ],
+    [[53.10569, 0.24453], [53.10593, 0.2443], [53.10601, 0.24375], [53.10569, 0.24453]],
+]
+QUANTISED_POLYGONS = [
+    [[51.12346, -0.12346], [51.22346, -0.12346], [51.22346, 0.07654], [51.12346, -0.12346]],
+    [[53.10569, 0.24453], [53.10593, 0.2443], [53.10601, 0.24375], [53.10569, 0.24453]],
+]
+
+
+def test_quantise_polygons():
+    assert quantise_polygons(POLYGONS, 5) == QUANTISED_POLYGONS
+
+
+@pytest.mark.parametrize("encoding", [AREAS_ENCODING_JSON, AREAS_ENCODING_DELTA_ZLIB])
+def test_encode_areas_round_trips_quantised_polygons(encoding):
+    areas_json = encode_areas(POLYGONS, decimal_places=5, encoding=encoding)
+
+    assert decode_areas(json.loads(areas_json)) == [{"polygon": polygon} for polygon in QUANTISED_POLYGONS]
+
+
+def test_encode_areas_uses_config(notify_api):
+    with set_config(notify_api, "CBC_COORDINATE_DECIMAL_PLACES", 2):
+        assert json.loads(encode_areas(POLYGONS[:1])) == [
+            {"polygon": [[51.12, -0.12], [51.22, -0.12], [51.22, 0.08], [51.12, -0.12]]}
+        ]
+
+
+def test_encode_areas_rejects_unknown_encodings():
+    with pytest.raises(ValueError):
+        encode_areas(POLYGONS, decimal_places=5, encoding="protobuf")
+
+
+def test_delta_zlib_encoding_is_smaller_for_big_areas():
+    polygons = [[[50 + i / 1000, -1 + j / 1000] for j in range(100)] + [[50 + i / 1000, -1]] for i in range(100)]
+
+    compact = encode_areas(polygons, decimal_places=5, encoding=AREAS_ENCODING_DELTA_ZLIB)
+
+    assert len(compact) < len(encode_areas(polygons, decimal_places=5, encoding=AREAS_ENCODING_JSON)) / 4
+
+
+@pytest.mark.parametrize("encoding", [AREAS_ENCODING_JSON, AREAS_ENCODING_DELTA_ZLIB])
+def test_staged_payload_counts_polygons_and_points(encoding):
+    staged_payload = StagedBroadcastPayload.build(
+        headline="my-headline",
+        description="a description with [brackets], [like this]",
+        areas_json=encode_areas(POLYGONS, decimal_places=5, encoding=encoding),
+        sent="a-passed-through-sent-value",
+        expires="a-passed-through-expires-value",
+        channel="severe",
+    )
+
+    assert staged_payload.area_counts == (2, 8)
@@ -1,5 +1,6 @@
 import json
 import os
+import threading
 import uuid
 from collections import namedtuple
 from datetime import datetime
@@ -10,6 +11,7 @@ import pytest
 from botocore.exceptions import ClientError as BotoClientError
 
 from app import db
+from app.clients.cbc_payload import StagedBroadcastPayload
 from app.clients.cbc_proxy import (
     CBCProxyClient,
     CBCProxyEE,
@@ -19,6 +21,7 @@ from app.clients.cbc_proxy import (
     CBCProxyVodafone,
 )
 from app.utils import DATETIME_FORMAT
+from tests.conftest import set_config
 
 EXAMPLE_AREAS = [
     {
@@ -89,6 +92,12 @@ def test_cbc_proxy_lambda_client_has_correct_region(cbc_proxy_ee):
     assert cbc_proxy_ee._lambda_client._client_config.region_name == "eu-west-2"
 
 
+def test_cbc_proxy_lambda_client_times_out_within_cbc_budget(notify_api, cbc_proxy_ee):
+    config = cbc_proxy_ee._lambda_client._client_config
+    assert config.read_timeout == notify_api.config["CBC_PROXY_LAMBDA_READ_TIMEOUT_SECONDS"]
+    assert config.retries["total_max_attempts"] == 1
+
+
 def test_cbc_proxy_lambda_client_has_correct_keys(cbc_proxy_ee):
     key = cbc_proxy_ee._lambda_client._request_signer._credentials.access_key
     secret = cbc_proxy_ee._lambda_client._request_signer._credentials.secret_key
@@ -285,6 +294,39 @@ def test_cbc_proxy_vodafone_create_and_send_invokes_function(
     assert payload["channel"] == "test"
 
 
+@pytest.mark.parametrize("cbc", ["ee", "vodafone"])
+def test_cbc_proxy_send_staged_broadcast_sends_staged_fields_to_every_route(mocker, cbc_proxy_client, cbc):
+    cbc_proxy = cbc_proxy_client.get_proxy(cbc)
+    staged_payload = StagedBroadcastPayload.build(
+        headline="my-headline",
+        description="mŷ-description",
+        areas=EXAMPLE_AREAS,
+        sent="a-passed-through-sent-value",
+        expires="a-passed-through-expires-value",
+        channel="severe",
+    )
+
+    ld_client_mock = mocker.patch.object(cbc_proxy, "_lambda_client", create=True)
+    ld_client_mock.invoke.side_effect = [{"StatusCode": 400, "Payload": BytesIO(b"{}")}, {"StatusCode": 200}]
+
+    cbc_proxy.send_staged_broadcast(
+        identifier="my-identifier", staged_payload=staged_payload, message_number="0000007b"
+    )
+
+    payloads = [json.loads(invocation.kwargs["Payload"]) for invocation in ld_client_mock.invoke.call_args_list]
+    assert [payload["cbc_target"] for payload in payloads] == ["cbc_a", "cbc_b"]
+    for payload in payloads:
+        assert payload["identifier"] == "my-identifier"
+        assert payload["message_type"] == "alert"
+        assert payload["language"] == cbc_proxy.LANGUAGE_WELSH
+        assert payload["headline"] == "my-headline"
+        assert payload["description"] == "mŷ-description"
+        assert payload["areas"] == EXAMPLE_AREAS
+        assert payload["sent"] == "a-passed-through-sent-value"
+        assert payload["expires"] == "a-passed-through-expires-value"
+        assert payload["channel"] == "severe"
+
+
 def test_cbc_proxy_vodafone_cancel_invokes_function(mocker, cbc_proxy_vodafone):
     identifier = "my-identifier"
     MockProviderMessage = namedtuple("BroadcastProviderMessage", ["id", "message_number", "created_at"])
@@ -671,6 +713,136 @@ def test_create_and_send_raises_error_if_all_functions_error(mocker, cbc_proxy_c
     ]
 
 
+@pytest.mark.parametrize("cbc", ["ee", "vodafone", "three", "o2"])
+def test_hedged_routing_tries_next_route_when_first_route_is_slow(notify_db_session, mocker, cbc_proxy_client, cbc):
+    cbc_proxy = cbc_proxy_client.get_proxy(cbc)
+    cbc_proxy._hedge_delay = 0.05
+
+    release_hung_route = threading.Event()
+
+    def invoke(FunctionName, InvocationType, Payload):
+        if FunctionName == f"{cbc}-1-proxy" and json.loads(Payload)["cbc_target"] == "cbc_a":
+            release_hung_route.wait(5)
+        return {"StatusCode": 200}
+
+    ld_client_mock = mocker.patch.object(cbc_proxy, "_lambda_client", create=True)
+    ld_client_mock.invoke.side_effect = invoke
+
+    try:
+        cbc_proxy.create_and_send_broadcast(
+            identifier="my-identifier",
+            message_number="0000007b",
+            headline="my-headline",
+            description="test-description",
+            areas=EXAMPLE_AREAS,
+            sent="a-passed-through-sent-value",
+            expires="a-passed-through-expires-value",
+            channel="severe",
+        )
+    finally:
+        release_hung_route.set()
+
+    invoked_routes = [
+        (kwargs["FunctionName"], json.loads(kwargs["Payload"])["cbc_target"])
+        for _, _, kwargs in ld_client_mock.invoke.mock_calls
+    ]
+    assert invoked_routes == [(f"{cbc}-1-proxy", "cbc_a"), (f"{cbc}-1-proxy", "cbc_b")]
+
+
+@pytest.mark.parametrize("cbc", ["ee", "vodafone", "three", "o2"])
+def test_hedged_routing_raises_if_all_routes_fail(notify_db_session, mocker, cbc_proxy_client, cbc):
+    cbc_proxy = cbc_proxy_client.get_proxy(cbc)
+    cbc_proxy._hedge_delay = 0.05
+
+    ld_client_mock = mocker.patch.object(cbc_proxy, "_lambda_client", create=True)
+    ld_client_mock.invoke.side_effect = BotoClientError({}, "error")
+
+    with pytest.raises(CBCProxyRetryableException) as e:
+        cbc_proxy.create_and_send_broadcast(
+            identifier="my-identifier",
+            message_number="0000007b",
+            headline="my-headline",
+            description="test-description",
+            areas=EXAMPLE_AREAS,
+            sent="a-passed-through-sent-value",
+            expires="a-passed-through-expires-value",
+            channel="severe",
+        )
+
+    assert e.match(f"{cbc}-1-proxy and {cbc}-2-proxy lambdas failed")
+    assert sorted(
+        (kwargs["FunctionName"], json.loads(kwargs["Payload"])["cbc_target"])
+        for _, _, kwargs in ld_client_mock.invoke.mock_calls
+    ) == [
+        (f"{cbc}-1-proxy", "cbc_a"),
+        (f"{cbc}-1-proxy", "cbc_b"),
+        (f"{cbc}-2-proxy", "cbc_a"),
+        (f"{cbc}-2-proxy", "cbc_b"),
+    ]
+
+
+@pytest.mark.parametrize("cbc", ["ee", "vodafone", "three", "o2"])
+def test_routing_skips_routes_with_open_circuits(notify_db_session, mocker, cbc_proxy_client, cbc):
+    cbc_proxy = cbc_proxy_client.get_proxy(cbc)
+    mocker.patch("app.dao.route_advisor_dao.dao_set_route_circuit_state")
+    for _ in range(3):
+        cbc_proxy._circuit_breaker.record(f"{cbc}-1-proxy", "cbc_a", False)
+
+    ld_client_mock = mocker.patch.object(cbc_proxy, "_lambda_client", create=True)
+    ld_client_mock.invoke.return_value = {"StatusCode": 200}
+
+    cbc_proxy.create_and_send_broadcast(
+        identifier="my-identifier",
+        message_number="0000007b",
+        headline="my-headline",
+        description="test-description",
+        areas=EXAMPLE_AREAS,
+        sent="a-passed-through-sent-value",
+        expires="a-passed-through-expires-value",
+        channel="severe",
+    )
+
+    ld_client_mock.invoke.assert_called_once_with(
+        FunctionName=f"{cbc}-1-proxy",
+        InvocationType="RequestResponse",
+        Payload=mocker.ANY,
+    )
+    assert json.loads(ld_client_mock.invoke.call_args.kwargs["Payload"])["cbc_target"] == "cbc_b"
+
+
+def test_routing_sends_probe_half_open_circuits_after_closed_ones(notify_db_session, mocker, cbc_proxy_client):
+    cbc_proxy = cbc_proxy_client.get_proxy("ee")
+    mocker.patch("app.dao.route_advisor_dao.dao_set_route_circuit_state")
+    cbc_proxy._circuit_breaker.reset_seconds = 0
+    for _ in range(3):
+        cbc_proxy._circuit_breaker.record("ee-1-proxy", "cbc_a", False)
+
+    def invoke(FunctionName, InvocationType, Payload):
+        if (FunctionName, json.loads(Payload)["cbc_target"]) == ("ee-1-proxy", "cbc_a"):
+            return {"StatusCode": 200}
+        return {"StatusCode": 500, "Payload": BytesIO(b"{}")}
+
+    ld_client_mock = mocker.patch.object(cbc_proxy, "_lambda_client", create=True)
+    ld_client_mock.invoke.side_effect = invoke
+
+    cbc_proxy.create_and_send_broadcast(
+        identifier="my-identifier",
+        message_number="0000007b",
+        headline="my-headline",
+        description="test-description",
+        areas=EXAMPLE_AREAS,
+        sent="a-passed-through-sent-value",
+        expires="a-passed-through-expires-value",
+        channel="severe",
+    )
+
+    # The half-open route is tried last, and closes again when the send down it succeeds
+    last_call = ld_client_mock.invoke.call_args.kwargs
+    assert (last_call["FunctionName"], json.loads(last_call["Payload"])["cbc_target"]) == ("ee-1-proxy", "cbc_a")
+    assert ld_client_mock.invoke.call_count == 4
+    assert cbc_proxy._circuit_breaker.get_state("ee-1-proxy", "cbc_a") == "closed"
+
+
 @pytest.mark.parametrize("cbc", ["ee", "three", "o2"])
 def test_cbc_proxy_one_2_many_send_link_test_invokes_function(mocker, cbc_proxy_client, cbc):
     cbc_proxy = cbc_proxy_client.get_proxy(cbc)
@@ -736,3 +908,118 @@ def test_cbc_proxy_vodafone_send_link_test_invokes_function(mocker, cbc_proxy_vo
     assert payload["message_type"] == "test"
     assert payload["message_number"] == "00000001"
     assert payload["message_format"] == "ibag"
+
+
+def test_send_link_tests_probes_every_route_and_persists_best_routes(notify_db_session, mocker, cbc_proxy_client):
+    mock_set_routes = mocker.patch("app.dao.route_advisor_dao.dao_set_routes_for_mnos")
+    mocker.patch("app.dao.route_advisor_dao.dao_set_route_circuit_state")
+
+    def invoke(FunctionName, InvocationType, Payload):
+        if FunctionName == "ee-1-proxy":
+            return {"StatusCode": 500, "Payload": BytesIO(b"{}")}
+        return {"StatusCode": 200}
+
+    ld_client_mock = mocker.patch.object(cbc_proxy_client, "_lambda_client", create=True)
+    ld_client_mock.invoke.side_effect = invoke
+
+    results = cbc_proxy_client.send_link_tests(["ee", "o2"], timeout=5)
+
+    assert results == {
+        ("ee-1-proxy", "cbc_a"): False,
+        ("ee-1-proxy", "cbc_b"): False,
+        ("ee-2-proxy", "cbc_a"): True,
+        ("ee-2-proxy", "cbc_b"): True,
+        ("o2-1-proxy", "cbc_a"): True,
+        ("o2-1-proxy", "cbc_b"): True,
+        ("o2-2-proxy", "cbc_a"): True,
+        ("o2-2-proxy", "cbc_b"): True,
+    }
+    assert all(json.loads(kwargs["Payload"])["message_type"] == "test" for _, _, kwargs in ld_client_mock.mock_calls)
+    mock_set_routes.assert_called_once()
+    best_routes = mock_set_routes.call_args.args[0]
+    assert best_routes.keys() == {"ee", "o2"}
+    assert best_routes["ee"][0] == "ee-2-proxy"
+
+
+def test_send_link_tests_counts_probes_that_time_out_as_failed(notify_db_session, mocker, cbc_proxy_client):
+    mocker.patch("app.dao.route_advisor_dao.dao_set_routes_for_mnos")
+    mocker.patch("app.dao.route_advisor_dao.dao_set_route_circuit_state")
+
+    release_hung_route = threading.Event()
+
+    def invoke(FunctionName, InvocationType, Payload):
+        if FunctionName == "ee-1-proxy" and json.loads(Payload)["cbc_target"] == "cbc_a":
+            release_hung_route.wait(5)
+        return {"StatusCode": 200}
+
+    ld_client_mock = mocker.patch.object(cbc_proxy_client, "_lambda_client", create=True)
+    ld_client_mock.invoke.side_effect = invoke
+
+    try:
+        results = cbc_proxy_client.send_link_tests(["ee"], timeout=0.5)
+    finally:
+        release_hung_route.set()
+
+    assert results == {
+        ("ee-1-proxy", "cbc_a"): False,
+        ("ee-1-proxy", "cbc_b"): True,
+        ("ee-2-proxy", "cbc_a"): True,
+        ("ee-2-proxy", "cbc_b"): True,
+    }
+
+
+def test_cbc_proxy_logs_a_digest_of_the_payload_for_every_route(mocker, cbc_proxy_client):
+    cbc_proxy = cbc_proxy_client.get_proxy("ee")
+    staged_payload = StagedBroadcastPayload.build(
+        headline="my-headline",
+        description="my-description",
+        areas=EXAMPLE_AREAS * 2,
+        sent="a-passed-through-sent-value",
+        expires="a-passed-through-expires-value",
+        channel="severe",
+    )
+    mock_logger = mocker.patch("app.clients.cbc_proxy.current_app.logger.info")
+    ld_client_mock = mocker.patch.object(cbc_proxy, "_lambda_client", create=True)
+    ld_client_mock.invoke.side_effect = [{"StatusCode": 400, "Payload": BytesIO(b"{}")}, {"StatusCode": 200}]
+
+    cbc_proxy.send_staged_broadcast(identifier="my-identifier", staged_payload=staged_payload)
+
+    invocation_logs = [
+        call.kwargs["extra"] for call in mock_logger.call_args_list if call.args[0].startswith("Calling lambda")
+    ]
+    assert [log["cbc_target"] for log in invocation_logs] == ["cbc_a", "cbc_b"]
+    for log in invocation_logs:
+        assert "lambda_payload" not in log
+        assert log["polygon_count"] == 2
+        assert log["point_count"] == 10
+        assert log["payload_bytes"] == pytest.approx(len(ld_client_mock.invoke.call_args.kwargs["Payload"]), abs=30)
+    assert invocation_logs[0]["payload_sha256"] == invocation_logs[1]["payload_sha256"]
+
+
+def test_cbc_proxy_can_log_the_full_payload(mocker, notify_api, cbc_proxy_client):
+    mock_logger = mocker.patch("app.clients.cbc_proxy.current_app.logger.info")
+    ld_client_mock = mocker.patch.object(cbc_proxy_client, "_lambda_client", create=True)
+    ld_client_mock.invoke.return_value = {"StatusCode": 200}
+
+    with set_config(notify_api, "CBC_PROXY_PAYLOAD_LOGGING", "full"):
+        cbc_proxy_client.get_proxy("ee").cancel_broadcast(
+            identifier="my-identifier", previous_provider_messages=[], sent="a-passed-through-sent-value"
+        )
+
+    log = next(call.kwargs["extra"] for call in mock_logger.call_args_list if call.args[0].startswith("Calling lambda"))
+    assert "payload_sha256" not in log
+    assert "my-identifier" in log["lambda_payload"]
+
+
+def test_cbc_proxy_writes_each_full_payload_to_the_payload_log_once(mocker, cbc_proxy_client):
+    mocker.patch("app.clients.cbc_proxy.payload_logger.isEnabledFor", return_value=True)
+    mock_payload_log = mocker.patch("app.clients.cbc_proxy.payload_logger.debug")
+    ld_client_mock = mocker.patch.object(cbc_proxy_client, "_lambda_client", create=True)
+    ld_client_mock.invoke.side_effect = [{"StatusCode": 400, "Payload": BytesIO(b"{}")}, {"StatusCode": 200}] * 2
+    cbc_proxy = cbc_proxy_client.get_proxy("ee")
+
+    for _ in range(2):
+        cbc_proxy.cancel_broadcast(identifier=str(uuid.uuid4()), previous_provider_messages=[], sent="now")
+
+    assert mock_payload_log.call_count == 2
+    assert mock_payload_log.call_args_list[0].args[1] != mock_payload_log.call_args_list[1].args[1]
@@ -0,0 +1,140 @@
+from unittest.mock import Mock
+
+import pytest
+
+from app.clients.cbc_route_table import CBCRouteTable
+
+EE_ROUTES = [
+    ("ee-1-proxy", "cbc_a"),
+    ("ee-1-proxy", "cbc_b"),
+    ("ee-2-proxy", "cbc_a"),
+    ("ee-2-proxy", "cbc_b"),
+]
+
+
+@pytest.fixture
+def route_table(notify_api):
+    return CBCRouteTable()
+
+
+@pytest.fixture
+def mock_get_route(mocker):
+    return mocker.patch("app.dao.route_advisor_dao.dao_get_route_for_mno", return_value=None)
+
+
+def test_order_routes_keeps_default_order_with_no_information(route_table, mock_get_route):
+    assert route_table.order_routes("ee", EE_ROUTES) == EE_ROUTES
+
+
+def test_order_routes_puts_advised_route_first(route_table, mock_get_route):
+    mock_get_route.return_value = Mock(proxy="ee-2-proxy", target="cbc_b")
+
+    assert route_table.order_routes("ee", EE_ROUTES) == [
+        ("ee-2-proxy", "cbc_b"),
+        ("ee-1-proxy", "cbc_a"),
+        ("ee-1-proxy", "cbc_b"),
+        ("ee-2-proxy", "cbc_a"),
+    ]
+
+
+def test_order_routes_caches_advised_route(route_table, mock_get_route):
+    route_table.order_routes("ee", EE_ROUTES)
+    route_table.order_routes("ee", EE_ROUTES)
+
+    mock_get_route.assert_called_once_with("ee")
+
+
+def test_order_routes_rereads_advised_route_after_ttl(route_table, mock_get_route):
+    route_table.cache_ttl = 0
+
+    route_table.order_routes("ee", EE_ROUTES)
+    route_table.order_routes("ee", EE_ROUTES)
+
+    assert mock_get_route.call_count == 2
+
+
+def test_order_routes_prefers_fast_successful_routes(route_table, mock_get_route):
+    mock_get_route.return_value = Mock(proxy="ee-1-proxy", target="cbc_a")
+    route_table.record("ee-1-proxy", "cbc_a", False, 10.0)
+    route_table.record("ee-2-proxy", "cbc_a", True, 0.8)
+    route_table.record("ee-2-proxy", "cbc_b", True, 0.2)
+
+    assert route_table.order_routes("ee", EE_ROUTES) == [
+        ("ee-2-proxy", "cbc_b"),
+        ("ee-2-proxy", "cbc_a"),
+        ("ee-1-proxy", "cbc_b"),
+        ("ee-1-proxy", "cbc_a"),
+    ]
+
+
+def test_order_routes_prefers_slow_successful_routes_to_untried_ones(route_table, mock_get_route):
+    mock_get_route.return_value = Mock(proxy="ee-2-proxy", target="cbc_a")
+    route_table.record("ee-1-proxy", "cbc_b", True, 4.0)
+    route_table.record("ee-2-proxy", "cbc_b", False, 0.1)
+
+    assert route_table.order_routes("ee", EE_ROUTES) == [
+        ("ee-1-proxy", "cbc_b"),
+        ("ee-2-proxy", "cbc_a"),
+        ("ee-1-proxy", "cbc_a"),
+        ("ee-2-proxy", "cbc_b"),
+    ]
+
+
+def test_order_routes_forgets_stale_observations(route_table, mock_get_route):
+    route_table.stats_ttl = 0
+    route_table.record("ee-1-proxy", "cbc_a", False, 10.0)
+
+    assert route_table.order_routes("ee", EE_ROUTES) == EE_ROUTES
+
+
+def test_persist_best_route_writes_best_route(route_table, mocker):
+    mock_set_route = mocker.patch("app.dao.route_advisor_dao.dao_set_route_for_mno")
+    route_table.record("ee-1-proxy", "cbc_a", True, 2.0)
+    route_table.record("ee-2-proxy", "cbc_b", True, 0.5)
+    route_table.record("three-1-proxy", "cbc_a", True, 0.1)
+
+    route_table.persist_best_route("ee")
+
+    mock_set_route.assert_called_once_with("ee", "ee-2-proxy", "cbc_b")
+    assert route_table.get_advised_route("ee") == ("ee-2-proxy", "cbc_b")
+
+
+def test_persist_best_route_writes_at_most_once_per_ttl(route_table, mocker):
+    mock_set_route = mocker.patch("app.dao.route_advisor_dao.dao_set_route_for_mno")
+    route_table.record("ee-1-proxy", "cbc_a", True, 2.0)
+
+    route_table.persist_best_route("ee")
+    route_table.persist_best_route("ee")
+
+    mock_set_route.assert_called_once_with("ee", "ee-1-proxy", "cbc_a")
+
+
+def test_persist_best_route_ignores_failing_routes(route_table, mocker):
+    mock_set_route = mocker.patch("app.dao.route_advisor_dao.dao_set_route_for_mno")
+    route_table.record("ee-1-proxy", "cbc_a", False, 0.1)
+
+    route_table.persist_best_route("ee")
+
+    mock_set_route.assert_not_called()
+
+
+def test_persist_best_routes_writes_all_best_routes_at_once(route_table, mocker):
+    mock_set_routes = mocker.patch("app.dao.route_advisor_dao.dao_set_routes_for_mnos")
+    route_table.record("ee-1-proxy", "cbc_a", True, 2.0)
+    route_table.record("ee-2-proxy", "cbc_b", True, 0.5)
+    route_table.record("three-1-proxy", "cbc_a", True, 0.1)
+    route_table.record("o2-1-proxy", "cbc_a", False, 0.1)
+
+    route_table.persist_best_routes(["ee", "three", "o2"])
+
+    mock_set_routes.assert_called_once_with({"ee": ("ee-2-proxy", "cbc_b"), "three": ("three-1-proxy", "cbc_a")})
+    assert route_table.get_advised_route("three") == ("three-1-proxy", "cbc_a")
+
+
+def test_persist_best_routes_writes_nothing_without_healthy_routes(route_table, mocker):
+    mock_set_routes = mocker.patch("app.dao.route_advisor_dao.dao_set_routes_for_mnos")
+    route_table.record("o2-1-proxy", "cbc_a", False, 0.1)
+
+    route_table.persist_best_routes(["ee", "o2"])
+
+    mock_set_routes.assert_not_called()
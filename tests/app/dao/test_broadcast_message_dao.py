@@ -2,19 +2,22 @@ from datetime import datetime, timedelta
 
 from freezegun import freeze_time
 
+from app import db
 from app.dao.broadcast_message_dao import (
     add_broadcast_provider_message_status,
     create_broadcast_provider_message,
     dao_delete_records_for_broadcast,
+    dao_expire_finished_broadcast_messages,
     dao_get_all_broadcast_messages,
-    dao_get_all_finished_broadcast_messages_with_outstanding_actions,
     dao_get_all_pre_broadcast_messages,
+    dao_get_broadcast_event_for_sending,
     dao_get_broadcast_message_by_id_and_service_id_with_user,
     dao_get_broadcast_messages_for_service_with_user,
     dao_get_broadcast_provider_messages_by_broadcast_message_ids,
+    dao_get_finished_broadcast_message_flags_with_outstanding_actions,
     dao_get_public_messages_older_than,
+    dao_mark_all_as_govuk_acknowledged,
     dao_purge_old_broadcast_messages,
-    get_earlier_events_for_broadcast_event,
 )
 from app.dao.broadcast_service_dao import (
     insert_or_update_service_broadcast_settings,
@@ -35,29 +38,28 @@ from tests.app.db import (
 from tests.app.db import (
     create_broadcast_provider_message as create_broadcast_provider_message_test,
 )
-from tests.app.db import (
-    create_service,
-    create_template,
-)
+from tests.app.db import create_service, create_template
+from tests.utils import count_sqlalchemy_statements
 
 
-def test_get_earlier_events_for_broadcast_event(sample_service):
+def test_get_earlier_provider_messages(sample_service):
     t = create_template(sample_service, BROADCAST_TYPE)
     bm = create_broadcast_message(t)
 
+    # created out of order, to check they're sorted by when they were sent
     events = [
-        create_broadcast_event(
-            bm,
-            sent_at=datetime(2020, 1, 1, 12, 0, 0),
-            message_type=BroadcastEventMessageType.ALERT,
-            transmitted_content={"body": "Initial content"},
-        ),
         create_broadcast_event(
             bm,
             sent_at=datetime(2020, 1, 1, 13, 0, 0),
             message_type=BroadcastEventMessageType.UPDATE,
             transmitted_content={"body": "Updated content"},
         ),
+        create_broadcast_event(
+            bm,
+            sent_at=datetime(2020, 1, 1, 12, 0, 0),
+            message_type=BroadcastEventMessageType.ALERT,
+            transmitted_content={"body": "Initial content"},
+        ),
         create_broadcast_event(
             bm,
             sent_at=datetime(2020, 1, 1, 14, 0, 0),
@@ -72,10 +74,50 @@ def test_get_earlier_events_for_broadcast_event(sample_service):
             transmitted_finishes_at=datetime(2020, 1, 1, 15, 0, 0),
         ),
     ]
+    provider_messages = [create_broadcast_provider_message_test(event, "ee") for event in events]
 
-    # only fetches earlier events, and they're in time order
-    earlier_events = get_earlier_events_for_broadcast_event(events[2].id)
-    assert earlier_events == [events[0], events[1]]
+    # only fetches provider messages for earlier events, and they're in time order
+    assert events[2].get_earlier_provider_messages("ee") == [provider_messages[1], provider_messages[0]]
+
+
+def test_dao_get_broadcast_event_for_sending_loads_everything_needed_to_send(sample_broadcast_service):
+    t = create_template(sample_broadcast_service, BROADCAST_TYPE)
+    bm = create_broadcast_message(t, status=BroadcastStatusType.BROADCASTING)
+    event_ids = []
+    for i, message_type in enumerate(
+        [
+            BroadcastEventMessageType.ALERT,
+            BroadcastEventMessageType.UPDATE,
+            BroadcastEventMessageType.UPDATE,
+            BroadcastEventMessageType.CANCEL,
+        ]
+    ):
+        event = create_broadcast_event(bm, sent_at=datetime(2020, 1, 1, 12 + i, 0, 0), message_type=message_type)
+        for provider in ["ee", "vodafone"]:
+            create_broadcast_provider_message_test(event, provider, status=BROADCAST_PROVIDER_STATUS_ACK)
+        event_ids.append(event.id)
+    # make sure nothing is served from the session's identity map
+    db.session.expunge_all()
+
+    with count_sqlalchemy_statements() as get_statement_count:
+        broadcast_event = dao_get_broadcast_event_for_sending(event_ids[3])
+        statements_to_load = get_statement_count()
+
+        assert broadcast_event.service.active is True
+        assert broadcast_event.service.broadcast_channel == "severe"
+        assert broadcast_event.broadcast_message.stubbed is False
+        assert (
+            broadcast_event.get_provider_message("ee").get_latest_status_entry().status == BROADCAST_PROVIDER_STATUS_ACK
+        )
+
+        earlier_provider_messages = broadcast_event.get_earlier_provider_messages("vodafone")
+        assert [provider_message.broadcast_event_id for provider_message in earlier_provider_messages] == event_ids[:3]
+        assert all(provider_message.message_number for provider_message in earlier_provider_messages)
+
+    # the event (joined with its service, settings and message), then one query each for the message's events,
+    # their provider messages, the statuses and the message numbers
+    assert statements_to_load == 5
+    assert get_statement_count() == statements_to_load
 
 
 def test_create_broadcast_provider_message_creates_in_correct_state(sample_broadcast_service):
@@ -241,7 +283,7 @@ def test_dao_get_broadcast_provider_messages_by_broadcast_message_ids(
 
 
 @freeze_time("2024-12-12 12:12:12")
-def test_dao_get_all_finished_broadcast_messages_with_outstanding_actions(sample_broadcast_service):
+def test_dao_get_finished_broadcast_messages_with_outstanding_actions(sample_broadcast_service):
     t = create_template(sample_broadcast_service, BROADCAST_TYPE)
 
     # --- Not to be picked up (all in 2023) ---
@@ -280,21 +322,21 @@ def test_dao_get_all_finished_broadcast_messages_with_outstanding_actions(sample
 
     # --- Should be picked up (all in 2024) ---
 
-    create_broadcast_message(
+    cancelled = create_broadcast_message(
         # Cancelled, should be picked up
         t,
         created_at=datetime(2024, 10, 12, 12, 0, 0),
         starts_at=datetime.now(),
         status=BroadcastStatusType.CANCELLED,
     )
-    create_broadcast_message(
+    completed = create_broadcast_message(
         # Completed, should be picked up
         t,
         created_at=datetime(2024, 10, 12, 12, 0, 0),
         starts_at=datetime.now(),
         status=BroadcastStatusType.COMPLETED,
     )
-    create_broadcast_message(
+    expired = create_broadcast_message(
         # Broadcasting and expired, should be picked up
         t,
         created_at=datetime(2024, 10, 11, 12, 0, 0),
@@ -303,13 +345,10 @@ def test_dao_get_all_finished_broadcast_messages_with_outstanding_actions(sample
         status=BroadcastStatusType.BROADCASTING,
     )
 
-    oustanding_action_broadcast_messages = dao_get_all_finished_broadcast_messages_with_outstanding_actions()
-
-    assert len(oustanding_action_broadcast_messages) == 3
+    rows = dao_get_finished_broadcast_message_flags_with_outstanding_actions()
 
     # All ones to *not* pickup are in 2023
-    assert not any([x.created_at < datetime(2024, 1, 1, 0, 0) for x in oustanding_action_broadcast_messages])
-    assert not any([x.finished_govuk_acknowledged for x in oustanding_action_broadcast_messages])
+    assert sorted(rows) == sorted([(cancelled.id, False), (completed.id, False), (expired.id, False)])
 
 
 @freeze_time("2024-12-12 12:12:12")
@@ -337,21 +376,21 @@ def test_dao_get_only_relevant_broadcast_messages_with_outstanding_actions(sampl
     )
 
     # --- Should be picked up (all have been published) ---
-    create_broadcast_message(
+    cancelled = create_broadcast_message(
         # Cancelled, should be picked up
         t,
         created_at=datetime(2024, 10, 12, 12, 0, 0),
         starts_at=datetime.now(),
         status=BroadcastStatusType.CANCELLED,
     )
-    create_broadcast_message(
+    completed = create_broadcast_message(
         # Completed, should be picked up
         t,
         created_at=datetime(2024, 10, 12, 12, 0, 0),
         starts_at=datetime.now(),
         status=BroadcastStatusType.COMPLETED,
     )
-    create_broadcast_message(
+    expired = create_broadcast_message(
         # Broadcasting and expired, should be picked up
         t,
         created_at=datetime(2024, 10, 11, 12, 0, 0),
@@ -360,15 +399,10 @@ def test_dao_get_only_relevant_broadcast_messages_with_outstanding_actions(sampl
         status=BroadcastStatusType.BROADCASTING,
     )
 
-    oustanding_action_broadcast_messages = dao_get_all_finished_broadcast_messages_with_outstanding_actions()
-
-    assert len(oustanding_action_broadcast_messages) == 3
+    rows = dao_get_finished_broadcast_message_flags_with_outstanding_actions()
 
     # All ones to *not* pickup have pre-broadcast status
-    assert not any(
-        [x.status in BroadcastStatusType.PRE_BROADCAST_STATUSES for x in oustanding_action_broadcast_messages]
-    )
-    assert not any([x.finished_govuk_acknowledged for x in oustanding_action_broadcast_messages])
+    assert sorted(rows) == sorted([(cancelled.id, False), (completed.id, False), (expired.id, False)])
 
 
 @freeze_time("2024-12-12 12:12:12")
@@ -408,14 +442,14 @@ def test_dao_get_only_broadcast_messages_with_outstanding_actions_from_live_serv
     )
 
     # --- Should be picked up ---
-    create_broadcast_message(
+    cancelled = create_broadcast_message(
         # Cancelled, should be picked up
         t,
         created_at=datetime(2024, 10, 12, 12, 0, 0),
         starts_at=datetime.now(),
         status=BroadcastStatusType.CANCELLED,
     )
-    create_broadcast_message(
+    completed = create_broadcast_message(
         # Completed, should be picked up
         t,
         created_at=datetime(2024, 10, 12, 12, 0, 0),
@@ -423,13 +457,68 @@ def test_dao_get_only_broadcast_messages_with_outstanding_actions_from_live_serv
         status=BroadcastStatusType.COMPLETED,
     )
 
-    oustanding_action_broadcast_messages = dao_get_all_finished_broadcast_messages_with_outstanding_actions()
-
-    assert len(oustanding_action_broadcast_messages) == 2
+    rows = dao_get_finished_broadcast_message_flags_with_outstanding_actions()
 
     # All ones to *not* pickup are not in live services
-    assert not any([x.service.restricted for x in oustanding_action_broadcast_messages])
-    assert not any([x.finished_govuk_acknowledged for x in oustanding_action_broadcast_messages])
+    assert sorted(rows) == sorted([(cancelled.id, False), (completed.id, False)])
+
+
+@freeze_time("2024-12-12 12:12:12")
+def test_dao_get_finished_broadcast_message_flags_with_outstanding_actions(sample_broadcast_service):
+    t = create_template(sample_broadcast_service, BROADCAST_TYPE)
+    create_broadcast_message(t, status=BroadcastStatusType.BROADCASTING, finishes_at=datetime(2024, 12, 13))
+    create_broadcast_message(t, status=BroadcastStatusType.COMPLETED, finished_govuk_acknowledged=True)
+    create_broadcast_message(t, status=BroadcastStatusType.DRAFT)
+    cancelled = create_broadcast_message(t, status=BroadcastStatusType.CANCELLED)
+    expired = create_broadcast_message(t, status=BroadcastStatusType.BROADCASTING, finishes_at=datetime(2024, 12, 11))
+
+    rows = dao_get_finished_broadcast_message_flags_with_outstanding_actions()
+
+    assert sorted(rows) == sorted([(cancelled.id, False), (expired.id, False)])
+
+
+@freeze_time("2024-12-12 12:12:12")
+def test_dao_mark_all_as_govuk_acknowledged(sample_broadcast_service, sample_training_service):
+    t = create_template(sample_broadcast_service, BROADCAST_TYPE)
+    live = create_broadcast_message(t, status=BroadcastStatusType.BROADCASTING, finishes_at=datetime(2024, 12, 13))
+    rejected = create_broadcast_message(t, status=BroadcastStatusType.REJECTED)
+    training = create_broadcast_message(
+        create_template(sample_training_service, BROADCAST_TYPE), status=BroadcastStatusType.COMPLETED
+    )
+    cancelled = create_broadcast_message(t, status=BroadcastStatusType.CANCELLED)
+    expired = create_broadcast_message(t, status=BroadcastStatusType.BROADCASTING, finishes_at=datetime(2024, 12, 11))
+
+    assert sorted(dao_mark_all_as_govuk_acknowledged()) == sorted([cancelled.id, expired.id])
+
+    assert cancelled.finished_govuk_acknowledged is True
+    assert expired.finished_govuk_acknowledged is True
+    assert live.finished_govuk_acknowledged is False
+    assert rejected.finished_govuk_acknowledged is False
+    assert training.finished_govuk_acknowledged is False
+    assert dao_get_finished_broadcast_message_flags_with_outstanding_actions() == []
+
+
+@freeze_time("2024-12-12 12:12:12")
+def test_dao_expire_finished_broadcast_messages(sample_broadcast_service):
+    t = create_template(sample_broadcast_service, BROADCAST_TYPE)
+    live = create_broadcast_message(t, status=BroadcastStatusType.BROADCASTING, finishes_at=datetime(2024, 12, 13))
+    expired = create_broadcast_message(
+        t,
+        status=BroadcastStatusType.BROADCASTING,
+        finishes_at=datetime(2024, 12, 11),
+        finished_govuk_acknowledged=True,
+    )
+    cancelled = create_broadcast_message(t, status=BroadcastStatusType.CANCELLED, finishes_at=datetime(2024, 12, 11))
+
+    assert dao_expire_finished_broadcast_messages() == [expired.id]
+
+    assert live.status == BroadcastStatusType.BROADCASTING
+    assert expired.status == BroadcastStatusType.COMPLETED
+    assert expired.finished_govuk_acknowledged is False
+    assert expired.updated_at == datetime(2024, 12, 12, 12, 12, 12)
+    assert cancelled.status == BroadcastStatusType.CANCELLED
+
+    assert dao_expire_finished_broadcast_messages() == []
 
 
 def test_dao_purge_old_broadcast_messages(sample_broadcast_service):
@@ -0,0 +1,27 @@
+from datetime import datetime, timezone
+
+from app import db
+from app.dao.route_advisor_dao import dao_set_route_circuit_state
+from app.models import RouteCircuitState
+
+
+def test_dao_set_route_circuit_state_does_not_touch_the_session(notify_db_session, sample_service):
+    sample_service.name = "Renamed in the middle of a send"
+
+    dao_set_route_circuit_state("ee-1-proxy", "cbc_a", "open", 3, datetime.now(timezone.utc))
+
+    # Still pending in the session rather than committed or rolled back with the circuit state
+    assert sample_service in db.session.dirty
+    db.session.rollback()
+    assert sample_service.name == "Sample service"
+
+    circuit_state = RouteCircuitState.query.one()
+    assert (circuit_state.proxy, circuit_state.target, circuit_state.state) == ("ee-1-proxy", "cbc_a", "open")
+
+
+def test_dao_set_route_circuit_state_updates_existing_route(notify_db_session):
+    dao_set_route_circuit_state("ee-1-proxy", "cbc_a", "open", 3, datetime.now(timezone.utc))
+    dao_set_route_circuit_state("ee-1-proxy", "cbc_a", "closed", 0, None)
+
+    circuit_state = RouteCircuitState.query.one()
+    assert (circuit_state.state, circuit_state.consecutive_failures, circuit_state.opened_at) == ("closed", 0, None)
@@ -0,0 +1,67 @@
+import importlib
+import sys
+import types
+
+import pytest
+from dramatiq.middleware import CurrentMessage
+
+import app
+from app.models import BroadcastProvider
+from app.status.dramatiq_metrics import ActorMetricsMiddleware
+from app.tasks.broadcast_message_tasks import provider_queue_name
+from tests.conftest import set_config
+
+
+@pytest.fixture
+def import_dramatiq_broker(mocker, notify_api):
+    """
+    Imports app.dramatiq_broker as the dramatiq CLI does, against a broker that records what's added to it.
+    application.py can't be imported in tests, as it instruments the process and creates an app of its own, so
+    a module with the same names stands in for it: the `app` package and the Flask app as `application`.
+    """
+    application = types.ModuleType("application")
+    application.app = app
+    application.application = notify_api
+    mocker.patch.dict(sys.modules, {"application": application})
+    sys.modules.pop("app.dramatiq_broker", None)
+    mock_dramatiq = mocker.patch.object(app, "dramatiq")
+
+    def _import():
+        importlib.import_module("app.dramatiq_broker")
+        return mock_dramatiq.broker
+
+    return _import
+
+
+def test_importing_dramatiq_broker_adds_current_message_middleware(import_dramatiq_broker):
+    broker = import_dramatiq_broker()
+
+    assert CurrentMessage in [type(call.args[0]) for call in broker.add_middleware.call_args_list]
+
+
+def test_importing_dramatiq_broker_adds_actor_metrics_middleware(notify_api, import_dramatiq_broker):
+    with set_config(notify_api, "DRAMATIQ_METRICS_FLUSH_INTERVAL_SECONDS", 15):
+        broker = import_dramatiq_broker()
+
+    [middleware] = [
+        call.args[0]
+        for call in broker.add_middleware.call_args_list
+        if isinstance(call.args[0], ActorMetricsMiddleware)
+    ]
+    assert middleware.flush_interval == 15
+
+
+def test_importing_dramatiq_broker_declares_provider_queues(notify_api, import_dramatiq_broker):
+    with set_config(notify_api, "CBC_PROVIDER_QUEUES_ENABLED", True):
+        broker = import_dramatiq_broker()
+
+    assert [call.args[0] for call in broker.declare_queue.call_args_list] == [
+        provider_queue_name(provider) for provider in BroadcastProvider.PROVIDERS
+    ]
+
+
+def test_importing_dramatiq_broker_doesnt_declare_provider_queues_unless_enabled(notify_api, import_dramatiq_broker):
+    with set_config(notify_api, "CBC_PROVIDER_QUEUES_ENABLED", False):
+        broker = import_dramatiq_broker()
+
+    broker.declare_queue.assert_not_called()
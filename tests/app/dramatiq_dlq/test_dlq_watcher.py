@@ -19,6 +19,35 @@ from tests.app.db import (
 from tests.conftest import set_config_values
 
 
+def _fake_sqs_message(index, message_body):
+    return {
+        "MessageId": f"id-{index}",
+        "ReceiptHandle": f"receipt-{index}",
+        # Turn the JSON body into a base64 *str*
+        "Body": base64.b64encode(json.dumps(message_body).encode()).decode(),
+    }
+
+
+def _create_dlq_watcher(notify_api, mocker, send_failures=()):
+    with set_config_values(
+        notify_api, {"DLQ_URL": "mocked", "FAILED_QUEUE_URL": "mocked-failed", "DLQ_WATCHER_MAX_WORKERS": 4}
+    ):
+        dlq_watcher = DlqWatcher()
+
+    def send_message_batch(QueueUrl, Entries):
+        return {
+            "Successful": [{"Id": entry["Id"]} for entry in Entries if entry["Id"] not in send_failures],
+            "Failed": [
+                {"Id": entry["Id"], "Code": "InternalError"} for entry in Entries if entry["Id"] in send_failures
+            ],
+        }
+
+    dlq_watcher.sqs_client = mocker.Mock()
+    dlq_watcher.sqs_client.send_message_batch.side_effect = send_message_batch
+    dlq_watcher.sqs_client.delete_message_batch.return_value = {"Successful": [], "Failed": []}
+    return dlq_watcher
+
+
 def test_gets_messages_from_dlq(notify_api, mocker):
     fake_response = {"Messages": [{"MessageId": "id"}]}
     mock_receive_message = mocker.Mock(return_value=fake_response)
@@ -31,6 +60,7 @@ def test_gets_messages_from_dlq(notify_api, mocker):
     assert response == fake_response["Messages"]
     assert mock_receive_message.call_args.kwargs["QueueUrl"] == "mocked"
     assert mock_receive_message.call_args.kwargs["WaitTimeSeconds"] == 20
+    assert mock_receive_message.call_args.kwargs["MaxNumberOfMessages"] == 10
 
 
 @pytest.mark.parametrize(
@@ -53,25 +83,25 @@ def test_random_message_forwarded_to_failure_queue(message_body, notify_api, moc
         # Turn the JSON body into a base64 *str*
         "Body": base64.b64encode(json.dumps(message_body).encode()).decode(),
     }
-    mock_send_message = mocker.Mock()
-    mock_delete_message = mocker.Mock()
-
-    with set_config_values(notify_api, {"DLQ_URL": "mocked", "FAILED_QUEUE_URL": "mocked-failed"}):
-        dlq_watcher = DlqWatcher()
-        dlq_watcher.sqs_client.send_message = mock_send_message
-        dlq_watcher.sqs_client.delete_message = mock_delete_message
+    dlq_watcher = _create_dlq_watcher(notify_api, mocker)
 
-    dlq_watcher._process_sqs_message(fake_message)
+    dlq_watcher.process_messages([fake_message])
 
-    assert mock_send_message.call_args.kwargs["QueueUrl"] == "mocked-failed"
+    mock_send_message_batch = dlq_watcher.sqs_client.send_message_batch
+    assert mock_send_message_batch.call_args.kwargs["QueueUrl"] == "mocked-failed"
     # MessageBody will be a string, so parse it to match the dict
-    assert json.loads(mock_send_message.call_args.kwargs["MessageBody"]) == fake_message
+    assert [json.loads(entry["MessageBody"]) for entry in mock_send_message_batch.call_args.kwargs["Entries"]] == [
+        fake_message
+    ]
 
-    assert mock_delete_message.call_args.kwargs["QueueUrl"] == "mocked"
-    assert mock_delete_message.call_args.kwargs["ReceiptHandle"] == fake_message["ReceiptHandle"]
+    mock_delete_message_batch = dlq_watcher.sqs_client.delete_message_batch
+    assert mock_delete_message_batch.call_args.kwargs["QueueUrl"] == "mocked"
+    assert mock_delete_message_batch.call_args.kwargs["Entries"] == [
+        {"Id": "0", "ReceiptHandle": fake_message["ReceiptHandle"]}
+    ]
 
 
-def test_failed_broadcast_gets_retry_exhausted_status(notify_api, mocker, sample_broadcast_service):
+def test_failed_broadcast_gets_retry_exhausted_status(notify_api, notify_db_session, mocker, sample_broadcast_service):
     bm = create_broadcast_message(
         service=sample_broadcast_service, content="test", status=BroadcastStatusType.BROADCASTING
     )
@@ -96,22 +126,22 @@ def test_failed_broadcast_gets_retry_exhausted_status(notify_api, mocker, sample
             ).encode()
         ).decode(),
     }
-    mock_send_message = mocker.Mock()
-    mock_delete_message = mocker.Mock()
+    dlq_watcher = _create_dlq_watcher(notify_api, mocker)
 
-    with set_config_values(notify_api, {"DLQ_URL": "mocked", "FAILED_QUEUE_URL": "mocked-failed"}):
-        dlq_watcher = DlqWatcher()
-        dlq_watcher.sqs_client.send_message = mock_send_message
-        dlq_watcher.sqs_client.delete_message = mock_delete_message
+    dlq_watcher.process_messages([fake_message])
 
-    dlq_watcher._process_sqs_message(fake_message)
-
-    assert mock_send_message.call_args.kwargs["QueueUrl"] == "mocked-failed"
+    mock_send_message_batch = dlq_watcher.sqs_client.send_message_batch
+    assert mock_send_message_batch.call_args.kwargs["QueueUrl"] == "mocked-failed"
     # MessageBody will be a string, so parse it to match the dict
-    assert json.loads(mock_send_message.call_args.kwargs["MessageBody"]) == fake_message
+    assert [json.loads(entry["MessageBody"]) for entry in mock_send_message_batch.call_args.kwargs["Entries"]] == [
+        fake_message
+    ]
 
-    assert mock_delete_message.call_args.kwargs["QueueUrl"] == "mocked"
-    assert mock_delete_message.call_args.kwargs["ReceiptHandle"] == fake_message["ReceiptHandle"]
+    mock_delete_message_batch = dlq_watcher.sqs_client.delete_message_batch
+    assert mock_delete_message_batch.call_args.kwargs["QueueUrl"] == "mocked"
+    assert mock_delete_message_batch.call_args.kwargs["Entries"] == [
+        {"Id": "0", "ReceiptHandle": fake_message["ReceiptHandle"]}
+    ]
 
     bpm = sending_event.get_provider_message("test")
 
@@ -120,3 +150,146 @@ def test_failed_broadcast_gets_retry_exhausted_status(notify_api, mocker, sample
     assert bpm.statuses[1].status == BROADCAST_PROVIDER_STATUS_ERR
     assert bpm.statuses[2].status == BROADCAST_PROVIDER_STATUS_ERR_RETRY_EXHAUSTED
     assert bpm.get_latest_status_entry() == bpm.statuses[2]
+
+
+def test_failed_broadcast_only_gets_one_retry_exhausted_status_if_received_again(
+    notify_api, notify_db_session, mocker, sample_broadcast_service
+):
+    bm = create_broadcast_message(
+        service=sample_broadcast_service, content="test", status=BroadcastStatusType.BROADCASTING
+    )
+    sending_event = create_broadcast_event(broadcast_message=bm)
+    bpm = create_broadcast_provider_message(broadcast_event=sending_event, provider="test")
+    add_broadcast_provider_message_status(bpm, status=BROADCAST_PROVIDER_STATUS_ERR)
+
+    fake_message = _fake_sqs_message(
+        0,
+        {
+            "queue_name": "high-priority-tasks",
+            "actor_name": "send-broadcast-provider-message",
+            "args": [],
+            "kwargs": {"broadcast_event_id": str(sending_event.id), "provider": "test"},
+            "options": {},
+        },
+    )
+    # The first time round it can't be forwarded, so it stays on the DLQ and is received again
+    dlq_watcher = _create_dlq_watcher(notify_api, mocker, send_failures={"0"})
+    dlq_watcher.process_messages([fake_message])
+    dlq_watcher.sqs_client.delete_message_batch.assert_not_called()
+
+    dlq_watcher = _create_dlq_watcher(notify_api, mocker)
+    dlq_watcher.process_messages([fake_message])
+
+    assert dlq_watcher.sqs_client.delete_message_batch.call_args.kwargs["Entries"] == [
+        {"Id": "0", "ReceiptHandle": "receipt-0"}
+    ]
+    bpm = sending_event.get_provider_message("test")
+    assert [status.status for status in bpm.statuses] == [
+        BROADCAST_PROVIDER_STATUS_SENDING,
+        BROADCAST_PROVIDER_STATUS_ERR,
+        BROADCAST_PROVIDER_STATUS_ERR_RETRY_EXHAUSTED,
+    ]
+
+
+def test_processes_a_batch_of_messages_together(notify_api, mocker):
+    fake_messages = [_fake_sqs_message(index, "not-json") for index in range(10)]
+    dlq_watcher = _create_dlq_watcher(notify_api, mocker)
+    mock_process = mocker.patch.object(dlq_watcher, "_process_sqs_message")
+
+    dlq_watcher.process_messages(fake_messages)
+
+    assert sorted(call.args[0]["MessageId"] for call in mock_process.call_args_list) == sorted(
+        message["MessageId"] for message in fake_messages
+    )
+    dlq_watcher.sqs_client.send_message_batch.assert_called_once()
+    assert len(dlq_watcher.sqs_client.send_message_batch.call_args.kwargs["Entries"]) == 10
+    dlq_watcher.sqs_client.delete_message_batch.assert_called_once()
+    assert dlq_watcher.sqs_client.delete_message_batch.call_args.kwargs["Entries"] == [
+        {"Id": str(index), "ReceiptHandle": f"receipt-{index}"} for index in range(10)
+    ]
+    dlq_watcher.sqs_client.send_message.assert_not_called()
+    dlq_watcher.sqs_client.delete_message.assert_not_called()
+
+
+def test_one_bad_message_doesnt_stop_the_rest_of_the_batch(notify_api, mocker):
+    fake_messages = [_fake_sqs_message(index, "not-json") for index in range(3)]
+    dlq_watcher = _create_dlq_watcher(notify_api, mocker)
+    mock_add_status = mocker.patch.object(dlq_watcher, "_add_final_failed_status", side_effect=Exception("db"))
+    fake_messages[1] = _fake_sqs_message(
+        1,
+        {
+            "queue_name": "high-priority-tasks",
+            "actor_name": "send-broadcast-provider-message",
+            "args": [],
+            "kwargs": {"broadcast_event_id": "abcd", "provider": "ee"},
+            "options": {},
+        },
+    )
+
+    dlq_watcher.process_messages(fake_messages)
+
+    mock_add_status.assert_called_once_with("abcd", "ee")
+    assert len(dlq_watcher.sqs_client.delete_message_batch.call_args.kwargs["Entries"]) == 3
+
+
+def test_messages_that_failed_to_forward_stay_on_dlq(notify_api, mocker):
+    fake_messages = [_fake_sqs_message(index, "not-json") for index in range(3)]
+    dlq_watcher = _create_dlq_watcher(notify_api, mocker, send_failures={"1"})
+
+    dlq_watcher.process_messages(fake_messages)
+
+    assert dlq_watcher.sqs_client.delete_message_batch.call_args.kwargs["Entries"] == [
+        {"Id": "0", "ReceiptHandle": "receipt-0"},
+        {"Id": "1", "ReceiptHandle": "receipt-2"},
+    ]
+
+
+def test_nothing_deleted_if_batch_cant_be_forwarded(notify_api, mocker):
+    dlq_watcher = _create_dlq_watcher(notify_api, mocker)
+    dlq_watcher.sqs_client.send_message_batch.side_effect = Exception("SQS down")
+    dlq_watcher.sqs_client.send_message.side_effect = Exception("SQS down")
+
+    dlq_watcher.process_messages([_fake_sqs_message(0, "not-json")])
+
+    dlq_watcher.sqs_client.delete_message_batch.assert_not_called()
+
+
+def test_messages_are_sent_one_at_a_time_if_batch_fails(notify_api, mocker):
+    fake_messages = [_fake_sqs_message(index, "not-json") for index in range(3)]
+    dlq_watcher = _create_dlq_watcher(notify_api, mocker)
+    dlq_watcher.sqs_client.send_message_batch.side_effect = Exception("BatchRequestTooLong")
+    dlq_watcher.sqs_client.send_message.side_effect = [None, Exception("SQS down"), None]
+
+    dlq_watcher.process_messages(fake_messages)
+
+    assert [json.loads(call.kwargs["MessageBody"]) for call in dlq_watcher.sqs_client.send_message.call_args_list] == (
+        fake_messages
+    )
+    assert dlq_watcher.sqs_client.delete_message_batch.call_args.kwargs["Entries"] == [
+        {"Id": "0", "ReceiptHandle": "receipt-0"},
+        {"Id": "1", "ReceiptHandle": "receipt-2"},
+    ]
+
+
+def test_batches_are_split_to_fit_sqs_size_limit(notify_api, mocker):
+    # Each message is a bit over a third of the limit, so only two fit in a batch
+    fake_messages = [_fake_sqs_message(index, "x" * (DlqWatcher.MAX_BATCH_BYTES // 4)) for index in range(5)]
+    dlq_watcher = _create_dlq_watcher(notify_api, mocker)
+
+    dlq_watcher.process_messages(fake_messages)
+
+    sent_batches = [
+        [json.loads(entry["MessageBody"])["MessageId"] for entry in call.kwargs["Entries"]]
+        for call in dlq_watcher.sqs_client.send_message_batch.call_args_list
+    ]
+    assert sent_batches == [["id-0", "id-1"], ["id-2", "id-3"], ["id-4"]]
+    assert len(dlq_watcher.sqs_client.delete_message_batch.call_args.kwargs["Entries"]) == 5
+
+
+def test_empty_receive_makes_no_requests(notify_api, mocker):
+    dlq_watcher = _create_dlq_watcher(notify_api, mocker)
+
+    dlq_watcher.process_messages([])
+
+    dlq_watcher.sqs_client.send_message_batch.assert_not_called()
+    dlq_watcher.sqs_client.delete_message_batch.assert_not_called()
@@ -3,7 +3,7 @@ from datetime import datetime
 from flask import current_app
 
 from app.dao.broadcast_message_dao import (
-    dao_get_all_finished_broadcast_messages_with_outstanding_actions,
+    dao_get_finished_broadcast_message_flags_with_outstanding_actions,
 )
 from app.models import BROADCAST_TYPE, BroadcastStatusType
 from tests import create_internal_authorization_header
@@ -27,7 +27,7 @@ def test_get_all_broadcasts_returns_list_of_broadcasts_and_200(client, sample_br
         finished_govuk_acknowledged=False,
     )
 
-    pending = dao_get_all_finished_broadcast_messages_with_outstanding_actions()
+    pending = dao_get_finished_broadcast_message_flags_with_outstanding_actions()
     assert len(pending) == 1
 
     jwt_client_id = current_app.config["GOVUK_ALERTS_CLIENT_ID"]
@@ -35,5 +35,5 @@ def test_get_all_broadcasts_returns_list_of_broadcasts_and_200(client, sample_br
 
     client.post("/govuk-alerts/acknowledge", headers=[header])
 
-    new_pending = dao_get_all_finished_broadcast_messages_with_outstanding_actions()
+    new_pending = dao_get_finished_broadcast_message_flags_with_outstanding_actions()
     assert len(new_pending) == 0
@@ -1740,10 +1740,10 @@ def test_set_as_broadcast_service_revokes_api_keys(
     assert api_key_3.expiry_date is None
 
 
-@patch("app.service.rest.boto3")
-def test_purge_govuk_bucket_calls_s3_delete_objects(mock_boto3, admin_request):
+@patch("app.service.rest.aws_clients")
+def test_purge_govuk_bucket_calls_s3_delete_objects(mock_aws_clients, admin_request):
     mock_s3 = MagicMock()
-    mock_boto3.client.return_value = mock_s3
+    mock_aws_clients.client.return_value = mock_s3
 
     # Fake paginator returning two old objects
     last_modified = datetime.now(timezone.utc) - timedelta(days=10)
@@ -1770,10 +1770,10 @@ def test_purge_govuk_bucket_calls_s3_delete_objects(mock_boto3, admin_request):
     )
 
 
-@patch("app.service.rest.boto3")
-def test_purge_govuk_bucket_does_not_call_s3_delete_objects_when_no_old_objects(mock_boto3, admin_request):
+@patch("app.service.rest.aws_clients")
+def test_purge_govuk_bucket_does_not_call_s3_delete_objects_when_no_old_objects(mock_aws_clients, admin_request):
     mock_s3 = MagicMock()
-    mock_boto3.client.return_value = mock_s3
+    mock_aws_clients.client.return_value = mock_s3
 
     # mock_s3.get_paginator.return_value.paginate.return_value = [{"Contents": []}]
     # Fake paginator returning two recent objects
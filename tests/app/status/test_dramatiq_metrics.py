@@ -0,0 +1,115 @@
+import json
+import time
+
+import pytest
+from dramatiq import Message
+from emergency_alerts_utils.tasks import TaskNames
+
+from app.status.dramatiq_metrics import (
+    MAX_VALUES_PER_LINE,
+    ActorMetricsMiddleware,
+)
+
+
+@pytest.fixture
+def mock_emf_logger(mocker):
+    return mocker.patch("app.status.dramatiq_metrics.emf_logger")
+
+
+def emf_lines(mock_emf_logger):
+    return [json.loads(call.args[0]) for call in mock_emf_logger.info.call_args_list]
+
+
+def make_message(actor_name="some-actor", waited_ms=0, retries=0, **kwargs):
+    return Message(
+        queue_name="queue",
+        actor_name=actor_name,
+        args=(),
+        kwargs=kwargs,
+        options={"retries": retries} if retries else {},
+        message_timestamp=round(time.time() * 1000) - waited_ms,
+    )
+
+
+def process(middleware, message, exception=None):
+    middleware.before_process_message(None, message)
+    middleware.after_process_message(None, message, exception=exception)
+
+
+def test_metrics_are_batched_until_flushed(mock_emf_logger):
+    middleware = ActorMetricsMiddleware(flush_interval=60)
+
+    process(middleware, make_message(waited_ms=500))
+    process(middleware, make_message(waited_ms=1500, retries=2), exception=Exception())
+
+    mock_emf_logger.info.assert_not_called()
+
+    middleware.flush()
+
+    [line] = emf_lines(mock_emf_logger)
+    assert line["_aws"]["CloudWatchMetrics"][0]["Dimensions"] == [["Actor"]]
+    assert [metric["Name"] for metric in line["_aws"]["CloudWatchMetrics"][0]["Metrics"]] == [
+        "QueueWaitTime",
+        "ExecutionTime",
+        "Retries",
+        "Messages",
+        "Failures",
+    ]
+    assert line["Actor"] == "some-actor"
+    assert line["QueueWaitTime"] == [pytest.approx(500, abs=100), pytest.approx(1500, abs=100)]
+    assert len(line["ExecutionTime"]) == 2
+    assert line["Retries"] == [0, 2]
+    assert line["Messages"] == 2
+    assert line["Failures"] == 1
+
+
+def test_provider_messages_are_broken_down_by_provider(mock_emf_logger):
+    middleware = ActorMetricsMiddleware()
+
+    for provider in ["ee", "vodafone", "ee"]:
+        process(
+            middleware,
+            make_message(TaskNames.SEND_BROADCAST_PROVIDER_MESSAGE, broadcast_event_id="1234", provider=provider),
+        )
+    middleware.flush()
+
+    lines = emf_lines(mock_emf_logger)
+    assert [(line["Provider"], line["Messages"]) for line in lines] == [("ee", 2), ("vodafone", 1)]
+    assert all(
+        line["_aws"]["CloudWatchMetrics"][0]["Dimensions"] == [["Actor"], ["Actor", "Provider"]] for line in lines
+    )
+
+
+def test_metrics_are_flushed_every_flush_interval_without_more_messages(mock_emf_logger):
+    middleware = ActorMetricsMiddleware(flush_interval=0.01)
+
+    process(middleware, make_message())
+
+    deadline = time.monotonic() + 5
+    while not mock_emf_logger.info.called and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(emf_lines(mock_emf_logger)) == 1
+
+
+def test_metrics_are_flushed_before_exceeding_the_emf_value_limit(mock_emf_logger):
+    middleware = ActorMetricsMiddleware(flush_interval=60)
+
+    for _ in range(MAX_VALUES_PER_LINE + 1):
+        process(middleware, make_message())
+
+    assert [line["Messages"] for line in emf_lines(mock_emf_logger)] == [MAX_VALUES_PER_LINE]
+
+
+def test_metrics_are_flushed_when_the_worker_shuts_down(mock_emf_logger):
+    middleware = ActorMetricsMiddleware(flush_interval=60)
+    process(middleware, make_message())
+
+    middleware.after_worker_shutdown(None, None)
+
+    assert len(emf_lines(mock_emf_logger)) == 1
+
+
+def test_nothing_is_written_without_any_messages(mock_emf_logger):
+    ActorMetricsMiddleware().flush()
+
+    mock_emf_logger.info.assert_not_called()
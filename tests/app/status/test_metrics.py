@@ -0,0 +1,123 @@
+import pytest
+
+from app.status.metrics import (
+    MAX_METRICS_PER_REQUEST,
+    MAX_VALUES_PER_METRIC,
+    MetricsBuffer,
+)
+
+
+@pytest.fixture
+def metrics(mocker):
+    metrics = MetricsBuffer()
+    metrics.enabled = True
+    mocker.patch.object(metrics, "_ensure_flush_thread")
+    return metrics
+
+
+@pytest.fixture
+def mock_cloudwatch(mocker):
+    return mocker.patch("app.aws_clients.client").return_value
+
+
+def sent_metrics(mock_cloudwatch):
+    return [
+        {key: value for key, value in metric.items() if key != "Timestamp"}
+        for call in mock_cloudwatch.put_metric_data.call_args_list
+        for metric in call.kwargs["MetricData"]
+    ]
+
+
+def test_metrics_are_aggregated_until_flushed(metrics, mock_cloudwatch):
+    metrics.increment("Sent", dimensions={"Provider": "ee"})
+    metrics.increment("Sent", 2, dimensions={"Provider": "ee"})
+    metrics.increment("Sent", dimensions={"Provider": "o2"})
+    metrics.gauge("QueueDepth", 5)
+    metrics.gauge("QueueDepth", 3)
+    for milliseconds in [10, 20, 10]:
+        metrics.timing("Latency", milliseconds)
+
+    mock_cloudwatch.put_metric_data.assert_not_called()
+
+    metrics.flush()
+
+    mock_cloudwatch.put_metric_data.assert_called_once()
+    assert mock_cloudwatch.put_metric_data.call_args.kwargs["Namespace"] == "Emergency Alerts"
+    assert sent_metrics(mock_cloudwatch) == [
+        {"MetricName": "Sent", "Dimensions": [{"Name": "Provider", "Value": "ee"}], "Unit": "Count", "Value": 3},
+        {"MetricName": "Sent", "Dimensions": [{"Name": "Provider", "Value": "o2"}], "Unit": "Count", "Value": 1},
+        {"MetricName": "QueueDepth", "Dimensions": [], "Unit": "Count", "Value": 3},
+        {"MetricName": "Latency", "Dimensions": [], "Unit": "Milliseconds", "Values": [10, 20], "Counts": [2, 1]},
+    ]
+
+    mock_cloudwatch.reset_mock()
+    metrics.flush()
+
+    mock_cloudwatch.put_metric_data.assert_not_called()
+
+
+def test_timer_records_elapsed_milliseconds(metrics, mocker):
+    mocker.patch("app.status.metrics.time.perf_counter", side_effect=[1.0, 1.25])
+    mock_timing = mocker.patch.object(metrics, "timing")
+
+    with metrics.timer("Validation", dimensions={"Stage": "xsd"}):
+        pass
+
+    mock_timing.assert_called_once_with(
+        "Validation", pytest.approx(250), dimensions={"Stage": "xsd"}, namespace="Emergency Alerts"
+    )
+
+
+def test_large_batches_are_split_to_fit_cloudwatch_limits(metrics, mock_cloudwatch):
+    for index in range(MAX_METRICS_PER_REQUEST + 1):
+        metrics.increment("Sent", dimensions={"Index": index})
+    for milliseconds in range(MAX_VALUES_PER_METRIC + 1):
+        metrics.timing("Latency", milliseconds, namespace="Other")
+
+    metrics.flush()
+
+    assert [
+        (call.kwargs["Namespace"], len(call.kwargs["MetricData"]))
+        for call in mock_cloudwatch.put_metric_data.call_args_list
+    ] == [("Emergency Alerts", MAX_METRICS_PER_REQUEST), ("Emergency Alerts", 1), ("Other", 2)]
+
+
+def test_failed_puts_are_logged_and_dropped(metrics, mock_cloudwatch, caplog):
+    mock_cloudwatch.put_metric_data.side_effect = Exception("throttled")
+    metrics.increment("Sent")
+
+    metrics.flush()
+
+    assert "Couldn't post metrics to CloudWatch" in caplog.messages
+    mock_cloudwatch.reset_mock()
+    metrics.flush()
+    mock_cloudwatch.put_metric_data.assert_not_called()
+
+
+def test_nothing_is_recorded_when_disabled(metrics, mock_cloudwatch):
+    metrics.enabled = False
+
+    metrics.increment("Sent")
+    metrics.gauge("QueueDepth", 1)
+    metrics.timing("Latency", 1)
+    metrics.flush()
+
+    mock_cloudwatch.put_metric_data.assert_not_called()
+    metrics._ensure_flush_thread.assert_not_called()
+
+
+def test_flush_thread_is_started_once_per_process(mocker):
+    mock_thread = mocker.patch("app.status.metrics.threading.Thread")
+    metrics = MetricsBuffer()
+    metrics.enabled = True
+
+    metrics.increment("Sent")
+    metrics.increment("Sent")
+
+    mock_thread.assert_called_once_with(target=metrics._flush_periodically, name="metrics-flush", daemon=True)
+    mock_thread.return_value.start.assert_called_once_with()
+
+    mocker.patch("app.status.metrics.os.getpid", return_value=-1)
+    metrics.increment("Sent")
+
+    assert mock_thread.call_count == 2
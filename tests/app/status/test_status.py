@@ -1,9 +1,19 @@
 import os
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from unittest.mock import call
 
 import pytest
 from flask import json
 
+from app.dao.route_advisor_dao import dao_set_route_circuit_state
+from app.status.healthcheck import (
+    post_aws_client_counts_to_cloudwatch,
+    post_provider_queue_depths_to_cloudwatch,
+)
+from app.tasks.broadcast_message_tasks import provider_queue_name
 from tests.app.db import create_organisation, create_service
+from tests.conftest import set_config_values
 
 aws_region = os.environ.get("AWS_REGION", "eu-west-2")
 
@@ -79,3 +89,64 @@ def test_populated_live_service_and_organisation_counts(admin_request):
         "organisations": 2,
         "services": 8,
     }
+
+
+def test_cbc_route_status_requires_authentication(client, notify_api):
+    response = client.get("/_api_status/cbc-routes")
+
+    assert response.status_code == 401
+
+
+def test_cbc_route_status_returns_circuit_states(admin_request, notify_db_session):
+    now = datetime.now(timezone.utc)
+    dao_set_route_circuit_state("ee-1-proxy", "cbc_a", "open", 3, now)
+    dao_set_route_circuit_state("ee-1-proxy", "cbc_b", "open", 5, now - timedelta(minutes=5))
+    dao_set_route_circuit_state("ee-2-proxy", "cbc_a", "closed", 0, None)
+
+    resp_json = admin_request.get("status.cbc_route_status")
+
+    assert [
+        (route["proxy"], route["target"], route["state"], route["consecutive_failures"])
+        for route in resp_json["routes"]
+    ] == [
+        ("ee-1-proxy", "cbc_a", "open", 3),
+        ("ee-1-proxy", "cbc_b", "half-open", 5),
+        ("ee-2-proxy", "cbc_a", "closed", 0),
+    ]
+
+
+def test_post_provider_queue_depths_to_cloudwatch(notify_api, mocker):
+    mock_gauge = mocker.patch("app.status.healthcheck.metrics.gauge")
+    mock_boto_client = mocker.patch("app.status.healthcheck.aws_clients.client")
+    mock_sqs = mock_boto_client.return_value
+    mock_sqs.get_queue_url.side_effect = lambda QueueName: {"QueueUrl": f"https://sqs/{QueueName}"}
+    mock_sqs.get_queue_attributes.return_value = {
+        "Attributes": {"ApproximateNumberOfMessages": "3", "ApproximateNumberOfMessagesNotVisible": "1"}
+    }
+
+    with set_config_values(notify_api, {"ENABLED_CBCS": {"ee", "vodafone"}, "QUEUE_PREFIX": "test-dramatiq-"}):
+        post_provider_queue_depths_to_cloudwatch()
+
+    assert mock_sqs.get_queue_url.call_args_list == [
+        call(QueueName=f"test-dramatiq-{provider_queue_name('ee')}"),
+        call(QueueName=f"test-dramatiq-{provider_queue_name('vodafone')}"),
+    ]
+    assert mock_gauge.call_args_list == [
+        call("ProviderQueueDepth", 3, dimensions={"Provider": "ee"}),
+        call("ProviderQueueInFlight", 1, dimensions={"Provider": "ee"}),
+        call("ProviderQueueDepth", 3, dimensions={"Provider": "vodafone"}),
+        call("ProviderQueueInFlight", 1, dimensions={"Provider": "vodafone"}),
+    ]
+
+
+def test_post_aws_client_counts_to_cloudwatch(notify_api, mocker):
+    mocker.patch("app.status.healthcheck.aws_clients._clients_created", Counter({"sqs": 2, "lambda": 1}))
+    mock_gauge = mocker.patch("app.status.healthcheck.metrics.gauge")
+
+    with set_config_values(notify_api, {"SERVICE": "api"}):
+        post_aws_client_counts_to_cloudwatch()
+
+    assert mock_gauge.call_args_list == [
+        call("AwsClientsCreated", 1, dimensions={"Application": "api", "AwsService": "lambda"}),
+        call("AwsClientsCreated", 2, dimensions={"Application": "api", "AwsService": "sqs"}),
+    ]
@@ -1,11 +1,17 @@
-from datetime import datetime
+import json
+import time
+from datetime import datetime, timezone
 from unittest.mock import ANY, Mock, call
 
 import pytest
+import requests
+import urllib3
+from dramatiq.middleware import Retries
 from dramatiq.middleware.time_limit import TimeLimitExceeded
 from dramatiq.threading import Interrupt
 from freezegun import freeze_time
 
+from app.clients.cbc_payload import StagedBroadcastPayload
 from app.clients.cbc_proxy import CBCProxyRetryableException
 from app.dao.broadcast_service_dao import set_service_broadcast_providers
 from app.models import (
@@ -19,7 +25,14 @@ from app.models import (
 )
 from app.tasks.broadcast_message_tasks import (
     BroadcastIntegrityError,
+    CBCProxyRetryScheduled,
+    SideEffectRetryableException,
     _check_event_makes_sense_in_sequence,
+    create_p1_zendesk_alert,
+    get_retry_delay_ms,
+    provider_queue_name,
+    queue_broadcast_provider_message,
+    run_link_tests,
     send_broadcast_event,
     send_broadcast_provider_message,
     trigger_link_test,
@@ -30,7 +43,12 @@ from tests.app.db import (
     create_broadcast_provider_message,
     create_template,
 )
-from tests.conftest import set_config
+from tests.conftest import set_config, set_config_values
+from tests.utils import count_sqlalchemy_statements
+
+
+def get_staged_fields(mock_send_staged_broadcast):
+    return json.loads(mock_send_staged_broadcast.call_args.kwargs["staged_payload"].fields_json)
 
 
 def test_send_broadcast_event_queues_up_for_active_providers(mocker, notify_api, sample_broadcast_service):
@@ -53,6 +71,70 @@ def test_send_broadcast_event_queues_up_for_active_providers(mocker, notify_api,
     assert call(broadcast_event_id=event.id, provider="vodafone") in args
 
 
+def test_send_broadcast_event_stages_payload_for_alerts(mocker, notify_api, sample_broadcast_service):
+    template = create_template(sample_broadcast_service, BROADCAST_TYPE)
+    broadcast_message = create_broadcast_message(
+        template,
+        areas={"areas": ["london"], "simple_polygons": [[[50.12, 1.2], [50.13, 1.2], [50.14, 1.21]]]},
+        status=BroadcastStatusType.BROADCASTING,
+    )
+    event = create_broadcast_event(broadcast_message)
+
+    mocker.patch("app.tasks.broadcast_message_tasks.publish_govuk_alerts.send")
+    mocker.patch("app.tasks.broadcast_message_tasks.send_broadcast_provider_message.send")
+
+    with set_config(notify_api, "ENABLED_CBCS", {"ee", "vodafone"}):
+        send_broadcast_event(event.id)
+
+    assert event.staged_payload["welsh"] is False
+    assert json.loads(event.staged_payload["fields_json"]) == {
+        "headline": "GOV.UK Emergency Alert",
+        "description": "this is an emergency broadcast message",
+        "areas": [{"polygon": [[50.12, 1.2], [50.13, 1.2], [50.14, 1.21]]}],
+        "sent": event.sent_at_as_cap_datetime_string,
+        "expires": event.transmitted_finishes_at_as_cap_datetime_string,
+        "channel": "severe",
+    }
+
+
+def test_send_broadcast_event_publishes_and_sends_if_staging_fails(mocker, notify_api, sample_broadcast_service):
+    template = create_template(sample_broadcast_service, BROADCAST_TYPE)
+    broadcast_message = create_broadcast_message(template, status=BroadcastStatusType.BROADCASTING)
+    event = create_broadcast_event(broadcast_message)
+
+    mocker.patch(
+        "app.tasks.broadcast_message_tasks.StagedBroadcastPayload.for_broadcast_event",
+        side_effect=Exception("Couldn't encode areas"),
+    )
+    mock_publish = mocker.patch("app.tasks.broadcast_message_tasks.publish_govuk_alerts.send")
+    mock_send_broadcast_provider_message = mocker.patch(
+        "app.tasks.broadcast_message_tasks.send_broadcast_provider_message.send"
+    )
+
+    set_service_broadcast_providers(sample_broadcast_service, ["ee"])
+    with set_config(notify_api, "ENABLED_CBCS", {"ee"}):
+        send_broadcast_event(event.id)
+
+    mock_publish.assert_called_once_with(broadcast_event_id=event.id)
+    mock_send_broadcast_provider_message.assert_called_once_with(broadcast_event_id=event.id, provider="ee")
+    # The provider task builds the payload itself
+    assert event.staged_payload is None
+
+
+def test_send_broadcast_event_does_not_stage_payload_for_cancels(mocker, notify_api, sample_broadcast_service):
+    template = create_template(sample_broadcast_service, BROADCAST_TYPE)
+    broadcast_message = create_broadcast_message(template, status=BroadcastStatusType.CANCELLED)
+    event = create_broadcast_event(broadcast_message, message_type=BroadcastEventMessageType.CANCEL)
+
+    mocker.patch("app.tasks.broadcast_message_tasks.publish_govuk_alerts.send")
+    mocker.patch("app.tasks.broadcast_message_tasks.send_broadcast_provider_message.send")
+
+    with set_config(notify_api, "ENABLED_CBCS", {"ee", "vodafone"}):
+        send_broadcast_event(event.id)
+
+    assert event.staged_payload is None
+
+
 @pytest.mark.parametrize(
     "message_status",
     [
@@ -120,6 +202,153 @@ def test_send_broadcast_event_does_nothing_if_provider_set_on_service_isnt_enabl
     assert mock_send_broadcast_provider_message.called is False
 
 
+def test_send_broadcast_event_sends_to_providers_from_the_task_in_concurrent_mode(
+    mocker, notify_api, sample_broadcast_service
+):
+    template = create_template(sample_broadcast_service, BROADCAST_TYPE)
+    broadcast_message = create_broadcast_message(template, status=BroadcastStatusType.BROADCASTING)
+    event = create_broadcast_event(broadcast_message)
+
+    mocker.patch("app.tasks.broadcast_message_tasks.publish_govuk_alerts.send")
+    mock_send = mocker.patch("app.tasks.broadcast_message_tasks._send_broadcast_provider_message")
+    mock_send_broadcast_provider_message = mocker.patch(
+        "app.tasks.broadcast_message_tasks.send_broadcast_provider_message.send",
+    )
+
+    set_service_broadcast_providers(sample_broadcast_service, ["ee", "vodafone"])
+    with set_config_values(notify_api, {"ENABLED_CBCS": {"ee", "vodafone"}, "CBC_CONCURRENT_PROVIDER_DISPATCH": True}):
+        send_broadcast_event(event.id)
+
+    assert sorted(mock_send.call_args_list) == [
+        call(broadcast_event_id=event.id, provider="ee"),
+        call(broadcast_event_id=event.id, provider="vodafone"),
+    ]
+    assert mock_send_broadcast_provider_message.called is False
+
+
+def test_send_broadcast_event_queues_failed_providers_to_retry_in_concurrent_mode(
+    mocker, notify_api, sample_broadcast_service
+):
+    template = create_template(sample_broadcast_service, BROADCAST_TYPE)
+    broadcast_message = create_broadcast_message(template, status=BroadcastStatusType.BROADCASTING)
+    event = create_broadcast_event(broadcast_message)
+
+    def fail_for_vodafone(*, broadcast_event_id, provider):
+        if provider == "vodafone":
+            raise CBCProxyRetryableException("Vodafone is down")
+
+    mocker.patch("app.tasks.broadcast_message_tasks.publish_govuk_alerts.send")
+    mocker.patch("app.tasks.broadcast_message_tasks._send_broadcast_provider_message", side_effect=fail_for_vodafone)
+    mock_send_broadcast_provider_message = mocker.patch(
+        "app.tasks.broadcast_message_tasks.send_broadcast_provider_message.send",
+    )
+
+    set_service_broadcast_providers(sample_broadcast_service, ["ee", "vodafone"])
+    with set_config_values(notify_api, {"ENABLED_CBCS": {"ee", "vodafone"}, "CBC_CONCURRENT_PROVIDER_DISPATCH": True}):
+        send_broadcast_event(event.id)
+
+    mock_send_broadcast_provider_message.assert_called_once_with(broadcast_event_id=event.id, provider="vodafone")
+
+
+def test_send_broadcast_event_does_not_retry_non_retryable_failures_in_concurrent_mode(
+    mocker, notify_api, sample_broadcast_service
+):
+    template = create_template(sample_broadcast_service, BROADCAST_TYPE)
+    broadcast_message = create_broadcast_message(template, status=BroadcastStatusType.BROADCASTING)
+    event = create_broadcast_event(broadcast_message)
+
+    def fail_for_vodafone(*, broadcast_event_id, provider):
+        if provider == "vodafone":
+            raise BroadcastIntegrityError("Previous event has not finished sending")
+
+    mocker.patch("app.tasks.broadcast_message_tasks.publish_govuk_alerts.send")
+    mocker.patch("app.tasks.broadcast_message_tasks._send_broadcast_provider_message", side_effect=fail_for_vodafone)
+    mock_send_broadcast_provider_message = mocker.patch(
+        "app.tasks.broadcast_message_tasks.send_broadcast_provider_message.send",
+    )
+    mock_logger = mocker.patch("app.tasks.broadcast_message_tasks.current_app.logger.exception")
+
+    set_service_broadcast_providers(sample_broadcast_service, ["ee", "vodafone"])
+    with set_config_values(notify_api, {"ENABLED_CBCS": {"ee", "vodafone"}, "CBC_CONCURRENT_PROVIDER_DISPATCH": True}):
+        send_broadcast_event(event.id)
+
+    assert mock_send_broadcast_provider_message.called is False
+    mock_logger.assert_called_once_with("Concurrent send failed and can't be retried", exc_info=ANY, extra=ANY)
+    assert isinstance(mock_logger.call_args.kwargs["exc_info"], BroadcastIntegrityError)
+
+
+def test_queue_broadcast_provider_message_uses_shared_queue_by_default(mocker, notify_api):
+    mock_actor = mocker.patch("app.tasks.broadcast_message_tasks.send_broadcast_provider_message")
+
+    with set_config(notify_api, "CBC_PROVIDER_QUEUES_ENABLED", False):
+        queue_broadcast_provider_message("event-id", "ee")
+
+    mock_actor.send.assert_called_once_with(broadcast_event_id="event-id", provider="ee")
+    assert mock_actor.broker.enqueue.called is False
+
+
+def test_queue_broadcast_provider_message_uses_provider_queue_if_enabled(mocker, notify_api):
+    mock_actor = mocker.patch("app.tasks.broadcast_message_tasks.send_broadcast_provider_message")
+    message = mock_actor.message_with_options.return_value
+
+    with set_config(notify_api, "CBC_PROVIDER_QUEUES_ENABLED", True):
+        queue_broadcast_provider_message("event-id", "ee")
+
+    assert mock_actor.send.called is False
+    mock_actor.broker.declare_queue.assert_called_once_with(provider_queue_name("ee"))
+    mock_actor.message_with_options.assert_called_once_with(kwargs={"broadcast_event_id": "event-id", "provider": "ee"})
+    message.copy.assert_called_once_with(queue_name=provider_queue_name("ee"))
+    mock_actor.broker.enqueue.assert_called_once_with(message.copy.return_value)
+
+
+def test_send_broadcast_provider_message_logs_queue_wait(mocker, notify_api):
+    mocker.patch(
+        "app.tasks.broadcast_message_tasks.CurrentMessage.get_current_message",
+        return_value=Mock(
+            queue_name="high-priority-ee", message_timestamp=round(time.time() * 1000) - 2500, options={"retries": 2}
+        ),
+    )
+    mock_send = mocker.patch("app.tasks.broadcast_message_tasks._send_broadcast_provider_message")
+    mock_logger = mocker.patch("app.tasks.broadcast_message_tasks.current_app.logger.info")
+
+    send_broadcast_provider_message(broadcast_event_id="event-id", provider="ee")
+
+    mock_send.assert_called_once_with(broadcast_event_id="event-id", provider="ee")
+    log_extra = mock_logger.call_args.kwargs["extra"]
+    assert log_extra["cbc_provider"] == "ee"
+    assert log_extra["queue_name"] == "high-priority-ee"
+    assert 2500 <= log_extra["queue_wait_ms"] < 3500
+    assert log_extra["retries"] == 2
+
+
+@freeze_time("2020-08-01 12:00")
+def test_send_broadcast_event_records_provider_messages_in_concurrent_mode(
+    mocker, notify_api, notify_db_session, sample_broadcast_service
+):
+    template = create_template(sample_broadcast_service, BROADCAST_TYPE)
+    broadcast_message = create_broadcast_message(template, status=BroadcastStatusType.BROADCASTING)
+    event = create_broadcast_event(broadcast_message)
+
+    mocker.patch("app.tasks.broadcast_message_tasks.publish_govuk_alerts.send")
+    mock_send_ee = mocker.patch("app.clients.cbc_proxy.CBCProxyEE.send_staged_broadcast")
+    mock_send_vodafone = mocker.patch("app.clients.cbc_proxy.CBCProxyVodafone.send_staged_broadcast")
+
+    set_service_broadcast_providers(sample_broadcast_service, ["ee", "vodafone"])
+    with set_config_values(notify_api, {"ENABLED_CBCS": {"ee", "vodafone"}, "CBC_CONCURRENT_PROVIDER_DISPATCH": True}):
+        send_broadcast_event(str(event.id))
+
+    # The providers were sent to from other threads, with their own sessions
+    notify_db_session.expire_all()
+
+    for provider, mock_send in [("ee", mock_send_ee), ("vodafone", mock_send_vodafone)]:
+        provider_message = event.get_provider_message(provider)
+        assert [status.status for status in provider_message.statuses] == [
+            BROADCAST_PROVIDER_STATUS_SENDING,
+            BROADCAST_PROVIDER_STATUS_ACK,
+        ]
+        mock_send.assert_called_once_with(identifier=str(provider_message.id), message_number=ANY, staged_payload=ANY)
+
+
 @freeze_time("2020-08-01 12:00")
 @pytest.mark.parametrize(
     "provider,provider_capitalised",
@@ -148,7 +377,7 @@ def test_send_broadcast_provider_message_sends_data_correctly(
     event = create_broadcast_event(broadcast_message)
 
     mock_create_broadcast = mocker.patch(
-        f"app.clients.cbc_proxy.CBCProxy{provider_capitalised}.create_and_send_broadcast",
+        f"app.clients.cbc_proxy.CBCProxy{provider_capitalised}.send_staged_broadcast",
     )
 
     assert event.get_provider_message(provider) is None
@@ -164,9 +393,12 @@ def test_send_broadcast_provider_message_sends_data_correctly(
     mock_create_broadcast.assert_called_once_with(
         identifier=str(broadcast_provider_message.id),
         message_number=mocker.ANY,
-        headline="GOV.UK Emergency Alert",
-        description="this is an emergency broadcast message",
-        areas=[
+        staged_payload=ANY,
+    )
+    assert get_staged_fields(mock_create_broadcast) == {
+        "headline": "GOV.UK Emergency Alert",
+        "description": "this is an emergency broadcast message",
+        "areas": [
             {
                 "polygon": [
                     [50.12, 1.2],
@@ -183,10 +415,10 @@ def test_send_broadcast_provider_message_sends_data_correctly(
                 ],
             },
         ],
-        sent=event.sent_at_as_cap_datetime_string,
-        expires=event.transmitted_finishes_at_as_cap_datetime_string,
-        channel="severe",
-    )
+        "sent": event.sent_at_as_cap_datetime_string,
+        "expires": event.transmitted_finishes_at_as_cap_datetime_string,
+        "channel": "severe",
+    }
 
 
 @freeze_time("2020-08-01 12:00")
@@ -219,7 +451,7 @@ def test_send_broadcast_provider_message_uses_channel_set_on_broadcast_service(
     event = create_broadcast_event(broadcast_message)
 
     mock_create_broadcast = mocker.patch(
-        f"app.clients.cbc_proxy.CBCProxy{provider_capitalised}.create_and_send_broadcast",
+        f"app.clients.cbc_proxy.CBCProxy{provider_capitalised}.send_staged_broadcast",
     )
 
     send_broadcast_provider_message(provider=provider, broadcast_event_id=str(event.id))
@@ -227,12 +459,32 @@ def test_send_broadcast_provider_message_uses_channel_set_on_broadcast_service(
     mock_create_broadcast.assert_called_once_with(
         identifier=mocker.ANY,
         message_number=mocker.ANY,
-        headline="GOV.UK Emergency Alert",
-        description="this is an emergency broadcast message",
-        areas=mocker.ANY,
-        sent=mocker.ANY,
-        expires=mocker.ANY,
-        channel=channel,
+        staged_payload=ANY,
+    )
+    assert get_staged_fields(mock_create_broadcast) == {
+        "headline": "GOV.UK Emergency Alert",
+        "description": "this is an emergency broadcast message",
+        "areas": mocker.ANY,
+        "sent": mocker.ANY,
+        "expires": mocker.ANY,
+        "channel": channel,
+    }
+
+
+def test_send_broadcast_provider_message_sends_payload_staged_on_event(mocker, sample_broadcast_service):
+    template = create_template(sample_broadcast_service, BROADCAST_TYPE)
+    broadcast_message = create_broadcast_message(template, status=BroadcastStatusType.BROADCASTING)
+    event = create_broadcast_event(broadcast_message)
+    event.staged_payload = {"fields_json": '{"description": "staged description"}', "welsh": True}
+
+    mock_send_staged_broadcast = mocker.patch("app.clients.cbc_proxy.CBCProxyEE.send_staged_broadcast")
+
+    send_broadcast_provider_message(provider="ee", broadcast_event_id=str(event.id))
+
+    mock_send_staged_broadcast.assert_called_once_with(
+        identifier=ANY,
+        message_number=None,
+        staged_payload=StagedBroadcastPayload(fields_json='{"description": "staged description"}', welsh=True),
     )
 
 
@@ -258,7 +510,7 @@ def test_send_broadcast_provider_message_works_if_we_retried_previously(mocker,
     assert broadcast_provider_message.get_latest_status_entry() == broadcast_provider_message.statuses[0]
 
     mock_create_broadcast = mocker.patch(
-        "app.clients.cbc_proxy.CBCProxyEE.create_and_send_broadcast",
+        "app.clients.cbc_proxy.CBCProxyEE.send_staged_broadcast",
     )
 
     send_broadcast_provider_message(provider="ee", broadcast_event_id=str(event.id))
@@ -277,13 +529,16 @@ def test_send_broadcast_provider_message_works_if_we_retried_previously(mocker,
     mock_create_broadcast.assert_called_once_with(
         identifier=str(broadcast_provider_message.id),
         message_number=mocker.ANY,
-        headline="GOV.UK Emergency Alert",
-        description="this is an emergency broadcast message",
-        areas=[],
-        sent=event.sent_at_as_cap_datetime_string,
-        expires=event.transmitted_finishes_at_as_cap_datetime_string,
-        channel="severe",
+        staged_payload=ANY,
     )
+    assert get_staged_fields(mock_create_broadcast) == {
+        "headline": "GOV.UK Emergency Alert",
+        "description": "this is an emergency broadcast message",
+        "areas": [],
+        "sent": event.sent_at_as_cap_datetime_string,
+        "expires": event.transmitted_finishes_at_as_cap_datetime_string,
+        "channel": "severe",
+    }
 
 
 @freeze_time("2020-08-01 12:00")
@@ -315,7 +570,7 @@ def test_send_broadcast_provider_message_sends_data_correctly_when_broadcast_mes
     event = create_broadcast_event(broadcast_message)
 
     mock_create_broadcast = mocker.patch(
-        f"app.clients.cbc_proxy.CBCProxy{provider_capitalised}.create_and_send_broadcast",
+        f"app.clients.cbc_proxy.CBCProxy{provider_capitalised}.send_staged_broadcast",
     )
 
     send_broadcast_provider_message(provider=provider, broadcast_event_id=str(event.id))
@@ -325,13 +580,16 @@ def test_send_broadcast_provider_message_sends_data_correctly_when_broadcast_mes
     mock_create_broadcast.assert_called_once_with(
         identifier=str(broadcast_provider_message.id),
         message_number=mocker.ANY,
-        headline="GOV.UK Emergency Alert",
-        description="this is an emergency broadcast message",
-        areas=mocker.ANY,
-        sent=mocker.ANY,
-        expires=mocker.ANY,
-        channel="severe",
+        staged_payload=ANY,
     )
+    assert get_staged_fields(mock_create_broadcast) == {
+        "headline": "GOV.UK Emergency Alert",
+        "description": "this is an emergency broadcast message",
+        "areas": mocker.ANY,
+        "sent": mocker.ANY,
+        "expires": mocker.ANY,
+        "channel": "severe",
+    }
 
 
 @pytest.mark.parametrize(
@@ -449,6 +707,39 @@ def test_send_broadcast_provider_message_sends_cancel_with_references(
     )
 
 
+def test_send_broadcast_provider_message_query_count_does_not_grow_with_earlier_events(
+    mocker, sample_broadcast_service
+):
+    template = create_template(sample_broadcast_service, BROADCAST_TYPE, content="content")
+
+    def create_cancel_event_after_updates(number_of_updates):
+        broadcast_message = create_broadcast_message(template, status=BroadcastStatusType.BROADCASTING)
+        for message_type in [BroadcastEventMessageType.ALERT] + [BroadcastEventMessageType.UPDATE] * number_of_updates:
+            event = create_broadcast_event(broadcast_message, message_type=message_type)
+            create_broadcast_provider_message(event, "vodafone", status=BROADCAST_PROVIDER_STATUS_ACK)
+        return str(create_broadcast_event(broadcast_message, message_type=BroadcastEventMessageType.CANCEL).id)
+
+    def read_previous_provider_messages(**kwargs):
+        # the proxy reads these when building the references for the cancel
+        return [
+            (provider_message.id, provider_message.created_at, provider_message.message_number)
+            for provider_message in kwargs["previous_provider_messages"]
+        ]
+
+    mocker.patch(
+        "app.clients.cbc_proxy.CBCProxyVodafone.cancel_broadcast",
+        side_effect=read_previous_provider_messages,
+    )
+
+    statement_counts = []
+    for cancel_event_id in [create_cancel_event_after_updates(1), create_cancel_event_after_updates(5)]:
+        with count_sqlalchemy_statements() as get_statement_count:
+            send_broadcast_provider_message(provider="vodafone", broadcast_event_id=cancel_event_id)
+            statement_counts.append(get_statement_count())
+
+    assert statement_counts[0] == statement_counts[1]
+
+
 @pytest.mark.parametrize(
     "provider,provider_capitalised",
     [
@@ -484,7 +775,7 @@ def test_send_broadcast_provider_message_error_statuses_are_saved(
     event = create_broadcast_event(broadcast_message)
 
     mock_create_broadcast = mocker.patch(
-        f"app.clients.cbc_proxy.CBCProxy{provider_capitalised}.create_and_send_broadcast",
+        f"app.clients.cbc_proxy.CBCProxy{provider_capitalised}.send_staged_broadcast",
         side_effect=exception_type,
     )
 
@@ -499,9 +790,12 @@ def test_send_broadcast_provider_message_error_statuses_are_saved(
     mock_create_broadcast.assert_called_once_with(
         identifier=ANY,
         message_number=mocker.ANY,
-        headline="GOV.UK Emergency Alert",
-        description="this is an emergency broadcast message",
-        areas=[
+        staged_payload=ANY,
+    )
+    assert get_staged_fields(mock_create_broadcast) == {
+        "headline": "GOV.UK Emergency Alert",
+        "description": "this is an emergency broadcast message",
+        "areas": [
             {
                 "polygon": [
                     [50.12, 1.2],
@@ -510,19 +804,144 @@ def test_send_broadcast_provider_message_error_statuses_are_saved(
                 ],
             }
         ],
-        sent=event.sent_at_as_cap_datetime_string,
-        expires=event.transmitted_finishes_at_as_cap_datetime_string,
-        channel="severe",
-    )
+        "sent": event.sent_at_as_cap_datetime_string,
+        "expires": event.transmitted_finishes_at_as_cap_datetime_string,
+        "channel": "severe",
+    }
     broadcast_provider_message = event.get_provider_message(provider)
 
     assert len(broadcast_provider_message.statuses) == 2
     assert broadcast_provider_message.statuses[0].status == BROADCAST_PROVIDER_STATUS_SENDING
     assert broadcast_provider_message.statuses[1].status == BROADCAST_PROVIDER_STATUS_ERR
-    assert broadcast_provider_message.statuses[1].error_detail == {"exception": exception_detail}
+    assert broadcast_provider_message.statuses[1].error_detail == {
+        "exception": exception_detail,
+        "attempt": 1,
+        "retry_in_ms": ANY,
+    }
     assert broadcast_provider_message.get_latest_status_entry() == broadcast_provider_message.statuses[1]
 
 
+@freeze_time("2020-08-01 12:00")
+def test_send_broadcast_provider_message_schedules_retry_from_attempt_number(mocker, sample_broadcast_service):
+    template = create_template(sample_broadcast_service, BROADCAST_TYPE)
+    broadcast_message = create_broadcast_message(template, status=BroadcastStatusType.BROADCASTING)
+    event = create_broadcast_event(broadcast_message)
+
+    mocker.patch(
+        "app.clients.cbc_proxy.CBCProxyEE.send_staged_broadcast",
+        side_effect=CBCProxyRetryableException("test"),
+    )
+    mocker.patch(
+        "app.tasks.broadcast_message_tasks.CurrentMessage.get_current_message",
+        return_value=Mock(queue_name="high-priority", message_timestamp=0, options={"retries": 3}),
+    )
+    mock_get_retry_delay = mocker.patch("app.tasks.broadcast_message_tasks.get_retry_delay_ms", return_value=12345)
+
+    with pytest.raises(CBCProxyRetryScheduled) as exc:
+        send_broadcast_provider_message(provider="ee", broadcast_event_id=str(event.id))
+
+    assert exc.value.delay == 12345
+    mock_get_retry_delay.assert_called_once_with(4, event.transmitted_finishes_at)
+    assert event.get_provider_message("ee").get_latest_status_entry().error_detail == {
+        "exception": "CBCProxyRetryableException('test')",
+        "attempt": 4,
+        "retry_in_ms": 12345,
+    }
+
+
+@freeze_time("2020-08-01 12:00")
+def test_send_broadcast_provider_message_stops_retrying_if_broadcast_will_have_expired(
+    mocker, sample_broadcast_service
+):
+    template = create_template(sample_broadcast_service, BROADCAST_TYPE)
+    broadcast_message = create_broadcast_message(template, status=BroadcastStatusType.BROADCASTING)
+    event = create_broadcast_event(broadcast_message)
+
+    mocker.patch(
+        "app.clients.cbc_proxy.CBCProxyEE.send_staged_broadcast",
+        side_effect=CBCProxyRetryableException("test"),
+    )
+    mocker.patch("app.tasks.broadcast_message_tasks.get_retry_delay_ms", return_value=None)
+
+    with pytest.raises(BroadcastIntegrityError) as exc:
+        send_broadcast_provider_message(provider="ee", broadcast_event_id=str(event.id))
+
+    assert "before it could be retried" in str(exc.value)
+    latest_status = event.get_provider_message("ee").get_latest_status_entry()
+    assert latest_status.status == BROADCAST_PROVIDER_STATUS_ERR
+    assert latest_status.error_detail == {
+        "exception": "CBCProxyRetryableException('test')",
+        "attempt": 1,
+        "retry_in_ms": None,
+    }
+
+
+def test_send_broadcast_provider_message_is_retried_past_dramatiqs_default_retry_limit():
+    broker = Mock()
+    broker.get_actor.return_value = send_broadcast_provider_message
+    message = send_broadcast_provider_message.message_with_options(
+        kwargs={"broadcast_event_id": "1234", "provider": "ee"}, retries=25
+    )
+
+    Retries().after_process_message(broker, message, exception=CBCProxyRetryScheduled("test", delay=300_000))
+
+    assert send_broadcast_provider_message.options["max_retries"] is None
+    broker.enqueue.assert_called_once_with(message, delay=300_000)
+    assert message.options["retries"] == 26
+
+
+@pytest.mark.parametrize(
+    "attempt, expected_delay",
+    [
+        (1, 1_000),
+        (2, 2_000),
+        (3, 4_000),
+        (4, 15_000),
+        (5, 30_000),
+        (8, 240_000),
+        (9, 300_000),
+        (20, 300_000),
+    ],
+)
+def test_get_retry_delay_ms_backs_off(mocker, attempt, expected_delay):
+    mock_uniform = mocker.patch("app.tasks.broadcast_message_tasks.random.uniform", side_effect=lambda a, b: b)
+    now = datetime(2020, 8, 1, 12, 0, tzinfo=timezone.utc)
+
+    assert get_retry_delay_ms(attempt, datetime(2020, 8, 2, 12, 0), now=now) == expected_delay
+    mock_uniform.assert_called_once_with(0, expected_delay / 2)
+
+
+def test_get_retry_delay_ms_is_jittered(mocker):
+    mocker.patch("app.tasks.broadcast_message_tasks.random.uniform", side_effect=lambda a, b: a)
+    now = datetime(2020, 8, 1, 12, 0, tzinfo=timezone.utc)
+
+    assert get_retry_delay_ms(4, datetime(2020, 8, 2, 12, 0), now=now) == 7_500
+
+
+@pytest.mark.parametrize(
+    "expires_at, expected_delay",
+    [
+        (datetime(2020, 8, 1, 12, 0, 5), 4_000),
+        (datetime(2020, 8, 1, 12, 0, 4), None),
+        (datetime(2020, 8, 1, 11, 59), None),
+    ],
+)
+def test_get_retry_delay_ms_gives_up_if_broadcast_will_have_expired(mocker, expires_at, expected_delay):
+    mocker.patch("app.tasks.broadcast_message_tasks.random.uniform", side_effect=lambda a, b: b)
+    now = datetime(2020, 8, 1, 12, 0, tzinfo=timezone.utc)
+
+    assert get_retry_delay_ms(3, expires_at, now=now) == expected_delay
+
+
+def test_run_link_tests_link_tests_all_enabled_cbcs(mocker, notify_api):
+    mock_send_link_tests = mocker.patch("app.tasks.broadcast_message_tasks.cbc_proxy_client.send_link_tests")
+
+    with set_config_values(notify_api, {"ENABLED_CBCS": {"vodafone", "ee"}, "CBC_LINK_TEST_TIMEOUT_SECONDS": 10}):
+        run_link_tests()
+
+    mock_send_link_tests.assert_called_once_with(["ee", "vodafone"], timeout=10)
+
+
 @pytest.mark.parametrize(
     "provider,provider_capitalised",
     [
@@ -692,7 +1111,7 @@ def test_send_broadcast_provider_message_doesnt_raise_for_sending_or_failed_stat
     mocker, sample_template, existing_message_status
 ):
     mocker.patch(
-        "app.clients.cbc_proxy.CBCProxyEE.create_and_send_broadcast",
+        "app.clients.cbc_proxy.CBCProxyEE.send_staged_broadcast",
     )
 
     broadcast_message = create_broadcast_message(sample_template)
@@ -752,4 +1171,90 @@ def test_send_broadcast_provider_message_does_nothing_if_cbc_proxy_disabled(mock
     with set_config(notify_api, "ENABLED_CBCS", {"ee", "vodafone"}), set_config(notify_api, "CBC_PROXY_ENABLED", False):
         send_broadcast_provider_message(broadcast_event_id=broadcast_event.id, provider="ee")
 
-    assert mock_client.create_and_send_broadcast.called is False
+    assert mock_client.send_staged_broadcast.called is False
+
+
+def test_create_p1_zendesk_alert_sends_ticket(mocker, sample_broadcast_service):
+    broadcast_message = create_broadcast_message(
+        service=sample_broadcast_service,
+        content="emergency broadcast",
+        status=BroadcastStatusType.BROADCASTING,
+        areas={"names": ["England"]},
+    )
+    mock_send_ticket_to_zendesk = mocker.patch("app.broadcast_message.utils.zendesk_client.send_ticket_to_zendesk")
+    mock_logger = mocker.patch("app.tasks.broadcast_message_tasks.current_app.logger.info")
+
+    create_p1_zendesk_alert(broadcast_message_id=str(broadcast_message.id), queued_at=time.time() - 2)
+
+    assert mock_send_ticket_to_zendesk.call_args.args[0].subject == "Live broadcast sent"
+    log_extra = mock_logger.call_args.kwargs["extra"]
+    assert log_extra["succeeded"] is True
+    assert log_extra["side_effect_queue_delay_ms"] >= 2000
+
+
+@pytest.mark.parametrize(
+    "exception",
+    [
+        requests.exceptions.ConnectTimeout("timed out"),
+        # What requests raises when the connection is refused
+        requests.exceptions.ConnectionError(
+            urllib3.exceptions.MaxRetryError(
+                None, "/api/v2/tickets", urllib3.exceptions.NewConnectionError(None, "Connection refused")
+            )
+        ),
+        requests.exceptions.ConnectionError(
+            urllib3.exceptions.MaxRetryError(
+                None, "/api/v2/tickets", urllib3.exceptions.NameResolutionError("zendesk.com", None, OSError())
+            )
+        ),
+    ],
+)
+def test_create_p1_zendesk_alert_raises_retryable_exception_if_zendesk_cant_be_reached(
+    mocker, sample_broadcast_service, exception
+):
+    broadcast_message = create_broadcast_message(
+        service=sample_broadcast_service,
+        content="emergency broadcast",
+        status=BroadcastStatusType.BROADCASTING,
+        areas={"names": ["England"]},
+    )
+    mocker.patch(
+        "app.broadcast_message.utils.zendesk_client.send_ticket_to_zendesk",
+        side_effect=exception,
+    )
+
+    assert create_p1_zendesk_alert.kw.get("allow_retry")
+    assert create_p1_zendesk_alert.kw.get("retry_for") == {SideEffectRetryableException}
+
+    with pytest.raises(SideEffectRetryableException):
+        create_p1_zendesk_alert(broadcast_message_id=str(broadcast_message.id), queued_at=time.time())
+
+
+@pytest.mark.parametrize(
+    "exception",
+    [
+        requests.exceptions.ReadTimeout("timed out"),
+        # What requests raises when the connection drops once the request has been sent
+        requests.exceptions.ConnectionError(
+            urllib3.exceptions.ProtocolError("Connection aborted.", ConnectionResetError("connection reset"))
+        ),
+        requests.exceptions.ConnectionError(
+            urllib3.exceptions.MaxRetryError(
+                None, "/api/v2/tickets", urllib3.exceptions.ProtocolError("Connection aborted.")
+            )
+        ),
+    ],
+)
+def test_create_p1_zendesk_alert_isnt_retried_if_the_ticket_may_have_been_created(
+    mocker, sample_broadcast_service, exception
+):
+    broadcast_message = create_broadcast_message(
+        service=sample_broadcast_service,
+        content="emergency broadcast",
+        status=BroadcastStatusType.BROADCASTING,
+        areas={"names": ["England"]},
+    )
+    mocker.patch("app.broadcast_message.utils.zendesk_client.send_ticket_to_zendesk", side_effect=exception)
+
+    with pytest.raises(type(exception)):
+        create_p1_zendesk_alert(broadcast_message_id=str(broadcast_message.id), queued_at=time.time())
@@ -1,7 +1,6 @@
 import time
 from collections import namedtuple
 from datetime import datetime, timedelta, timezone
-from unittest.mock import call
 
 import pytest
 from freezegun import freeze_time
@@ -50,53 +49,18 @@ MockServicesWithHighFailureRate = namedtuple(
 )
 
 
-def test_trigger_link_tests_calls_for_all_providers(mocker, notify_api):
-    _ = mocker.patch(
-        "app.tasks.scheduled_tasks.trigger_link_tests",
-    )
-    primary_to_A = mocker.patch("app.tasks.scheduled_tasks.trigger_link_test_primary_to_A.send")
-    primary_to_B = mocker.patch("app.tasks.scheduled_tasks.trigger_link_test_primary_to_B.send")
-    secondary_to_A = mocker.patch("app.tasks.scheduled_tasks.trigger_link_test_secondary_to_A.send")
-    secondary_to_B = mocker.patch("app.tasks.scheduled_tasks.trigger_link_test_secondary_to_B.send")
+def test_trigger_link_tests_queues_a_single_batched_link_test(mocker, notify_api):
+    mock_run_link_tests = mocker.patch("app.tasks.scheduled_tasks.run_link_tests.send")
+    per_route_tasks = [
+        mocker.patch(f"app.tasks.broadcast_message_tasks.trigger_link_test_{route}.send")
+        for route in ["primary_to_A", "primary_to_B", "secondary_to_A", "secondary_to_B"]
+    ]
 
     with set_config(notify_api, "ENABLED_CBCS", {"ee", "vodafone", "o2", "three"}):
         trigger_link_tests()
 
-    assert primary_to_A.call_count == 4
-    assert primary_to_B.call_count == 4
-    assert secondary_to_A.call_count == 4
-    assert secondary_to_B.call_count == 4
-
-    for cbc_name in ["ee", "vodafone", "o2", "three"]:
-        assert call(provider=cbc_name) in primary_to_A.call_args_list
-        assert call(provider=cbc_name) in primary_to_B.call_args_list
-        assert call(provider=cbc_name) in secondary_to_A.call_args_list
-        assert call(provider=cbc_name) in secondary_to_B.call_args_list
-
-
-def test_trigger_link_tests_calls_for_a_single_provider(mocker, notify_api):
-    _ = mocker.patch(
-        "app.tasks.scheduled_tasks.trigger_link_tests",
-    )
-    primary_to_A = mocker.patch("app.tasks.scheduled_tasks.trigger_link_test_primary_to_A.send")
-    primary_to_B = mocker.patch("app.tasks.scheduled_tasks.trigger_link_test_primary_to_B.send")
-    secondary_to_A = mocker.patch("app.tasks.scheduled_tasks.trigger_link_test_secondary_to_A.send")
-    secondary_to_B = mocker.patch("app.tasks.scheduled_tasks.trigger_link_test_secondary_to_B.send")
-
-    with set_config(notify_api, "ENABLED_CBCS", {"ee"}):
-        trigger_link_tests()
-
-    assert len(primary_to_A.call_args_list) == 1
-
-    assert call.apply_async(provider="ee") in primary_to_A.call_args_list
-    assert call.apply_async(provider="ee") in primary_to_B.call_args_list
-    assert call.apply_async(provider="ee") in secondary_to_A.call_args_list
-    assert call.apply_async(provider="ee") in secondary_to_B.call_args_list
-
-    assert call.apply_async(provider="o2") not in primary_to_A.call_args_list
-    assert call.apply_async(provider="three") not in primary_to_B.call_args_list
-    assert call.apply_async(provider="vodafone") not in secondary_to_A.call_args_list
-    assert call.apply_async(provider="o2") not in secondary_to_B.call_args_list
+    mock_run_link_tests.assert_called_once_with()
+    assert not any(task.called for task in per_route_tasks)
 
 
 def test_trigger_link_does_nothing_if_cbc_proxy_disabled(mocker, notify_api):
@@ -206,7 +170,7 @@ def test_queue_after_alert_activities_does_govuk_refresh(notify_api, mocker, fin
         "app.tasks.broadcast_message_tasks.publish_govuk_alerts.send",
     )
     mocker.patch(
-        "app.tasks.scheduled_tasks.dao_get_all_finished_broadcast_messages_with_outstanding_actions",
+        "app.tasks.scheduled_tasks.dao_get_finished_broadcast_message_flags_with_outstanding_actions",
         return_value=[BroadcastMessage(finished_govuk_acknowledged=finished_govuk_acknowledged)],
     )
 
@@ -9,6 +9,8 @@ from app.dao.broadcast_message_dao import (
 )
 from app.dao.service_permissions_dao import dao_remove_service_permission
 from app.models import BROADCAST_TYPE
+from app.v2.broadcast.post_broadcast import _validate_polygons
+from app.v2.errors import ValidationError
 from tests import create_service_authorization_header
 from tests.app.db import create_api_key
 
@@ -755,6 +757,26 @@ def test_too_many_polygons_is_rejected_before_geometry_work(client, sample_broad
     polygons_spy.assert_not_called()
 
 
+def test_too_many_polygons_stops_parsing_at_the_first_polygon_over_the_limit(client, sample_broadcast_service):
+    max_polygons = client.application.config["MAX_BROADCAST_POLYGON_COUNT"]
+
+    square = "0,50 0.1,50 0.1,50.1 0,50"
+    # Not valid CAP after the polygons, which would be reported if the whole document was parsed
+    cap_xml = _cap_xml_with_polygons([square] * (max_polygons * 10)).replace("</alert>", "<unexpected/></alert>")
+
+    auth_header = create_service_authorization_header(service_id=sample_broadcast_service.id)
+    response = client.post(
+        path="/v2/broadcast",
+        data=cap_xml,
+        headers=[("Content-Type", "application/cap+xml"), auth_header],
+    )
+
+    assert response.status_code == 400
+    assert response.json["errors"][0]["message"] == (
+        f"Too many polygons ({max_polygons + 1}); the maximum is {max_polygons}"
+    )
+
+
 def test_too_many_points_is_rejected_before_geometry_work(client, sample_broadcast_service, mocker):
     max_points = client.application.config["MAX_BROADCAST_POLYGON_POINT_COUNT"]
     polygons_spy = mocker.patch("app.v2.broadcast.post_broadcast.Polygons")
@@ -777,9 +799,31 @@ def test_too_many_points_is_rejected_before_geometry_work(client, sample_broadca
     polygons_spy.assert_not_called()
 
 
+def test_polygon_that_is_not_coordinate_pairs_is_described_by_schema_validation(client, sample_broadcast_service):
+    cap_xml = _cap_xml_with_polygons(["0.1,50 0.2,50,1 0.2,50.1 0.1,50"])
+
+    auth_header = create_service_authorization_header(service_id=sample_broadcast_service.id)
+    response = client.post(
+        path="/v2/broadcast",
+        data=cap_xml,
+        headers=[("Content-Type", "application/cap+xml"), auth_header],
+    )
+
+    assert response.status_code == 400
+    assert response.json["errors"] == [
+        {
+            "error": "ValidationError",
+            "message": (
+                "areas [[0.1, 50.0], [0.2, 50.0, 1.0], [0.2, 50.1], [0.1, 50.0]] "
+                "is not valid under any of the given schemas"
+            ),
+        }
+    ]
+
+
 def test_oversized_request_body_is_rejected_with_400(client, sample_broadcast_service, mocker):
-    # A body larger than MAX_BROADCASTS_XML_LENGTH is rejected in validate_xml
-    # before the document is parsed against the schema. Override the limit to a
+    # A body larger than MAX_BROADCASTS_XML_LENGTH is rejected in parse_xml_stream,
+    # from its Content-Length, before any of it is read. Override the limit to a
     # small value so we don't have to allocate a 65MB payload in the test.
     mocker.patch.dict(client.application.config, {"MAX_BROADCASTS_XML_LENGTH": 100})
     max_length = client.application.config["MAX_BROADCASTS_XML_LENGTH"]
@@ -809,3 +853,42 @@ def test_request_for_status_returns_allowed_methods(client, sample_broadcast_ser
     assert "OPTIONS" in response.headers["Allow"]
     assert "POST" in response.headers["Allow"]
     assert response.headers["Content-Length"] == "0"
+
+
+def _square(x, y, size=1):
+    return [[x, y], [x + size, y], [x + size, y + size], [x, y + size], [x, y]]
+
+
+def test_validate_polygons_accepts_many_separate_polygons():
+    assert _validate_polygons([_square(x * 2, y * 2) for x in range(30) for y in range(30)])
+
+
+@pytest.mark.parametrize(
+    "overlapping_square",
+    [
+        _square(58.5, 58.5),  # overlaps the last square in the grid
+        _square(59, 58),  # shares an edge with it
+        _square(58.25, 58.25, size=0.5),  # is enclosed by it
+    ],
+)
+def test_validate_polygons_finds_overlap_among_many_polygons(overlapping_square):
+    polygons = [_square(x * 2, y * 2) for x in range(30) for y in range(30)] + [overlapping_square]
+
+    with pytest.raises(ValidationError) as e:
+        _validate_polygons(polygons)
+
+    assert e.value.message == (
+        "Invalid polygon(s): {'result': 'error', 'message': 'Overlapping areas are not supported.'}"
+    )
+
+
+def test_validate_polygons_reports_first_invalid_polygon():
+    bow_tie = [[10, 0], [11, 1], [11, 0], [10, 1], [10, 0]]
+    other_bow_tie = [[20, 0], [21, 1], [21, 0], [20, 1], [20, 0]]
+
+    with pytest.raises(ValidationError) as e:
+        _validate_polygons([_square(0, 0), bow_tie, other_bow_tie])
+
+    assert e.value.message == (
+        "Invalid polygon(s): {'result': 'error', 'message': 'Invalid polygon: Self-intersection[10.5 0.5]'}"
+    )
@@ -0,0 +1,146 @@
+import threading
+from io import BytesIO
+
+import pytest
+from lxml import etree
+
+from app.xml_schemas import SchemaRegistry, parse_xml_stream
+from tests.app.v2.broadcast.sample_cap_xml_documents import WAINFLEET
+from tests.conftest import set_config
+
+
+@pytest.fixture
+def registry():
+    return SchemaRegistry()
+
+
+def test_valid_document_is_parsed(registry):
+    alert = registry.parse_stream(BytesIO(WAINFLEET.encode()), "CAP-v1.2.xsd", 10_000)
+
+    assert alert.tag == "{urn:oasis:names:tc:emergency:cap:1.2}alert"
+
+
+@pytest.mark.parametrize(
+    "document, expected_exception",
+    [
+        (b"<alert", etree.XMLSyntaxError),
+        (WAINFLEET.replace("<status>Actual</status>", "<status>Real</status>").encode(), etree.DocumentInvalid),
+    ],
+)
+def test_invalid_documents_raise(registry, document, expected_exception):
+    with pytest.raises(expected_exception):
+        registry.parse_stream(BytesIO(document), "CAP-v1.2.xsd", 10_000)
+
+
+def test_schema_is_read_and_compiled_once_per_thread(registry, mocker):
+    read_bytes = mocker.spy(registry._directory.__class__, "read_bytes")
+
+    validator = registry.get_validator("CAP-v1.2.xsd")
+    assert registry.get_validator("CAP-v1.2.xsd") is validator
+    registry.parse_stream(BytesIO(WAINFLEET.encode()), "CAP-v1.2.xsd", 10_000)
+
+    other_thread_validators = []
+    thread = threading.Thread(target=lambda: other_thread_validators.append(registry.get_validator("CAP-v1.2.xsd")))
+    thread.start()
+    thread.join()
+
+    assert other_thread_validators[0] is not validator
+    assert read_bytes.call_count == 1
+
+
+def test_init_app_compiles_every_schema(registry, mocker):
+    mock_timing = mocker.patch("app.xml_schemas.metrics.timing")
+
+    registry.init_app(mocker.Mock())
+
+    assert [call.kwargs["dimensions"] for call in mock_timing.call_args_list] == [{"Schema": "CAP-v1.2.xsd"}]
+    assert mock_timing.call_args.args[0] == "XmlSchemaCompileTime"
+
+
+def test_validation_time_is_recorded(registry, mocker):
+    registry.get_validator("CAP-v1.2.xsd")
+    mock_timing = mocker.patch("app.xml_schemas.metrics.timing")
+
+    with pytest.raises(etree.XMLSyntaxError):
+        registry.parse_stream(BytesIO(b"<alert"), "CAP-v1.2.xsd", 10_000)
+
+    mock_timing.assert_called_once_with("XmlValidationTime", mocker.ANY, dimensions={"Schema": "CAP-v1.2.xsd"})
+
+
+class CountingStream(BytesIO):
+    def __init__(self, document):
+        super().__init__(document)
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        chunk = super().read(size)
+        self.bytes_read += len(chunk)
+        return chunk
+
+
+def test_parse_xml_stream_returns_validated_tree(notify_api):
+    alert, error = parse_xml_stream(BytesIO(WAINFLEET.encode()), "CAP-v1.2.xsd")
+
+    assert error is None
+    assert alert.findtext("{urn:oasis:names:tc:emergency:cap:1.2}status") == "Actual"
+
+
+@pytest.mark.parametrize(
+    "document, expected_error",
+    [
+        (WAINFLEET.replace("<status>Actual</status>", "<status>Real</status>"), "Real"),
+        # Valid as far as it goes, but cut off before </info></alert>
+        (WAINFLEET.rsplit("</info>", 1)[0], "Premature end of data"),
+        ("", "no element found"),
+    ],
+)
+def test_parse_xml_stream_returns_error_for_invalid_document(notify_api, document, expected_error):
+    alert, error = parse_xml_stream(BytesIO(document.encode()), "CAP-v1.2.xsd")
+
+    assert alert is None
+    assert expected_error in error
+
+
+def test_parse_xml_stream_rejects_long_content_length_without_reading(notify_api, mocker):
+    stream = mocker.Mock()
+
+    with set_config(notify_api, "MAX_BROADCASTS_XML_LENGTH", 10):
+        assert parse_xml_stream(stream, "CAP-v1.2.xsd", content_length=11) == (
+            None,
+            "XML must be 10 characters or fewer",
+        )
+
+    stream.read.assert_not_called()
+
+
+def test_parse_xml_stream_stops_reading_long_documents(notify_api):
+    stream = CountingStream(WAINFLEET.encode() * 10)
+
+    with set_config(notify_api, "MAX_BROADCASTS_XML_LENGTH", 100):
+        assert parse_xml_stream(stream, "CAP-v1.2.xsd") == (None, "XML must be 100 characters or fewer")
+
+    assert stream.bytes_read < len(WAINFLEET.encode() * 10)
+
+
+def test_parse_xml_stream_stops_when_on_element_raises(notify_api):
+    polygon = " ".join(["53.1,0.2"] * 10)
+    document = WAINFLEET.replace(
+        "</area>", f"</area><area><areaDesc>a</areaDesc><polygon>{polygon}</polygon></area>" * 1000
+    )
+    stream = CountingStream(document.encode())
+    polygons = []
+
+    def stop_after_two_polygons(polygon):
+        polygons.append(polygon)
+        if len(polygons) == 2:
+            raise ValueError("too many")
+
+    with pytest.raises(ValueError):
+        parse_xml_stream(
+            stream,
+            "CAP-v1.2.xsd",
+            tag="{urn:oasis:names:tc:emergency:cap:1.2}polygon",
+            on_element=stop_after_two_polygons,
+        )
+
+    assert stream.bytes_read < len(document)
@@ -1,6 +1,9 @@
 from contextlib import contextmanager
 
 import flask_sqlalchemy
+from sqlalchemy import event
+
+from app import db
 
 
 @contextmanager
@@ -13,3 +16,21 @@ def count_sqlalchemy_queries():
         return after - before
 
     yield get_query_count
+
+
+@contextmanager
+def count_sqlalchemy_statements():
+    """
+    Returns a callable that counts the number of statements sent to the database since creation. Unlike
+    count_sqlalchemy_queries this doesn't need SQLALCHEMY_RECORD_QUERIES to be turned on.
+    """
+    statements = []
+
+    def record_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", record_statement)
+    try:
+        yield lambda: len(statements)
+    finally:
+        event.remove(db.engine, "before_cursor_execute", record_statement)